@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+'''
+Copyright (c) 2023, FlowSwitch <flowswitch@mail.ru>
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice,
+	this list of conditions and the following disclaimer.
+2. Redistributions in binary form must reproduce the above copyright
+   notice, this list of conditions and the following disclaimer in the
+   documentation and/or other materials provided with the distribution.
+3. The name of the author may not be used to endorse or promote products
+   derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+POSSIBILITY OF SUCH DAMAGE.
+'''
+
+# End-to-end scaling benchmark: runs compress_elf() on synthetic ELFs (elf.synthesize) of growing
+# symbol count, section count and data size, reports wall time and peak traced memory per point
+
+__all__ = ['SWEEPS', 'measure', 'run_sweep', 'main']
+
+import logging
+import math
+import tracemalloc
+from time import perf_counter
+
+import elf
+from comp import ARCHITECTURES, CompressOptions, compress_elf
+from compression import LEVELS
+
+# sweep name -> (synthesize() argument, values), the other arguments stay at BASE
+SWEEPS = {
+	'symbols': ('n_symbols', [16, 64, 256, 1024, 4096, 16384]),
+	'sections': ('n_sections', [1, 4, 16, 64, 256]),
+	'data': ('data_size', [0x1000, 0x4000, 0x10000, 0x40000, 0x100000]),
+}
+BASE = {'data_size': 0x4000, 'n_sections': 4, 'n_symbols': 64}
+BAR_WIDTH = 40
+
+
+def measure(data, arch, options, repeat=1):
+	'''returns: (best wall time of repeat runs, s; peak traced memory of one more run, bytes)'''
+	best = None
+	for _ in range(repeat):
+		start = perf_counter()
+		compress_elf(data, arch, options)
+		elapsed = perf_counter()-start
+		best = elapsed if best is None else min(best, elapsed)
+	tracemalloc.start()
+	try:
+		compress_elf(data, arch, options)
+		peak = tracemalloc.get_traced_memory()[1]
+	finally:
+		tracemalloc.stop()
+	return best, peak
+
+
+def slope(points):
+	'''Least squares exponent k of time ~ x**k over the points, None if there are less than 2'''
+	pts = [(math.log(x), math.log(t)) for x, t in points if x>0 and t>0]
+	if len(pts)<2:
+		return None
+	mx = sum(x for x, t in pts)/len(pts)
+	mt = sum(t for x, t in pts)/len(pts)
+	den = sum((x-mx)**2 for x, t in pts)
+	return sum((x-mx)*(t-mt) for x, t in pts)/den if den else None
+
+
+def run_sweep(name, arch, options, pattern='mixed', repeat=1, limit=None):
+	'''returns: list of (x, time, peak)'''
+	key, values = SWEEPS[name]
+	rows = []
+	for value in values:
+		if limit is not None and key=='data_size' and value>limit:
+			break
+		params = dict(BASE)
+		params[key] = value
+		data = elf.synthesize(pattern=pattern, **params)
+		tm, peak = measure(data, arch, options, repeat)
+		logging.info("%s=%d: %.1f ms, %.1f KiB" % (key, value, tm*1000, peak/1024))
+		rows.append((value, tm, peak))
+	return rows
+
+
+def report(name, rows, file=None):
+	import sys
+	file = file or sys.stdout
+	key = SWEEPS[name][0]
+	print('%s (%s)' % (name, ', '.join('%s=%s' % (k, v) for k, v in BASE.items() if k!=key)), file=file)
+	print('%10s %10s %10s  %s' % (key, 'time, ms', 'peak, KiB', 'time'), file=file)
+	top = max(tm for x, tm, peak in rows) or 1
+	for x, tm, peak in rows:
+		print('%10d %10.1f %10.1f  %s' % (x, tm*1000, peak/1024, '#'*max(1, round(tm/top*BAR_WIDTH))), file=file)
+	k = slope([(x, tm) for x, tm, peak in rows])
+	km = slope([(x, peak) for x, tm, peak in rows])
+	print('time ~ %s^%s, memory ~ %s^%s\n' % (key, 'n/a' if k is None else '%.2f' % k, key, 'n/a' if km is None else '%.2f' % km), file=file)
+	return k
+
+
+def main(argv=None):
+	import argparse
+
+	parser = argparse.ArgumentParser(description='Scaling benchmark of the whole compression pipeline on synthetic ELFs')
+	parser.add_argument('sweeps',
+		nargs='*',
+		metavar='SWEEP',
+		help="Sweeps to run: %s (default: all)" % (', '.join(SWEEPS)))
+	parser.add_argument('-a', '--arch',
+		choices=ARCHITECTURES,
+		default='cortex-m4')
+	parser.add_argument('-l', '--level',
+		choices=LEVELS,
+		default='fast',
+		help="Compression effort (default: %(default)s)")
+	parser.add_argument('-p', '--pattern',
+		choices=elf.PATTERNS,
+		default='mixed',
+		help="Init data kind (default: %(default)s)")
+	parser.add_argument('-r', '--repeat',
+		type=int,
+		default=1,
+		help="Timed runs per point, the best one counts (default: %(default)s)")
+	parser.add_argument('--max-data',
+		type=lambda text: int(text, 0),
+		metavar='BYTES',
+		help="Skip the data sizes above BYTES")
+	parser.add_argument('--max-slope',
+		type=float,
+		metavar='K',
+		help="Fail if the time of any sweep grows faster than x**K")
+	parser.add_argument('--csv',
+		metavar='FILE',
+		help="Also write the measurements to FILE")
+	parser.add_argument('-v', '--verbose',
+		action='count',
+		default=0)
+	args = parser.parse_args(argv)
+	for name in args.sweeps:
+		if name not in SWEEPS:
+			parser.error('unknown sweep '+name)
+	logging.basicConfig(level=logging.INFO if args.verbose else logging.ERROR, format='%(message)s')
+
+	options = CompressOptions(level=args.level)
+	results = {}
+	failed = []
+	for name in args.sweeps or SWEEPS:
+		rows = run_sweep(name, args.arch, options, args.pattern, args.repeat, args.max_data)
+		results[name] = rows
+		k = report(name, rows)
+		if args.max_slope is not None and k is not None and k>args.max_slope:
+			failed.append('%s: time ~ x^%.2f' % (name, k))
+	if args.csv:
+		import csv
+		with open(args.csv, 'w', newline='') as f:
+			writer = csv.writer(f)
+			writer.writerow(['sweep', 'x', 'time_s', 'peak_bytes'])
+			for name, rows in results.items():
+				for x, tm, peak in rows:
+					writer.writerow([name, x, '%.6f' % tm, peak])
+	if failed:
+		return 'Scaling regression: '+'; '.join(failed)
+
+
+if __name__ == '__main__':
+	from sys import exit
+	exit(main())
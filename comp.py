@@ -28,205 +28,1739 @@ ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 POSSIBILITY OF SUCH DAMAGE.
 '''
 
-import argparse
-
-parser = argparse.ArgumentParser(description='Compress ARM ELF data sections')
-parser.add_argument('architecture', choices=('cortex-m0', 'cortex-m0plus', 'cortex-m3', 'cortex-m4', 'cortex-m7'))
-parser.add_argument('infile')
-parser.add_argument('outfile')
-parser.add_argument('-v', '--verbose',
-    action='count',
-	default=0,
-	help="Verbosity level. Add more for more")
-args = parser.parse_args()
+__all__ = ['ARCHITECTURES', 'OPTIMIZE_TARGETS', 'CompressionError', 'CompressOptions', 'ELFCompressor', 'compress_elf', 'compress_elf_targets', 'size_elf', 'main']
 
+# Keep the module-level imports light: the tool is invoked once per build and
+# is also imported as a library, anything heavy goes into the function using it
 import logging
+from bisect import bisect_right
+from math import lcm, prod
+from struct import error as StructError, pack, unpack
+from time import perf_counter
 
-if args.verbose>1:
-	loglevel = logging.DEBUG
-elif args.verbose>0:
-	loglevel = logging.INFO
-else:
-	loglevel = logging.WARNING
+import elf
+from compression import algos, LEVELS
 
-logging.basicConfig(level=loglevel, format='%(message)s')		
 
+ARCHITECTURES = ('cortex-m0', 'cortex-m0plus', 'cortex-m3', 'cortex-m4', 'cortex-m7')
+OPTIMIZE_TARGETS = ('size', 'speed') # decompressor variant selection
+TABLE_FORMATS = ('fixed', 'compact', 'auto') # init table encoding, auto picks the smaller one
 
-from sys import exit
-from struct import pack, unpack
+CHUNK_SIZE = 0x10000 # init data is fed to the compressors in chunks of this size
+SAMPLE_SIZE = 0x1000 # leading bytes of an entry given to algo.suits() to skip hopeless candidates
+LAYOUT_MAX_STATES = 0x40000 # exact .idata layout search limit, a greedy order is used for larger blob sets
+TARGET_OUTPUTS = ('manifest', 'bin_output', 'hex_output', 'profile_output', 'size_output') # per-target file options, {arch} is replaced
+TABLE_COMPACT = 0x80000000 # n_entries flag of the compact init table format
+CACHE_MAGIC = b'DCCH'
+CACHE_VERSION = 1
+IDATA_SIZE_SYMBOL = '__idata_size' # defined by the --size-only linker script fragment
+FLASH_MATCH_MIN = 64 # default --flash-match length, a split costs a table entry and the neighbours' compression context
+FLASH_MATCH_HITS = 8 # flash positions tried per indexed K-gram
+COALESCE_GAP = 32 # default --coalesce gap, RAM bytes initialized in between cost decompression time
+COALESCE_MAX_SIZE = 0x10000 # larger ranges are not merged, a saved table entry is noise there and the trial compression is not
+CALL_CYCLES = 20 # estimated boot cost of a table entry in the startup code loop: loads, call and return
 
-from numpy import add
 
-import elf
-from compression import algos
+class CompressionError(Exception):
+	pass
+
+
+class CompressOptions:
+	'''Compression pipeline settings. Class attributes are the defaults,
+		override them by keyword arguments or from the parsed command line
+	'''
+	manifest = None # path of the JSON run manifest to write, None to skip
+	bin_output = None # path of the raw flash image to write (objcopy -O binary), None to skip
+	hex_output = None # path of the Intel HEX flash image to write (objcopy -O ihex), None to skip
+	gap_fill = 0 # byte value between the load images in bin_output
+	compact = True # relayout the output ELF to drop the file space freed by compression
+	profile = False # time pipeline phases and algo runs, print a hot-spot summary
+	profile_output = None # path of the cProfile .prof dump, implies profile
+	profile_memory = False # trace peak memory per phase with tracemalloc, implies profile
+	level = 'default' # compression effort of the LZ-family algos, one of compression.LEVELS
+	time_budget = None # seconds for the whole compression phase, the best results found so far are used after that
+	cycles = False # run the chosen decompressors in the Thumb emulator, verify their output and count cycles
+	verify = False # decode the written init image with the reference decoders and compare with the original data
+	optimize = 'size' # decompressor variants, one of OPTIMIZE_TARGETS: smallest, or fastest that fit into .idata
+	reference_elfs = () # companion ELFs (paths or contents, i.e. the bootloader) whose builtin decompressors are reused
+	ram_regions = False # also compress the LOAD segments copied from flash to RAM (load address != run address)
+	defer = () # symbol or section names whose init is left to data_init_deferred() at runtime
+	defer_threshold = None # also defer every init range of at least this many bytes
+	size_output = None # sizing pass: write the linker script fragment reserving the exact .idata size here, no output ELF
+	cache = None # path of the compression results cache, read if it exists and rewritten after compressing
+	table_format = 'fixed' # init table encoding, one of TABLE_FORMATS
+	coalesce = None # merge init ranges up to this many bytes apart when it saves .idata bytes and estimated boot cycles
+	flash_match = None # copy the init data found in the read-only flash contents from there, splitting ranges around matches of at least this many bytes
+
+	def __init__(self, **kwargs):
+		for key in kwargs:
+			if not hasattr(CompressOptions, key):
+				raise TypeError('Unknown compression option '+key)
+			setattr(self, key, kwargs[key])
+
+	@classmethod
+	def from_args(cls, args):
+		opts = cls()
+		for key, value in vars(args).items():
+			if hasattr(cls, key):
+				setattr(opts, key, value)
+		return opts
 
 
 class CompressedData:
-	def __init__(self, algo, src, dst: int, size: int) -> None:
+	def __init__(self, algo, src, dst: int, size: int, candidates=None) -> None:
 		self.algo = algo
 		self.src = src
 		self.dst = dst
 		self.size = size
+		self.candidates = candidates or {} # algo name -> (payload size, decompressor cost) or None if n/a
+		self.address = None # payload address inside .idata, set by build_image()
+		self.cycles = None # emulated decompression cycles, set by measure_cycles()
+		self.deferred = False # listed in the deferred table, unpacked by the app after boot
+		self.flash = False # copied from identical read-only flash contents at src
+		self.call = None # (function address, (r0, r1, r2)) as the startup code reads them from the table, set by build_image()
 
 
 class DecompressorInstance:
-	def __init__(self, image=b'', address=None, align=1, pack_params=lambda src, dst, size : pack('<III', src, dst, size)):
+	def __init__(self, image=b'', address=None, align=1, pack_params=lambda src, dst, size : pack('<III', src, dst, size), symbol=None):
 		self.image = image
 		self.address = address
 		self.pack_params = pack_params
 		self.align = align
+		self.symbol = symbol # builtin function name if the app code provides the decompressor
+		self.variants = {} # variant name -> image, empty for builtins
+		self.speeds = {} # variant name -> declared relative speed
+		self.variant = None
+		self.load = 0 # bytes to be decompressed by this function
+		self.reference = None # name of the reference ELF providing the builtin, None for the app code
+
+	def select(self, variant):
+		self.variant = variant
+		self.image = self.variants[variant]
 
 
 class DecompressorManager:
-	def __init__(self, binary):
+	def __init__(self, binary, optimize='size', references=()):
+		'''param: references - list of (name, ELF) whose builtins are called at their absolute addresses'''
 		self.binary = binary
+		self.optimize = optimize
+		self.references = references
 		self.decompressors = {}
-		self.image = b''
+		self.padding = 0 # alignment padding in front of the decompressors, set by the .idata layout
+		self.builtins = {} # algo name -> (alias, symbol, reference name) or None, looked up once
+
+	def find_builtin(self, algo):
+		'''Look for the algo's decompressor in the app code first, then in the reference ELFs'''
+		if algo.name not in self.builtins:
+			self.builtins[algo.name] = None
+			for fn_name in algo.decompressor_aliases:
+				sym = self.binary.find_symbol(fn_name)
+				if sym:
+					self.builtins[algo.name] = (fn_name, sym, None)
+					break
+			else:
+				for ref_name, ref in self.references:
+					for fn_name in algo.decompressor_aliases:
+						sym = ref.find_symbol(fn_name)
+						if sym and sym.shndx and sym.value: # only a definition gives an address to call
+							self.builtins[algo.name] = (fn_name, sym, ref_name)
+							break
+					if self.builtins[algo.name]:
+						break
+		return self.builtins[algo.name]
 
 	def GetDecompressorCost(self, algo):
 		if algo.name in self.decompressors:
 			return 0 # already "paid"
-		for fn_name in algo.decompressor_aliases:
-			sym = self.binary.find_symbol(fn_name)
-			if sym:
-				return 0 # in the app code already
-		else:
-			return len(algo.get_decompressor())
+		if self.find_builtin(algo):
+			return 0 # in the app code already
+		return algo.get_decompressor_blob().size
 
-	def add(self, algo):
+	def add(self, algo, size=0):
 		if algo.name in self.decompressors:
+			self.decompressors[algo.name].load += size
 			return
 		decomp = DecompressorInstance()
-		for fn_name in algo.decompressor_aliases:
-			sym = self.binary.find_symbol(fn_name)
-			if sym:
-				decomp.address = sym.value
-				decomp.pack_params = algo.decompressor_aliases[fn_name]
-				logging.debug('Found builtin func '+fn_name+' at '+hex(sym.value)+' for algo '+algo.name)
-				break
+		decomp.load = size
+		if builtin:=self.find_builtin(algo):
+			fn_name, sym, decomp.reference = builtin
+			decomp.address = sym.value
+			decomp.pack_params = algo.decompressor_aliases[fn_name]
+			decomp.symbol = fn_name
+			logging.debug('Found builtin func '+fn_name+' at '+hex(sym.value)+' for algo '+algo.name+(' in '+decomp.reference if decomp.reference else ''))
 		else:
-			decomp.image = algo.get_decompressor()
+			decomp.variants = algo.get_decompressor_variants()
+			decomp.speeds = algo.decompressor_variants
+			decomp.select('size')
 			decomp.align = algo.get_decompressor_align()
 		self.decompressors[algo.name] = decomp			
-		
-	def build(self, address):
-		self.image = b''
-		for decomp in self.decompressors:
-			if not self.decompressors[decomp].address:
-				if misalign:=(address % self.decompressors[decomp].align):
-					align = self.decompressors[decomp].align-misalign
-					address += align
-					self.image += b'\0'*align
-				self.decompressors[decomp].address = address
-				self.image += self.decompressors[decomp].image
-				address += len(self.decompressors[decomp].image)
-		return self.image
+
+	def select_variants(self, budget=None):
+		'''Pick the decompressor variants for the optimization target.
+			For speed, the functions with the most bytes to decompress get their fastest variant first,
+			as long as the code still fits into budget bytes
+		'''
+		blobs = [decomp for decomp in self.decompressors.values() if decomp.variants]
+		for decomp in blobs:
+			decomp.select(min(decomp.variants, key=lambda variant: (len(decomp.variants[variant]), -decomp.speeds[variant])))
+		if self.optimize!='speed':
+			return
+		used = sum(len(decomp.image)+decomp.align-1 for decomp in blobs)
+		for name, decomp in sorted(self.decompressors.items(), key=lambda item: item[1].load, reverse=True):
+			if not decomp.variants:
+				continue
+			for variant in sorted(decomp.variants, key=lambda variant: decomp.speeds[variant], reverse=True):
+				if decomp.speeds[variant]<=decomp.speeds[decomp.variant]:
+					break
+				extra = len(decomp.variants[variant])-len(decomp.image)
+				if budget is None or used+extra<=budget:
+					logging.debug("Using %s decompressor variant for %s (+%d bytes)" % (variant, name, extra))
+					used += extra
+					decomp.select(variant)
+					break
+
+	def build(self, budget=None):
+		'''Select the decompressor variants
+			param: budget - bytes available for the decompressors, None if unlimited
+			returns: list of DecompressorInstance to be placed into .idata, the app code provides the rest
+		'''
+		self.select_variants(budget)
+		return [decomp for decomp in self.decompressors.values() if decomp.symbol is None]
 
 	def make_table_entry(self, algo, src, dst, size):
 		return self.decompressors[algo.name].pack_params(src, dst, size)+pack('<I', self.decompressors[algo.name].address)
 
+	def make_table(self, entries):
+		'''Fixed init table: dd n_entries, {dd param0, dd param1, dd param2, dd pfn}[n_entries]'''
+		tbl = pack('<I', len(entries))
+		for entry in entries:
+			tbl += self.make_table_entry(entry.algo, entry.src if isinstance(entry.src, int) else entry.address, entry.dst, entry.size)
+		return tbl
+
+	def param_order(self, algo_name):
+		'''The decompressor's packed params as compact table slot codes: 0 src, 1 dst, 2 size, 3 zero
+			returns: list of 3 codes, None if pack_params does more than reorder them
+		'''
+		orders = []
+		for src, dst, size in ((0x11111111, 0x22222222, 0x33333333), (0x44444444, 0x55555555, 0x66666666)):
+			codes = {src: 0, dst: 1, size: 2, 0: 3}
+			words = unpack('<3I', self.decompressors[algo_name].pack_params(src, dst, size))
+			if any(word not in codes for word in words):
+				return None
+			orders.append([codes[word] for word in words])
+		return orders[0] if orders[0]==orders[1] else None
+
+	def make_compact_table(self, entries, addr):
+		'''Compact init table placed at addr:
+			dd n_entries | TABLE_COMPACT, dd n_funcs, dd pfn[n_funcs], db order[n_funcs] (param slot codes, 2 bits each),
+			then per entry: db function index, bit 7 set if src is given as is (fill value, flash address) instead of
+			a zigzag varint delta to the previous payload address (the table address at first);
+			zigzag varint dst delta to the end of the previous entry (0 at first); varint size.
+			Padded to a word boundary
+		'''
+		names = list(dict.fromkeys(entry.algo.name for entry in entries))
+		if len(names)>0x7F:
+			raise CompressionError('Too many decompressors for the compact table format')
+		tbl = pack('<II', len(entries) | TABLE_COMPACT, len(names))
+		tbl += b''.join(pack('<I', self.decompressors[name].address) for name in names)
+		for name in names:
+			order = self.param_order(name)
+			if order is None:
+				raise CompressionError('The %s decompressor params can\'t be given by the compact table format' % name)
+			tbl += bytes([order[0] | order[1]<<2 | order[2]<<4])
+		prev_src = addr
+		prev_end = 0
+		for entry in entries:
+			head = names.index(entry.algo.name)
+			if isinstance(entry.src, int):
+				tbl += bytes([head | 0x80])+varint(entry.src)
+			else:
+				tbl += bytes([head])+varint(zigzag(entry.address-prev_src))
+				prev_src = entry.address
+			tbl += varint(zigzag(entry.dst-prev_end))+varint(entry.size)
+			prev_end = entry.dst+entry.size
+		return tbl+bytes(-len(tbl) % 4)
+
+	def unpack_params(self, algo_name, params):
+		'''Inverse of pack_params: (r0, r1, r2) of a table entry -> (src, dst, size), None if pack_params does more than reorder them'''
+		order = self.param_order(algo_name)
+		if order is None:
+			return None
+		values = [0, 0, 0, 0]
+		for code, value in zip(order, params):
+			values[code] = value
+		return tuple(values[:3])
+
+	def compact_possible(self, entries):
+		return all(self.param_order(entry.algo.name) is not None for entry in entries)
+
+
+def varint(value):
+	'''LEB128: 7 bits per byte, least significant first, bit 7 set on all but the last byte'''
+	out = bytearray()
+	while value>0x7F:
+		out.append(value & 0x7F | 0x80)
+		value >>= 7
+	out.append(value)
+	return bytes(out)
+
+
+def zigzag(delta):
+	'''32-bit signed delta to varint friendly 0, -1, 1, -2... -> 0, 1, 2, 3...'''
+	delta = (delta+0x80000000) % 0x100000000-0x80000000
+	return delta*2 if delta>=0 else -delta*2-1
+
+
+def unzigzag(value):
+	return value>>1 ^ -(value & 1)
+
+
+def read_load_image(regions, addr, size):
+	'''size bytes at load address addr of the (load address, bytes) regions'''
+	starts = [start for start, data in regions]
+	idx = bisect_right(starts, addr)-1
+	if idx<0 or addr+size>regions[idx][0]+len(regions[idx][1]):
+		raise IndexError("Read @%X[%X] is outside the read-only flash contents" % (addr, size))
+	start, data = regions[idx]
+	return data[addr-start:addr-start+size]
+
+
+def parse_init_table(data, addr):
+	'''Walk an init table of either format the way the startup code does
+		param: data - bytes from the table start on, addr - the table address
+		returns: list of (function address, (r0, r1, r2))
+	'''
+	n_entries = unpack('<I', data[:4])[0]
+	if not n_entries & TABLE_COMPACT:
+		return [(pfn, tuple(params)) for *params, pfn in (unpack('<4I', data[4+idx*16:20+idx*16]) for idx in range(n_entries))]
+	n_entries &= ~TABLE_COMPACT
+	n_funcs = unpack('<I', data[4:8])[0]
+	pfns = unpack('<%dI' % n_funcs, data[8:8+n_funcs*4])
+	pos = 8+n_funcs*4
+	orders = data[pos:pos+n_funcs]
+	pos += n_funcs
+
+	def read():
+		nonlocal pos
+		value = shift = 0
+		while True:
+			byte = data[pos]
+			pos += 1
+			value |= (byte & 0x7F)<<shift
+			shift += 7
+			if not byte & 0x80:
+				return value
+
+	calls = []
+	prev_src = addr
+	end = 0
+	for _ in range(n_entries):
+		head = data[pos]
+		pos += 1
+		if head & 0x80:
+			src = read()
+		else:
+			src = prev_src = (prev_src+unzigzag(read())) & 0xFFFFFFFF
+		dst = end = (end+unzigzag(read())) & 0xFFFFFFFF
+		size = read()
+		end += size
+		values = (src, dst, size, 0)
+		order = orders[head & 0x7F]
+		calls.append((pfns[head & 0x7F], tuple(values[order>>shift & 3] for shift in (0, 2, 4))))
+	return calls
+
+
+def plan_layout(address, blobs, max_states=LAYOUT_MAX_STATES):
+	'''Order blobs placed one after another from address so that each one starts at an address
+		equal to its phase modulo its alignment, with the least total padding
+		param: blobs - list of (size, align, phase)
+		returns: (list of blob addresses, list of padding bytes in front of each blob), both in the blobs order
+	'''
+	def place(order):
+		addresses = [None]*len(blobs)
+		pads = [0]*len(blobs)
+		addr = address
+		for idx in order:
+			size, align, phase = blobs[idx]
+			pads[idx] = (phase-addr) % align
+			addresses[idx] = addr+pads[idx]
+			addr = addresses[idx]+size
+		return addresses, pads
+
+	best = place(range(len(blobs)))
+	if not sum(best[1]):
+		return best # keep the given order if it is perfect already
+
+	# padding depends only on the address modulo the common period,
+	# so blobs with the same (align, phase, size mod period) are interchangeable
+	period = lcm(*[align for size, align, phase in blobs])
+	classes = {}
+	for idx, (size, align, phase) in enumerate(blobs):
+		classes.setdefault((align, phase % align, size % period), []).append(idx)
+	keys = list(classes)
+	counts = tuple(len(classes[key]) for key in keys)
+
+	if prod(count+1 for count in counts)*period<=max_states and len(blobs)<=256:
+		memo = {}
+		def search(left, mod):
+			'''returns: least padding to place the blobs counted in left starting at mod'''
+			if not any(left):
+				return 0
+			state = (left, mod)
+			if state not in memo:
+				result = None
+				for k, (align, phase, size) in enumerate(keys):
+					if not left[k]:
+						continue
+					pad = (phase-mod) % align
+					total = pad+search(left[:k]+(left[k]-1,)+left[k+1:], (mod+pad+size) % period)
+					if result is None or total<result[0]:
+						result = (total, k)
+				memo[state] = result
+			return memo[state][0]
+
+		left = counts
+		mod = address % period
+		taken = [0]*len(keys)
+		order = []
+		search(left, mod)
+		while any(left):
+			k = memo[(left, mod)][1]
+			align, phase, size = keys[k]
+			order.append(classes[keys[k]][taken[k]])
+			taken[k] += 1
+			mod = (mod+(phase-mod) % align+size) % period
+			left = left[:k]+(left[k]-1,)+left[k+1:]
+	else:
+		# greedy: the blob needing the least padding next, larger alignment first on ties
+		remaining = list(range(len(blobs)))
+		order = []
+		addr = address
+		while remaining:
+			idx = min(remaining, key=lambda idx: ((blobs[idx][2]-addr) % blobs[idx][1], -blobs[idx][1]))
+			remaining.remove(idx)
+			order.append(idx)
+			addr += (blobs[idx][2]-addr) % blobs[idx][1]+blobs[idx][0]
+
+	candidate = place(order)
+	return candidate if sum(candidate[1])<sum(best[1]) else best
+
+
+class ResultsCache:
+	'''Compression results of the init ranges kept between runs, i.e. from the sizing pass for the final link.
+		Keyed by a hash of the range address, size, contents and compression level, so the ranges left unchanged
+		by relinking are found; the payloads don't depend on the arch.
+		Written by a different version of the tool (other sources or decompressor images), the file is ignored
+	'''
+	def __init__(self, entries=None):
+		self.entries = entries or {} # key -> {algo name: payload bytes, src int or None if n/a}
+
+	@staticmethod
+	def fingerprint():
+		'''Identifies the compressor: the contents of comp.py, the compression package sources and the decompressor images'''
+		import os.path
+		from glob import glob
+		from hashlib import sha256
+		from compression.registry import get_registry
+
+		root = os.path.dirname(os.path.realpath(__file__))
+		h = sha256()
+		for path in sorted([os.path.join(root, 'comp.py')]+glob(os.path.join(root, 'compression', '**', '*.py'), recursive=True)):
+			with open(path, 'rb') as f:
+				h.update(os.path.relpath(path, root).encode()+b'\0'+sha256(f.read()).digest())
+		for info in get_registry().describe():
+			h.update(('%(algo)s %(arch)s %(variant)s %(sha256)s;' % info).encode())
+		return h.hexdigest()
+
+	@staticmethod
+	def key(level, dst, size, read):
+		'''param: read - callable(address, size) giving the range contents'''
+		from hashlib import sha256
+
+		h = sha256(pack('<II', dst, size)+level.encode())
+		for pos in range(0, size, CHUNK_SIZE):
+			h.update(read(dst+pos, min(CHUNK_SIZE, size-pos)))
+		return h.hexdigest()
+
+	@classmethod
+	def load(cls, path):
+		'''returns: ResultsCache, empty if the file is missing, malformed or stale'''
+		import json
+
+		try:
+			with open(path, 'rb') as f:
+				data = f.read()
+		except FileNotFoundError:
+			return cls()
+		if data[:4]!=CACHE_MAGIC or len(data)<12:
+			logging.warning('Ignoring %s: not a compression results cache' % path)
+			return cls()
+		version, header_size = unpack('<II', data[4:12])
+		header = json.loads(data[12:12+header_size]) if version==CACHE_VERSION else None
+		if not header or header['fingerprint']!=cls.fingerprint():
+			logging.info('Ignoring %s: written by another version of the tool' % path)
+			return cls()
+		offset = 12+header_size
+		entries = {}
+		for key, results in header['entries'].items():
+			entries[key] = {}
+			for name, value in results.items():
+				if isinstance(value, list): # [payload size]
+					entries[key][name] = data[offset:offset+value[0]]
+					offset += value[0]
+				else:
+					entries[key][name] = value
+		return cls(entries)
+
+	def save(self, path):
+		'''Layout: magic, u32 version, u32 header size, JSON header (fingerprint, payload sizes or src values per key and algo),
+			payloads in header order
+		'''
+		import json
+
+		header = {}
+		payloads = []
+		for key, results in self.entries.items():
+			header[key] = {}
+			for name, value in results.items():
+				if isinstance(value, bytes):
+					header[key][name] = [len(value)]
+					payloads.append(value)
+				else:
+					header[key][name] = value
+		header = json.dumps({'fingerprint': self.fingerprint(), 'entries': header}).encode()
+		with open(path, 'wb') as f:
+			f.write(CACHE_MAGIC+pack('<II', CACHE_VERSION, len(header))+header+b''.join(payloads))
+
+
+def common_prefix(a, a_pos, b, b_pos):
+	'''returns: number of equal bytes of a and b starting at a_pos and b_pos'''
+	limit = min(len(a)-a_pos, len(b)-b_pos)
+	n = 0
+	while n+256<=limit and a[a_pos+n:a_pos+n+256]==b[b_pos+n:b_pos+n+256]:
+		n += 256
+	while n<limit and a[a_pos+n]==b[b_pos+n]:
+		n += 1
+	return n
+
+
+def uniform(data):
+	'''Single byte value, zero and fill store it for free'''
+	return not data or data.count(data[0])==len(data)
+
+
+class FlashIndex:
+	'''Substring index of the read-only flash contents. K-grams are sampled every step bytes,
+		so every match of at least min_match bytes covers one of them completely
+	'''
+	def __init__(self, regions, min_match):
+		'''param: regions - list of (load address, bytes)'''
+		self.regions = regions
+		self.min_match = max(min_match, 8)
+		self.k = min(32, self.min_match//2)
+		self.step = self.min_match-self.k+1
+		self.grams = {} # K-gram -> [(region index, offset)]
+		for n, (addr, data) in enumerate(regions):
+			for pos in range(0, len(data)-self.k+1, self.step):
+				gram = data[pos:pos+self.k]
+				if not uniform(gram):
+					self.grams.setdefault(gram, []).append((n, pos))
+
+	def find_whole(self, data, dst):
+		'''returns: load address of a copy of data, one at the same address mod 4 as dst preferred, None if not found'''
+		found = None
+		for addr, region in self.regions:
+			pos = region.find(data)
+			while pos>=0:
+				if (addr+pos-dst) & 3==0:
+					return addr+pos
+				if found is None:
+					found = addr+pos
+				pos = region.find(data, pos+1)
+		return found
+
+	def match_at(self, data, pos, start):
+		'''returns: longest (offset, size, load address) covering the K-gram at data[pos], not reaching back before start'''
+		k = self.k
+		best = None
+		for n, flash_pos in self.grams.get(data[pos:pos+k], ())[:FLASH_MATCH_HITS]:
+			addr, region = self.regions[n]
+			back = 0
+			while pos-back>start and flash_pos-back>0 and data[pos-back-1]==region[flash_pos-back-1]:
+				back += 1
+			size = back+k+common_prefix(data, pos+k, region, flash_pos+k)
+			if best is None or size>best[1]:
+				best = (pos-back, size, addr+flash_pos-back)
+		return best
+
+	def find(self, data):
+		'''returns: list of (offset, size, load address) - non-overlapping pieces of data of at least min_match bytes
+			found in the flash contents, in data order
+		'''
+		last = len(data)-self.k
+		matches = []
+		start = 0 # end of the previous match
+		pos = 0
+		while pos<=last:
+			best = self.match_at(data, pos, start)
+			if best and best[1]>=self.min_match:
+				# periodic data may hit a shifted copy first, the K-grams of the next step bytes find the longest one
+				for ahead in range(pos+1, min(pos+self.step, last+1)):
+					match = self.match_at(data, ahead, start)
+					if match and match[1]>best[1]:
+						best = match
+				if not uniform(data[best[0]:best[0]+best[1]]):
+					matches.append(best)
+					start = pos = best[0]+best[1]
+					continue
+			pos += 1
+		return matches
+
+
+class Profiler:
+	'''Hot-spot accounting for --profile. Only instantiated when profiling is requested,
+		the pipeline checks for None instead of calling into a no-op object
+	'''
+	def __init__(self, prof_file=None, memory=False):
+		self.prof_file = prof_file
+		self.memory = memory
+		self.stats = {} # key -> [calls, total time]
+		self.peaks = {} # phase -> peak traced memory, bytes
+		self.cprofile = None
+
+	@classmethod
+	def from_options(cls, options):
+		if not (options.profile or options.profile_output or options.profile_memory):
+			return None
+		return cls(options.profile_output, options.profile_memory)
+
+	def start(self):
+		if self.memory:
+			import tracemalloc
+			tracemalloc.start()
+		if self.prof_file:
+			import cProfile
+			self.cprofile = cProfile.Profile()
+			self.cprofile.enable()
+
+	def stop(self):
+		if self.cprofile:
+			self.cprofile.disable()
+			self.cprofile.dump_stats(self.prof_file)
+			self.cprofile = None
+		if self.memory:
+			import tracemalloc
+			tracemalloc.stop()
+
+	def call(self, key, func, *args, **kwargs):
+		start = perf_counter()
+		try:
+			return func(*args, **kwargs)
+		finally:
+			stat = self.stats.setdefault(key, [0, 0])
+			stat[0] += 1
+			stat[1] += perf_counter()-start
+
+	def phase(self, key, func, *args, **kwargs):
+		if not self.memory:
+			return self.call(key, func, *args, **kwargs)
+		import tracemalloc
+		tracemalloc.reset_peak()
+		base = tracemalloc.get_traced_memory()[0]
+		try:
+			return self.call(key, func, *args, **kwargs)
+		finally:
+			self.peaks[key] = max(self.peaks.get(key, 0), tracemalloc.get_traced_memory()[1]-base)
+
+	def wrap(self, key, func):
+		return lambda *args, **kwargs: self.call(key, func, *args, **kwargs)
+
+	def report(self, file=None):
+		import sys
+		file = file or sys.stderr
+		total = sum(stat[1] for key, stat in self.stats.items() if key.startswith('phase.')) or 1
+		print('%-32s %8s %10s %10s %6s' % ('hot spot', 'calls', 'total, ms', 'avg, ms', '%'), file=file)
+		for key, (calls, tm) in sorted(self.stats.items(), key=lambda item: item[1][1], reverse=True):
+			print('%-32s %8d %10.2f %10.3f %6.1f' % (key, calls, tm*1000, tm*1000/calls, tm*100/total), file=file)
+		if self.peaks:
+			print('%-32s %10s' % ('phase', 'peak, KiB'), file=file)
+			for key, peak in sorted(self.peaks.items(), key=lambda item: item[1], reverse=True):
+				print('%-32s %10.1f' % (key, peak/1024), file=file)
+		if self.prof_file:
+			print('cProfile data saved to '+self.prof_file, file=file)
+
+
+class ELFCompressor:
+	'''Compresses the data/bss init ranges listed in __data_init_table of a writable ELF in place'''
+	def __init__(self, arch, options=None):
+		if arch not in ARCHITECTURES:
+			raise CompressionError('Unsupported architecture '+str(arch))
+		self.arch = arch
+		self.options = options or CompressOptions()
+		if self.options.optimize not in OPTIMIZE_TARGETS:
+			raise CompressionError('Unknown optimization target '+str(self.options.optimize))
+		self.binary = None
+		self.references = [] # (name, ELF) of options.reference_elfs
+		self.dm = None
+		self.timings = {} # phase name -> wall time, s
+		self.keep_results = False # fill self.results for the next target's run
+		self.results = None # (dst, size) -> {algo name: payload, None if n/a} of every algo tried, the planning estimates included
+		self.cache = None # results of a run on the same input for another arch or of the cache file, reused instead of compressing again
+		self.previous = None # ELFCompressor of the previous target, its choices are kept where the decompressor changes don't matter
+		self.flash_pieces = {} # (dst, size) -> pieces found by find_flash_matches(), shared by the targets
+		self.decoded = {} # (algo name, payload, size) -> reference decoder output verify_image() checked, shared by the targets
+		self.sizing = bool(self.options.size_output) # only find the .idata size needed, don't write the image
+		self.idata_required = None # bytes of .idata the init image needs, set by build_image()
+		self.profiler = Profiler.from_options(self.options)
 
-binary = elf.ELF.from_file(args.infile, readonly=False)
-if binary.header.bitness!=32:
-	exit('Unsupported ELF bitness %d' % (binary.bitness))
-
-table_sym = binary.find_symbol('__data_init_table')
-if not table_sym:
-	exit('ERROR: No __data_init_table symbol found. Please check your .ld script.')
-table_p = table_sym.value
-logging.debug('__data_init_table: '+hex(table_p))
-if table_p & 3:
-	exit('table_p is not aligned to 4 !')
-
-idata = binary.sections[table_sym.shndx]
-logging.debug('.idata: '+hex(idata.addr)+' ['+hex(idata.size)+']')
-if table_p!=(idata.addr):
-	exit('.idata section doesn\'t start at table_p !')
-
-n_entries = unpack('<I', binary.read_from_va(table_p, 4))[0]
-logging.info(str(n_entries)+' sections to initialize')
-
-logging.info("Compressing sections...")
-dm = DecompressorManager(binary)
-srcdata = [None] * n_entries
-out_n_entries = 0
-for idx in range(n_entries):
-	src, dst, size, pfn = unpack('<4I', binary.read_from_va(table_p+4+idx*16, 16))
-	logging.debug("%2d: %08X -> %08X [%08X]" % (idx, src, dst, size))
-	if not size:
-		continue
-	out_n_entries += 1
-	best_size = 0xFFFFFFFF
-	best_algo = None
-	best_data = b''
-	raw_data = binary.read_from_va(dst, size)
-	for algo in algos:
-		logging.debug("\tTrying "+algo.name)
-		comper = algo(args.architecture)
-		comp_data = comper.compress(raw_data)
+	def timed(self, phase, func, *args, **kwargs):
+		start = perf_counter()
+		if self.profiler:
+			result = self.profiler.phase('phase.'+phase, func, *args, **kwargs)
+		else:
+			result = func(*args, **kwargs)
+		self.timings[phase] = self.timings.get(phase, 0)+perf_counter()-start
+		return result
+
+	def load(self, data):
+		self.binary = self.timed('parse', elf.ELF, data, readonly=False)
+		if self.profiler:
+			self.binary.find_symbol = self.profiler.wrap('find_symbol', self.binary.find_symbol)
+			self.binary.read_from_va = self.profiler.wrap('read_from_va', self.binary.read_from_va)
+		self.references = []
+		for idx, ref in enumerate(self.options.reference_elfs or ()):
+			if isinstance(ref, str):
+				name = ref
+				with open(ref, 'rb') as f:
+					ref = f.read()
+			else:
+				name = 'reference #%d' % idx
+			self.references.append((name, self.timed('parse', elf.ELF, ref)))
+		self.dm = DecompressorManager(self.binary, self.options.optimize, self.references)
+
+	def pack(self):
+		return bytes(self.timed('pack', self.binary.pack, self.options.compact))
+
+	def run(self):
+		self.timed('read_table', self.read_table)
+		if self.options.cache:
+			self.timed('cache', self.load_cache)
+		self.timed('compress', self.compress_entries)
+		if self.options.cache:
+			self.timed('cache', self.save_cache)
+		self.timed('build', self.build_image)
+		if self.sizing:
+			if self.options.size_output:
+				self.write_size_fragment(self.options.size_output)
+			return
+		if self.options.verify:
+			self.timed('verify', self.verify_image)
+		if self.options.cycles:
+			self.timed('cycles', self.measure_cycles)
+		# only after the verification and emulator runs, which compare the decompressed data with the load images
+		self.release_ram_segments()
+
+	def read_table(self):
+		binary = self.binary
+		if binary.header.bitness!=32:
+			raise CompressionError('Unsupported ELF bitness %d' % (binary.header.bitness))
+
+		table_sym = binary.find_symbol('__data_init_table')
+		if not table_sym:
+			raise CompressionError('ERROR: No __data_init_table symbol found. Please check your .ld script.')
+		self.table_p = table_sym.value
+		logging.debug('__data_init_table: '+hex(self.table_p))
+		if self.table_p & 3:
+			raise CompressionError('table_p is not aligned to 4 !')
+
+		self.idata = binary.sections[table_sym.shndx]
+		logging.debug('.idata: '+hex(self.idata.addr)+' ['+hex(self.idata.size)+']')
+		if self.table_p!=(self.idata.addr):
+			raise CompressionError('.idata section doesn\'t start at table_p !')
+
+		self.n_entries = unpack('<I', binary.read_from_va(self.table_p, 4))[0]
+		logging.info(str(self.n_entries)+' sections to initialize')
+		self.ranges = [] # (dst, size) to initialize: the table entries, then the RAM regions found in the segments
+		for idx in range(self.n_entries):
+			src, dst, size, pfn = unpack('<4I', binary.read_from_va(self.table_p+4+idx*16, 16))
+			logging.debug("%2d: %08X -> %08X [%08X]" % (idx, src, dst, size))
+			self.ranges.append((dst, size))
+		self.ram_segments = []
+		if self.options.ram_regions:
+			self.find_ram_regions()
+		self.deferred = set() # indices of the deferred ranges
+		if self.options.defer or self.options.defer_threshold is not None:
+			self.split_deferred()
+		self.coalesced = [] # (dst, size) of the ranges and gaps merged by coalesce_ranges(), see read_init()
+		self.planned = {} # (dst, size) -> {algo name: payload} compressed while planning, reused by compress_entries()
+		if self.options.coalesce is not None:
+			self.coalesce_ranges()
+		self.flash_src = {} # range index -> load address of the same bytes in the read-only flash contents
+		if self.options.flash_match is not None:
+			self.find_flash_matches()
+
+	def find_ram_regions(self):
+		'''Add the LOAD segments with load address != run address (.ramfunc, ITCM code, DTCM tables...)
+			to the init ranges unless the table covers them already. Their copy loop in the startup code must be dropped
+		'''
+		for seg in self.binary.segments:
+			if seg.typ!=elf.segment.PT.LOAD or not seg.filesz or seg.paddr==seg.vaddr:
+				continue
+			start, end = seg.vaddr, seg.vaddr+seg.filesz
+			if start<=self.table_p<end or any(dst<end and start<dst+size for dst, size in self.ranges if size):
+				logging.debug("Segment %08X [%08X] is initialized already" % (seg.vaddr, seg.filesz))
+				continue
+			logging.info("RAM region %08X [%08X] loaded from %08X" % (seg.vaddr, seg.filesz, seg.paddr))
+			self.ranges.append((seg.vaddr, seg.filesz))
+			self.ram_segments.append(seg)
+
+	def split_deferred(self):
+		'''Cut the symbols and sections named in options.defer out of the init ranges as deferred ranges,
+			defer the ranges of at least options.defer_threshold bytes as well
+		'''
+		binary = self.binary
+		cuts = []
+		for name in self.options.defer or ():
+			sym = binary.find_symbol(name)
+			if sym and sym.shndx and sym.size:
+				cuts.append((sym.value, sym.value+sym.size))
+				continue
+			sct = binary.find_section_by_name(name)
+			if sct and sct.size:
+				cuts.append((sct.addr, sct.addr+sct.size))
+				continue
+			raise CompressionError('ERROR: No symbol or section '+name+' to defer')
+		threshold = self.options.defer_threshold
+		ranges = []
+		for dst, size in self.ranges:
+			pieces = [(dst, dst+size, False)]
+			for start, end in cuts:
+				split = []
+				for lo, hi, deferred in pieces:
+					if deferred or end<=lo or hi<=start:
+						split.append((lo, hi, deferred))
+						continue
+					if lo<start:
+						split.append((lo, start, False))
+					split.append((max(lo, start), min(hi, end), True))
+					if end<hi:
+						split.append((end, hi, False))
+				pieces = split
+			for lo, hi, deferred in pieces:
+				if deferred or (threshold is not None and hi>lo and hi-lo>=threshold):
+					logging.debug("Deferring %08X [%08X]" % (lo, hi-lo))
+					self.deferred.add(len(ranges))
+				ranges.append((lo, hi-lo))
+		self.ranges = ranges
+
+	def read_init(self, va, size):
+		'''Init data at va[size]. A coalesced range may span several sections or segments and the gaps between them,
+			gap bytes outside the image read as zeros
+		'''
+		try:
+			return self.binary.read_from_va(va, size)
+		except IndexError:
+			if not self.coalesced:
+				raise
+		out = bytearray(size)
+		for start, length in self.coalesced:
+			lo, hi = max(va, start), min(va+size, start+length)
+			if lo<hi:
+				try:
+					out[lo-va:hi-va] = self.binary.read_from_va(lo, hi-lo)
+				except IndexError:
+					pass
+		return bytes(out)
+
+	def estimate(self, dst, size):
+		'''Algo the selection picks for dst[size] on its own: the smallest payload and decompressor,
+			the payloads are kept for compress_entries()
+			returns: (algo, payload bytes, estimated decompression cycles)
+		'''
+		results = self.planned.get((dst, size))
+		if results is None: # the previous target's run may have compressed this range already
+			results = self.planned[(dst, size)] = dict(self.cache.get((dst, size), {})) if self.cache else {}
+		sample = self.read_init(dst, min(size, SAMPLE_SIZE))
+		best = None
+		for algo in algos:
+			comper = algo(self.arch, self.options.level)
+			if algo.name not in results:
+				results[algo.name] = self.try_algo(comper, dst, size, sample)
+			comp_data = results[algo.name]
+			if comp_data is None:
+				continue
+			payload = 0 if isinstance(comp_data, int) else len(comp_data)
+			key = (payload+self.dm.GetDecompressorCost(comper), size*algo.decode_cycles)
+			if best is None or key<best[0]:
+				best = (key, (comper, payload, key[1]))
+		if best is None:
+			raise CompressionError("Can't compress !")
+		return best[1]
+
+	def estimate_bytes(self, *estimates):
+		'''.idata bytes of the estimated entries: table entries, payloads and each decompressor once'''
+		algos_used = {comper.name: comper for comper, payload, cycles in estimates}
+		return 16*len(estimates)+sum(payload for comper, payload, cycles in estimates)+ \
+			sum(self.dm.GetDecompressorCost(comper) for comper in algos_used.values())
+
+	def gap_free(self, start, end):
+		'''No section lives in RAM start..end, it may be overwritten'''
+		return not any(sct.flags & elf.section.SHF.ALLOC and sct.size and sct.addr<end and start<sct.addr+sct.size
+			for sct in self.binary.sections)
+
+	def coalesce_ranges(self):
+		'''Merge the init ranges at most options.coalesce bytes apart in RAM into one stream, the gap is initialized
+			with its current contents. A merge is kept only if it saves both the .idata bytes (payload and the 16-byte
+			table entry) and the estimated boot cycles (CALL_CYCLES against the bytes decompressed more slowly)
+		'''
+		logging.info("Coalescing ranges...")
+		self.coalesced = [(dst, size) for dst, size in self.ranges if size]
+		groups = [] # [dst, end, estimate, range indices]
+		for dst, idx in sorted((dst, idx) for idx, (dst, size) in enumerate(self.ranges) if size):
+			size = self.ranges[idx][1]
+			cost = self.estimate(dst, size)
+			group = groups[-1] if groups else None
+			if group and 0<=dst-group[1]<=self.options.coalesce and dst+size-group[0]<=COALESCE_MAX_SIZE \
+					and (group[3][0] in self.deferred)==(idx in self.deferred) and self.gap_free(group[1], dst):
+				gap = (group[1], dst-group[1])
+				self.coalesced.append(gap)
+				merged = self.estimate(group[0], dst+size-group[0])
+				if self.estimate_bytes(merged)<self.estimate_bytes(group[2], cost) and merged[2]<group[2][2]+cost[2]+CALL_CYCLES:
+					logging.debug("Coalescing %08X [%08X] with %08X [%08X]" % (group[0], group[1]-group[0], dst, size))
+					group[1] = dst+size
+					group[2] = merged
+					group[3].append(idx)
+					continue
+				self.coalesced.remove(gap)
+			groups.append([dst, dst+size, cost, [idx]])
+		merged = {min(group[3]): group for group in groups}
+		members = {idx for group in groups for idx in group[3]}
+		ranges = []
+		deferred = set()
+		for idx, (dst, size) in enumerate(self.ranges):
+			if idx in merged:
+				dst, end = merged[idx][:2]
+				size = end-dst
+			elif idx in members:
+				continue
+			if idx in self.deferred:
+				deferred.add(len(ranges))
+			ranges.append((dst, size))
+		logging.info("%d init ranges coalesced into %d" % (len(self.ranges), len(ranges)))
+		self.ranges = ranges
+		self.deferred = deferred
+
+	def flash_regions(self):
+		'''Contents of the output flash image that stay as they are: (load address, bytes) of the read-only loadable
+			sections except .idata and the deferred table pointer, which are rewritten
+		'''
+		binary = self.binary
+		rewritten = [(self.idata.addr, self.idata.addr+self.idata.size)]
+		deferred_sym = binary.find_symbol('__data_init_table_deferred')
+		if deferred_sym:
+			rewritten.append((deferred_sym.value, deferred_sym.value+4))
+		regions = []
+		for seg in binary.segments:
+			if seg.typ!=elf.segment.PT.LOAD or not seg.filesz or seg.flags & elf.segment.PF.W or seg in self.ram_segments:
+				continue
+			for sct in binary.sections:
+				if sct.typ!=elf.section.SHT.PROGBITS or not sct.flags & elf.section.SHF.ALLOC or sct.flags & elf.section.SHF.WRITE:
+					continue
+				if not sct.size or sct.addr<seg.vaddr or sct.addr+sct.size>seg.vaddr+seg.filesz:
+					continue
+				pieces = [(sct.addr, sct.addr+sct.size)]
+				for cut_start, cut_end in rewritten:
+					pieces = [piece for lo, hi in pieces for piece in ((lo, min(hi, cut_start)), (max(lo, cut_end), hi)) if piece[0]<piece[1]]
+				for lo, hi in pieces:
+					regions.append((seg.paddr+lo-seg.vaddr, bytes(sct.payload[lo-sct.addr:hi-sct.addr])))
+		return regions
+
+	def find_flash_matches(self):
+		'''Find the init data already present in the read-only flash contents (const tables, strings, default configs).
+			A range found whole is copied from there, ranges are split around the pieces of at least options.flash_match bytes.
+		The flash contents don't depend on the arch, the pieces found for the previous target are reused
+		'''
+		index = None
+		ranges = []
+		deferred = set()
+		for idx, (dst, size) in enumerate(self.ranges):
+			pieces = self.flash_pieces.get((dst, size))
+			if pieces is None:
+				data = self.read_init(dst, size) if size else b''
+				pieces = [] # (offset, size, load address or None)
+				if not uniform(data):
+					if index is None:
+						index = FlashIndex(self.flash_regions(), self.options.flash_match)
+					src = index.find_whole(data, dst)
+					if src is not None:
+						pieces.append((0, size, src))
+					else:
+						offset = 0
+						for start, length, src in index.find(data):
+							if offset<start:
+								pieces.append((offset, start-offset, None))
+							pieces.append((start, length, src))
+							offset = start+length
+						if pieces and offset<size:
+							pieces.append((offset, size-offset, None))
+				self.flash_pieces[(dst, size)] = pieces
+			for start, length, src in pieces or [(0, size, None)]:
+				if src is not None:
+					logging.debug("%08X [%08X] found in flash at %08X" % (dst+start, length, src))
+					self.flash_src[len(ranges)] = src
+				if idx in self.deferred:
+					deferred.add(len(ranges))
+				ranges.append((dst+start, length))
+		logging.info("%d init ranges found in flash" % len(self.flash_src))
+		self.ranges = ranges
+		self.deferred = deferred
+
+	def release_ram_segments(self):
+		'''Drop the load images of the RAM regions compressed into .idata'''
+		binary = self.binary
+		for seg in self.ram_segments:
+			for sct in binary.sections:
+				if sct.typ==elf.section.SHT.PROGBITS and sct.size and seg.vaddr<=sct.addr and sct.addr+sct.size<=seg.vaddr+seg.filesz:
+					sct.typ = elf.section.SHT.NOBITS
+			seg.filesz = 0
+
+	def load_cache(self):
+		'''Look the init ranges up in the options.cache file, the ones found there are not compressed again'''
+		results = ResultsCache.load(self.options.cache)
+		read = self.read_init
+		self.cache_keys = [ResultsCache.key(self.options.level, dst, size, read) if size else None for dst, size in self.ranges]
+		self.keep_results = True
+		if self.cache is None: # not given by the previous target already
+			self.cache = {rng: results.entries[key] for key, rng in zip(self.cache_keys, self.ranges) if key in results.entries}
+			logging.info("%d of %d ranges found in %s" % (len(self.cache), len(self.ranges), self.options.cache))
+
+	def save_cache(self):
+		ResultsCache({key: self.results.get(rng, {}) for key, rng in zip(self.cache_keys, self.ranges) if key}).save(self.options.cache)
+
+	def previous_choices(self):
+		'''Algo choices of the previous target's run that this one would repeat
+			returns: dict (dst, size) -> (CompressedData, names of the algos whose decompressor was placed before it)
+				of the entries whose candidates all keep their decompressor cost, or had it paid already
+		'''
+		previous = self.previous
+		if not previous or previous.srcdata is None:
+			return {}
+		affected = set() # algos with another decompressor size, set of variants or dst alignment on this arch
+		for algo in algos:
+			old, new = algo(previous.arch), algo(self.arch)
+			if self.dm.find_builtin(new):
+				continue # called at the same address for every target
+			if old.get_dst_align()!=new.get_dst_align():
+				return {}
+			if {variant: len(image) for variant, image in old.get_decompressor_variants().items()}!= \
+					{variant: len(image) for variant, image in new.get_decompressor_variants().items()}:
+				affected.add(algo.name)
+		logging.debug("Decompressors changed from %s: %s" % (previous.arch, ', '.join(sorted(affected)) or 'none'))
+		choices = {}
+		placed = set()
+		for entry in previous.srcdata:
+			if not entry:
+				continue
+			# a candidate's decompressor size counts only until the first entry choosing the algo places it
+			if not any(name in affected and name not in placed for name in entry.candidates):
+				choices[(entry.dst, entry.size)] = (entry, frozenset(placed))
+			placed.add(entry.algo.name)
+		return choices
+
+	def compress_entries(self):
+		logging.info("Compressing sections...")
+		binary = self.binary
+		dm = self.dm
+		self.srcdata = [None] * len(self.ranges)
+		cache = self.cache or {}
+		if self.keep_results:
+			# carry the cached and planned payloads over, the next target may need the ones this run didn't get to
+			self.results = {key: dict(tried) for key, tried in cache.items()}
+			for key, tried in self.planned.items():
+				self.results.setdefault(key, {}).update(tried)
+		self.out_n_entries = 0
+		deadline = None
+		if self.options.time_budget is not None:
+			deadline = perf_counter()+self.options.time_budget
+		# out of a time budget, the previous target may have stopped short of a better candidate this one finds
+		choices = self.previous_choices() if deadline is None else {}
+		self.kept = 0 # entries with the previous target's choice
+		for idx, (dst, size) in enumerate(self.ranges):
+			if not size:
+				continue
+			self.out_n_entries += 1
+			best_size = 0xFFFFFFFF
+			best_algo = None
+			best_data = b''
+			candidates = {}
+			tried = self.results.setdefault((dst, size), {}) if self.results is not None else {}
+			cached = dict(cache.get((dst, size), {}), **self.planned.get((dst, size), {}))
+			flash_src = self.flash_src.get(idx)
+			sample = None
+			prev, placed = choices.get((dst, size), (None, None))
+			# copy from flash is the only candidate depending on the flash contents, its payload is empty
+			copy = prev.candidates.get('copy') if prev else None
+			if prev and ('copy' not in prev.candidates or (copy is not None and copy[0]==0)==(flash_src is not None)) \
+					and (not prev.flash or prev.src==flash_src) \
+					and all((name in placed)==(name in dm.decompressors) for name in prev.candidates):
+				# the same candidates at the same costs, the selection would come to the same choice
+				best_algo = prev.algo.__class__(self.arch, self.options.level)
+				best_data = prev.src
+				best_size = sum(prev.candidates[best_algo.name])
+				candidates = dict(prev.candidates)
+				self.kept += 1
+			else:
+				for algo in algos:
+					if deadline is not None and best_algo is not None and perf_counter()>deadline:
+						logging.debug("\tOut of time budget, keeping "+best_algo.name)
+						break
+					logging.debug("\tTrying "+algo.name)
+					comper = algo(self.arch, self.options.level)
+					comper.deadline = deadline
+					from_flash = flash_src is not None and algo.name=='copy'
+					if from_flash:
+						comp_data = flash_src # not cached, only valid for this flash image
+					elif algo.name in cached: # the payloads don't depend on the arch, only the decompressor costs do
+						comp_data = cached[algo.name]
+					else:
+						if sample is None:
+							sample = self.read_init(dst, min(size, SAMPLE_SIZE))
+						comp_data = self.try_algo(comper, dst, size, sample)
+					if not from_flash:
+						tried[algo.name] = comp_data
+					if comp_data is None:
+						candidates[algo.name] = None
+						continue
+					if isinstance(comp_data, int): # this algo doesn't produce any data, only the src int value
+						comp_size = 0
+					else:
+						comp_size = len(comp_data)
+					dc_size = dm.GetDecompressorCost(comper)
+					sz = comp_size+dc_size
+					logging.debug("\t\t%X -> %X+%X=%X" % (size, comp_size, dc_size, sz))
+					candidates[algo.name] = (comp_size, dc_size)
+					if sz<best_size:
+						best_size = sz
+						best_algo = comper
+						best_data = comp_data
+					if sz==0: # nothing can be better
+						break
+			if best_algo is None:
+				raise CompressionError("Can't compress !")
+			logging.debug("\tBest algo: %s (%X -> %X)" % (best_algo.name, size, best_size))
+			dm.add(best_algo, size)
+			self.srcdata[idx] = CompressedData(best_algo, best_data, dst, size, candidates)
+			self.srcdata[idx].deferred = idx in self.deferred
+			self.srcdata[idx].flash = best_algo.name=='copy' and flash_src is not None
+			sct = binary.find_section_by_va(dst)
+			# Mark section to be excluded from objcopy bin/hex generation
+			if sct and sct.typ==elf.section.SHT.PROGBITS:
+				binary.sections[sct.index].typ = elf.section.SHT.NOBITS
+			if self.coalesced and (not sct or dst+size>sct.addr+sct.size): # the sections merged into this range as well
+				for sct in binary.sections:
+					if sct.typ==elf.section.SHT.PROGBITS and sct.flags & elf.section.SHF.ALLOC and dst<sct.addr<dst+size:
+						sct.typ = elf.section.SHT.NOBITS
+
+	def try_algo(self, comper, dst, size, sample):
+		'''returns: the algo's payload for dst[size] (bytes or src int), None if it was skipped or can't compress the data'''
+		if dst % comper.get_dst_align() or not comper.suits(sample):
+			logging.debug("\t\tskipped")
+			return None
+		if self.profiler:
+			comp_data = self.profiler.call('compress.'+comper.name, self.compress_range, comper, dst, size)
+		else:
+			comp_data = self.compress_range(comper, dst, size)
 		if comp_data is None: # this algo can't compress this kind of data
 			logging.debug("\t\tn/a")
-			continue
-		if isinstance(comp_data, int): # this algo doesn't produce any data, only the src int value
-			comp_size = 0
-		else:
-			comp_size = len(comp_data)
-		dc_size = dm.GetDecompressorCost(comper)
-		sz = comp_size+dc_size
-		logging.debug("\t\t%X -> %X+%X=%X" % (len(raw_data), comp_size, dc_size, sz))
-		if sz<best_size:
-			best_size = sz
-			best_algo = comper
-			best_data = comp_data
-		if sz==0: # nothing can be better
-			break
-	if best_algo is None:
-		exit("Can't compress !")
-	logging.debug("\tBest algo: %s (%X -> %X)" % (best_algo.name, len(raw_data), best_size))
-	dm.add(best_algo)
-	srcdata[idx] = CompressedData(best_algo, best_data, dst, size)
-	sct = binary.find_section_by_va(dst)
-	# Mark section to be excluded from objcopy bin/hex generation
-	if sct.typ==elf.section.SHT.PROGBITS:
-		binary.sections[sct.index].typ = elf.section.SHT.NOBITS
-
-fn_addr = table_p+4+out_n_entries*16
-decomp_code = dm.build(fn_addr)
-data_addr = fn_addr+len(decomp_code)
-
-logging.info("Building .idata...")
-# __table_p:
-# dd n_entries
-# table {dd src, dd dst, dd size, dd pfn }[2]
-# unp[]
-# clr[]
-# comp_data[]
-tbl = pack('<I', out_n_entries)
-comp_data = b''
-for idx in range(n_entries):
-	if not srcdata[idx]:
-		continue
-	if isinstance(srcdata[idx].src, int):
-		src = srcdata[idx].src
-		src_size = 0
+		return comp_data
+
+	def compress_range(self, comper, dst, size):
+		'''Feed the init data at dst[size] to the algo's stream compressor in CHUNK_SIZE pieces,
+			instead of reading the whole range once per algo. The payload is collected in memory:
+			the layout is planned when all of them are known. Algos without a bounded state
+			(lzhuff) buffer the whole range in their compressor
+		'''
+		stream = comper.compressor()
+		out = bytearray()
+		for pos in range(0, size, CHUNK_SIZE):
+			out += stream.feed(self.read_init(dst+pos, min(CHUNK_SIZE, size-pos)))
+		tail = stream.flush()
+		if tail is None or isinstance(tail, int):
+			return tail
+		out += tail
+		return bytes(out)
+
+	def build_image(self):
+		dm = self.dm
+		entries = [entry for entry in self.srcdata if entry]
+		payloads = [entry for entry in entries if not isinstance(entry.src, int)]
+		boot = [entry for entry in entries if not entry.deferred]
+		deferred = [entry for entry in entries if entry.deferred]
+		tables = [boot, deferred] if deferred else [boot]
+		deferred_sym = self.binary.find_symbol('__data_init_table_deferred')
+		if deferred and not deferred_sym:
+			raise CompressionError('ERROR: No __data_init_table_deferred symbol found for the deferred entries. Please check your .ld script.')
+		if deferred_sym and self.table_p<=deferred_sym.value<self.table_p+self.idata.size:
+			raise CompressionError('ERROR: __data_init_table_deferred must be placed outside .idata')
+		table_format = self.options.table_format
+		if table_format not in TABLE_FORMATS:
+			raise CompressionError('Unknown table format '+str(table_format))
+		compact = [table_format!='fixed' for table in tables]
+		if any(compact) and not dm.compact_possible(entries):
+			if table_format=='compact':
+				raise CompressionError('ERROR: The decompressor params can\'t be given by the compact table format')
+			compact = [False for table in tables]
+		# worst case payload alignment, the rest of .idata may be spent on faster decompressors
+		payload_size = sum(len(entry.src)+max(entry.algo.get_payload_align(variant, entry.dst)[0] for variant in entry.algo.decompressor_variants)-1
+			for entry in payloads)
+
+		logging.info("Building .idata...")
+		# __table_p:
+		# boot table (fixed or compact, see DecompressorManager.make_table/make_compact_table)
+		# deferred_table_p (if any entries are deferred, __data_init_table_deferred points here):
+		# deferred table
+		# decompressors and payloads, ordered for the least alignment padding.
+		# A compact table depends on the payload addresses: it is laid out with the fixed table size first,
+		# then with its encoded size until the encoding fits the space left for it
+		sizes = [4+16*len(table) for table in tables]
+		first = True
+		while True:
+			fn_addr = self.table_p+sum(sizes)
+			decomps = dm.build(None if self.sizing else self.table_p+self.idata.size-fn_addr-payload_size)
+			blobs = [(len(decomp.image), decomp.align, 0) for decomp in decomps]
+			for entry in payloads:
+				align, phase = entry.algo.get_payload_align(dm.decompressors[entry.algo.name].variant, entry.dst)
+				blobs.append((len(entry.src), align, phase))
+			addresses, pads = plan_layout(fn_addr, blobs)
+			for decomp, addr in zip(decomps, addresses):
+				decomp.address = addr
+			for entry, addr in zip(payloads, addresses[len(decomps):]):
+				entry.address = addr
+			encoded = []
+			addr = self.table_p
+			for table, size, is_compact in zip(tables, sizes, compact):
+				encoded.append(dm.make_compact_table(table, addr) if is_compact else dm.make_table(table))
+				addr += size
+			if first:
+				first = False
+				if table_format=='auto':
+					compact = [is_compact and len(tbl)<size for tbl, size, is_compact in zip(encoded, sizes, compact)]
+				if any(compact):
+					sizes = [len(tbl) if is_compact else size for tbl, size, is_compact in zip(encoded, sizes, compact)]
+					continue
+			if all(len(tbl)<=size for tbl, size in zip(encoded, sizes)):
+				break
+			sizes = [max(len(tbl), size) for tbl, size in zip(encoded, sizes)]
+		self.table_formats = ['compact' if is_compact else 'fixed' for is_compact in compact]
+		self.deferred_table_p = self.table_p+sizes[0] if deferred else None
+		end = max([addr+blob[0] for addr, blob in zip(addresses, blobs)], default=fn_addr)
+		dm.padding = sum(pads[:len(decomps)])
+		self.payload_padding = sum(pads[len(decomps):])
+		self.idata_required = end-self.table_p
+		if self.options.optimize=='speed':
+			# the final pass picks the same variants only if its budget above covers them
+			self.idata_required = max(self.idata_required, fn_addr-self.table_p+payload_size+sum(len(decomp.image)+decomp.align-1 for decomp in decomps))
+		if self.sizing:
+			logging.info(".idata requires %X bytes" % self.idata_required)
+			self.idata_available = self.idata.size
+			return
+		if end-self.table_p>self.idata.size:
+			raise CompressionError("ERROR: Can't fit the resulting init image of size %X into .idata section of size %X" % (end-self.table_p, self.idata.size))
+
+		image = bytearray(end-self.table_p)
+		offset = 0
+		for table, tbl, size in zip(tables, encoded, sizes):
+			image[offset:offset+len(tbl)] = tbl
+			for entry, call in zip(table, parse_init_table(bytes(image[offset:offset+len(tbl)]), self.table_p+offset)):
+				entry.call = call
+			offset += size
+		for blob, addr in zip([decomp.image for decomp in decomps]+[entry.src for entry in payloads], addresses):
+			image[addr-self.table_p:addr-self.table_p+len(blob)] = blob
+		self.binary.write_to_va(self.table_p, image)
+		if deferred_sym:
+			self.binary.write_to_va(deferred_sym.value, pack('<I', self.deferred_table_p or 0))
+
+		logging.info("Shrinking .idata...")
+		self.idata_available = self.idata.size
+		self.idata.size = len(image)
+
+	def write_size_fragment(self, path):
+		'''Linker script fragment for the final link, the .ld script reserves IDATA_SIZE_SYMBOL bytes for .idata'''
+		with open(path, 'w') as f:
+			f.write("/* .idata size for %s, generated by comp.py --size-only */\n" % self.arch)
+			f.write("%s = 0x%X;\n" % (IDATA_SIZE_SYMBOL, self.idata_required))
+
+	def verify_image(self):
+		'''Rebuild the init ranges from the written .idata the way the startup code does: walk the tables, decode every
+			payload with the reference decoder of the algo whose decompressor the entry calls, compare with the original data
+		'''
+		logging.info("Verifying the init image...")
+		binary = self.binary
+		image = memoryview(binary.read_from_va(self.table_p, self.idata.size))
+		entries = [entry for entry in self.srcdata if entry]
+		index = {id(entry): idx for idx, entry in enumerate(self.srcdata) if entry}
+		tables = [(self.table_p, [entry for entry in entries if not entry.deferred])]
+		deferred = [entry for entry in entries if entry.deferred]
+		if deferred:
+			tables.append((unpack('<I', binary.read_from_va(binary.find_symbol('__data_init_table_deferred').value, 4))[0], deferred))
+		# RAM is not initialized at reset, fill the destinations with garbage to catch unwritten bytes
+		ram = []
+		for start, end in sorted((entry.dst, entry.dst+entry.size) for entry in entries):
+			if ram and start<=ram[-1][1]:
+				ram[-1][1] = max(ram[-1][1], end)
+			else:
+				ram.append([start, end])
+		starts = [start for start, end in ram]
+		ram = [(start, bytearray(b'\xA5'*(end-start))) for start, end in ram]
+
+		def find_ram(addr):
+			return ram[max(bisect_right(starts, addr)-1, 0)]
+
+		skipped = set()
+		flash = None
+		decoded = {}
+		for addr, table in tables:
+			if not self.table_p<=addr<self.table_p+len(image):
+				raise CompressionError("ERROR: Init table at %X is outside .idata" % addr)
+			calls = parse_init_table(image[addr-self.table_p:], addr)
+			if len(calls)!=len(table):
+				raise CompressionError("ERROR: Init table at %X lists %d entries instead of %d" % (addr, len(calls), len(table)))
+			for entry, (pfn, params) in zip(table, calls):
+				idx = index[id(entry)]
+				algo = entry.algo
+				if pfn!=self.dm.decompressors[algo.name].address:
+					raise CompressionError("ERROR: Entry %d calls %X instead of the %s decompressor" % (idx, pfn, algo.name))
+				params = self.dm.unpack_params(algo.name, params)
+				if params is None:
+					logging.warning("%2d: can't verify, the %s decompressor params are not known" % (idx, algo.name))
+					skipped.add(idx)
+					continue
+				src, dst, size = params
+				key = None
+				try:
+					if isinstance(entry.src, int) and not entry.flash:
+						out = algo.decompress(src, size) # the src value is the data
+					elif self.table_p<=src<self.table_p+len(image):
+						payload = image[src-self.table_p:]
+						# a payload verified for an earlier target isn't decoded again
+						key = (algo.name, entry.src, size)
+						if payload[:len(entry.src)]!=entry.src:
+							key = None
+						out = self.decoded.get(key)
+						if out is None:
+							out = algo.decompress(payload, size)
+					else:
+						# copied from the flash contents by their load address, not where they run from
+						if flash is None:
+							flash = sorted(self.flash_regions())
+						out = algo.decompress(read_load_image(flash, src, size), size)
+				except (ValueError, IndexError, StructError) as e:
+					raise CompressionError("ERROR: Can't decode the %s payload of entry %d at %X: %s" % (algo.name, idx, src, e))
+				start, mem = find_ram(dst)
+				if not start<=dst<=dst+len(out)<=start+len(mem):
+					raise CompressionError("ERROR: Entry %d writes %X..%X outside the init ranges" % (idx, dst, dst+len(out)))
+				mem[dst-start:dst-start+len(out)] = out
+				if key:
+					decoded[key] = out
+		for entry in entries:
+			idx = index[id(entry)]
+			if idx in skipped:
+				continue
+			start, mem = find_ram(entry.dst)
+			if mem[entry.dst-start:entry.dst-start+entry.size]!=self.read_init(entry.dst, entry.size):
+				raise CompressionError("ERROR: The init image reproduces entry %d at %X (%s) wrongly" % (idx, entry.dst, entry.algo.name))
+		self.decoded.update(decoded)
+		logging.info("%d entries verified" % (len(entries)-len(skipped)))
+
+	def measure_cycles(self):
+		'''Run every entry's decompressor in the Thumb emulator against the final image the way the startup code does,
+			check it reproduces the original data and record its cycle count
+		'''
+		import emulator # only needed for cycle measurement
+
+		logging.info("Measuring decompression cycles...")
+		binary = self.binary
+		entries = [(idx, entry) for idx, entry in enumerate(self.srcdata) if entry]
+		# RAM is not initialized at reset, fill the destinations with garbage to catch unwritten bytes
+		ranges = []
+		for start, end in sorted((entry.dst, entry.dst+entry.size) for idx, entry in entries):
+			if ranges and start<=ranges[-1][1]:
+				ranges[-1][1] = max(ranges[-1][1], end)
+			else:
+				ranges.append([start, end])
+		mem = emulator.Memory()
+		for start, end in ranges:
+			mem.map(start, b'\xA5'*(end-start), writable=True, name='init')
+		# flash and the RAM sections left out of the init table as the final image has them
+		for sct in binary.sections:
+			if not sct.flags & elf.section.SHF.ALLOC or not sct.has_data() or not sct.size:
+				continue
+			try:
+				mem.map(sct.addr, sct.payload[:sct.size], writable=bool(sct.flags & elf.section.SHF.WRITE), name=sct.name)
+			except emulator.EmulatorError as e:
+				logging.debug("Section %s is not mapped: %s" % (sct.name, e))
+		# the flash matches are copied from the load address of read-only sections that run from another one
+		for addr, data in self.flash_regions():
+			if mem.find(addr):
+				continue # runs from where it is loaded
+			try:
+				mem.map(addr, data, writable=False, name='load image')
+			except emulator.EmulatorError as e:
+				logging.debug("Load image at %X is not mapped: %s" % (addr, e))
+		# code of the reference ELFs for the builtins found there, their RAM belongs to the app now
+		for ref_name, ref in self.references:
+			for sct in ref.sections:
+				if not sct.flags & elf.section.SHF.ALLOC or sct.flags & elf.section.SHF.WRITE or not sct.has_data() or not sct.size:
+					continue
+				try:
+					mem.map(sct.addr, sct.payload[:sct.size], writable=False, name=sct.name)
+				except emulator.EmulatorError as e:
+					logging.debug("Section %s of %s is not mapped: %s" % (sct.name, ref_name, e))
+		cpu = emulator.ThumbCPU(self.arch, mem)
+		for idx, entry in entries:
+			pfn, args = entry.call # decoded from the written table, checks its encoding as well
+			try:
+				entry.cycles = emulator.run_function(cpu, pfn, args)
+			except emulator.EmulatorError as e:
+				logging.warning("%2d: can't emulate the %s decompressor: %s" % (idx, entry.algo.name, e))
+				continue
+			if mem.read_bytes(entry.dst, entry.size)!=self.read_init(entry.dst, entry.size):
+				raise CompressionError("ERROR: %s decompressor output of entry %d at %X differs from the original data" % (entry.algo.name, idx, entry.dst))
+			logging.debug("%2d: %d cycles" % (idx, entry.cycles))
+
+	def report_cycles(self, file=None):
+		import sys
+		file = file or sys.stderr
+		print('%-5s %-8s %8s %-9s %10s %6s' % ('entry', 'dst', 'size', 'algo', 'cycles', '/byte'), file=file)
+		total = 0
+		for idx, entry in enumerate(self.srcdata):
+			if not entry:
+				continue
+			if entry.cycles is None:
+				print('%5d %08X %8X %-9s %10s %6s' % (idx, entry.dst, entry.size, entry.algo.name, 'n/a', ''), file=file)
+				continue
+			total += entry.cycles
+			print('%5d %08X %8X %-9s %10d %6.2f' % (idx, entry.dst, entry.size, entry.algo.name, entry.cycles, entry.cycles/entry.size), file=file)
+		print('total %s cycles on %s' % (total, self.arch), file=file)
+
+	def manifest(self):
+		'''Machine-readable run summary, see README for the format'''
+		entries = []
+		for idx, entry in enumerate(self.srcdata):
+			if not entry:
+				continue
+			entries.append({
+				'index': idx,
+				'dst': entry.dst,
+				'size': entry.size,
+				'algo': entry.algo.name,
+				'src': entry.address if entry.address is not None else entry.src,
+				'compressed_size': 0 if isinstance(entry.src, int) else len(entry.src),
+				'cycles': entry.cycles,
+				'deferred': entry.deferred,
+				'flash': entry.flash,
+				'candidates': {name: None if cand is None else {'size': cand[0], 'decompressor_cost': cand[1]}
+					for name, cand in entry.candidates.items()},
+			})
+		decompressors = {}
+		for name, decomp in self.dm.decompressors.items():
+			decompressors[name] = {
+				'address': decomp.address,
+				'size': len(decomp.image),
+				'align': decomp.align,
+				'builtin': decomp.symbol,
+				'reference': decomp.reference,
+				'variant': decomp.variant,
+			}
+		return {
+			'arch': self.arch,
+			'table': self.table_p,
+			'deferred_table': self.deferred_table_p,
+			'table_format': self.table_formats,
+			'entries': entries,
+			'decompressors': decompressors,
+			'padding': {'decompressors': self.dm.padding, 'payloads': self.payload_padding},
+			'idata': {'used': self.idata.size, 'available': self.idata_available, 'required': self.idata_required},
+			'timings': self.timings,
+		}
+
+	def write_flash_images(self):
+		'''Stream the bin/hex flash images straight from the processed ELF'''
+		if self.options.bin_output:
+			with open(self.options.bin_output, 'wb') as f:
+				base = elf.write_bin(self.binary, f, self.options.gap_fill)
+			logging.info("Flash image written to %s at %s" % (self.options.bin_output, 'n/a' if base is None else hex(base)))
+		if self.options.hex_output:
+			with open(self.options.hex_output, 'wb') as f:
+				elf.write_hex(self.binary, f)
+
+	def write_manifest(self, path):
+		import json
+
+		with open(path, 'w') as f:
+			json.dump(self.manifest(), f, indent=1)
+
+
+def run_compressor(compressor, data: bytes) -> bytes:
+	'''Run the whole pipeline of a configured ELFCompressor on the input ELF file contents, write the optional outputs'''
+	profiler = compressor.profiler
+	if profiler:
+		profiler.start()
+	try:
+		compressor.load(data)
+		compressor.run()
+		out = None
+		if not compressor.sizing:
+			if compressor.options.bin_output or compressor.options.hex_output:
+				compressor.timed('flash', compressor.write_flash_images)
+			out = compressor.pack()
+	finally:
+		if profiler:
+			profiler.stop()
+	if compressor.options.manifest:
+		compressor.write_manifest(compressor.options.manifest)
+	if profiler:
+		profiler.report()
+	if compressor.options.cycles:
+		compressor.report_cycles()
+	return compressor.idata_required if compressor.sizing else out
+
+
+def compress_elf(data: bytes, arch: str, options: CompressOptions=None) -> bytes:
+	'''Compress the init data of an ELF image
+		param: data - input ELF file contents
+		param: arch - target architecture, one of ARCHITECTURES
+		param: options - CompressOptions, defaults are used if None
+		returns: bytes - output ELF file contents, int - .idata bytes needed for the sizing pass (options.size_output)
+		raises: CompressionError, elf.ELFError
+	'''
+	return run_compressor(ELFCompressor(arch, options), data)
+
+
+def size_elf(data: bytes, arch: str, options: CompressOptions=None) -> int:
+	'''Sizing pass on the prelinked ELF image: the .idata size the init image needs,
+		the table, decompressors, payloads and alignment padding included
+		param: options - CompressOptions, options.size_output names the linker script fragment to write if set
+		returns: int - bytes
+		raises: CompressionError, elf.ELFError
+	'''
+	compressor = ELFCompressor(arch, options)
+	compressor.sizing = True
+	return run_compressor(compressor, data)
+
+
+def target_options(options: CompressOptions, arch: str) -> CompressOptions:
+	'''Copy of options with {arch} in the output file names replaced by arch'''
+	opts = CompressOptions(**vars(options))
+	for key in TARGET_OUTPUTS:
+		path = getattr(options, key)
+		if path:
+			setattr(opts, key, path.replace('{arch}', arch))
+	return opts
+
+
+def compress_elf_targets(data: bytes, archs, options: CompressOptions=None) -> dict:
+	'''Compress the init data of an ELF image once and build the output for several architectures.
+		The payloads, coalescing trials and flash matches don't depend on the arch. Every target after the first one
+		keeps the previous algo choices whose candidates have the same decompressor costs and alignment, repeats the
+		selection for the rest with its own decompressor sizes (compressing on demand what the earlier runs didn't try)
+		and lays out its .idata. --verify decodes only the payloads the earlier targets didn't have
+		param: archs - target architectures, each one of ARCHITECTURES
+		param: options - CompressOptions, {arch} in the output file names is replaced per target
+		returns: dict arch -> output ELF contents, or the .idata bytes needed for the sizing pass
+		raises: CompressionError, elf.ELFError
+	'''
+	options = options or CompressOptions()
+	archs = list(archs)
+	if not archs:
+		raise CompressionError('No target architecture')
+	if len(set(archs))!=len(archs):
+		raise CompressionError('Duplicate target architecture in '+', '.join(archs))
+	if len(archs)>1:
+		for key in TARGET_OUTPUTS:
+			path = getattr(options, key)
+			if path and '{arch}' not in path:
+				raise CompressionError('%s %s must contain {arch} for several targets' % (key, path))
+	outputs = {}
+	previous = None
+	for arch in archs:
+		compressor = ELFCompressor(arch, target_options(options, arch))
+		compressor.keep_results = arch!=archs[-1]
+		if previous:
+			compressor.cache = previous.results
+			compressor.previous = previous
+			compressor.flash_pieces = previous.flash_pieces
+			compressor.decoded = previous.decoded
+		outputs[arch] = run_compressor(compressor, data)
+		if previous:
+			chosen = {(entry.dst, entry.size): entry.algo.name for entry in previous.srcdata if entry}
+			changed = 0
+			for entry in compressor.srcdata:
+				if entry and chosen.get((entry.dst, entry.size), entry.algo.name)!=entry.algo.name:
+					logging.info("%s: %08X [%08X] %s instead of %s" % (arch, entry.dst, entry.size, entry.algo.name, chosen[(entry.dst, entry.size)]))
+					changed += 1
+			logging.info("%s: %d entries reselected, %d kept, %d changed algo" % (arch, compressor.out_n_entries-compressor.kept, compressor.kept, changed))
+			compressor.previous = None # don't chain the ELFs of all targets
+		previous = compressor
+	return outputs
+
+
+def make_parser():
+	import argparse
+
+	parser = argparse.ArgumentParser(description='Compress ARM ELF data sections')
+	def arch_list(text):
+		archs = text.split(',')
+		for arch in archs:
+			if arch not in ARCHITECTURES:
+				raise argparse.ArgumentTypeError('invalid choice: %r (choose from %s)' % (arch, ', '.join(ARCHITECTURES)))
+		return archs
+
+	parser.add_argument('architecture',
+		type=arch_list,
+		help="Target architecture, one of %s. A comma-separated list compresses once and builds an output "
+			"per target, {arch} in the output file names is replaced then" % ', '.join(ARCHITECTURES))
+	parser.add_argument('infile')
+	parser.add_argument('outfile',
+		nargs='?',
+		help="Output ELF, may be omitted if --bin or --hex is given")
+	parser.add_argument('-v', '--verbose',
+		action='count',
+		default=0,
+		help="Verbosity level. Add more for more")
+	parser.add_argument('--bin',
+		dest='bin_output',
+		metavar='FILE',
+		help="Also write the raw flash image (as objcopy -O binary) to FILE")
+	parser.add_argument('--hex',
+		dest='hex_output',
+		metavar='FILE',
+		help="Also write the Intel HEX flash image (as objcopy -O ihex) to FILE")
+	parser.add_argument('--gap-fill',
+		type=lambda text: int(text, 0),
+		default=CompressOptions.gap_fill,
+		metavar='BYTE',
+		help="Fill the gaps between load images in --bin output with BYTE (default: %(default)s)")
+	parser.add_argument('--no-compact',
+		dest='compact',
+		action='store_false',
+		help="Keep the input ELF file layout instead of dropping the space freed by compression")
+	parser.add_argument('-m', '--manifest',
+		metavar='FILE',
+		help="Write a JSON summary of the run (entries, candidates, .idata usage, timings)")
+	parser.add_argument('--profile',
+		action='store_true',
+		help="Time pipeline phases, ELF accessors and each algorithm run, print a hot-spot summary")
+	parser.add_argument('--profile-output',
+		metavar='FILE',
+		help="Also dump cProfile statistics to FILE (implies --profile)")
+	parser.add_argument('--profile-memory',
+		action='store_true',
+		help="Also record peak traced memory per phase (implies --profile)")
+	parser.add_argument('-l', '--level',
+		choices=LEVELS,
+		default=CompressOptions.level,
+		help="Compression effort of the LZ-family algorithms (lz77rle, lzhuff, delta): match search depth and lazy parsing, "
+			"the others produce the same output at every level (default: %(default)s)")
+	parser.add_argument('--time-budget',
+		type=float,
+		metavar='SECONDS',
+		help="Stop searching after this time and use the best results found so far")
+	parser.add_argument('-O', '--optimize',
+		choices=OPTIMIZE_TARGETS,
+		default=CompressOptions.optimize,
+		help="Decompressor variants: smallest, or fastest that fit into .idata (default: %(default)s)")
+	parser.add_argument('--cycles',
+		action='store_true',
+		help="Run the chosen decompressors in a Thumb emulator, verify their output and report cycles per entry")
+	parser.add_argument('--verify',
+		action='store_true',
+		help="Decode the written init image with the reference decoders and compare it with the original data")
+	parser.add_argument('--reference-elf',
+		action='append',
+		dest='reference_elfs',
+		metavar='FILE',
+		help="Companion ELF (i.e. the bootloader) flashed along: its decompressor, memset and memcpy functions are "
+			"called at their addresses instead of placing copies into .idata. May be repeated")
+	parser.add_argument('--defer',
+		action='append',
+		metavar='NAME',
+		help="Leave the init of this symbol or section to data_init_deferred() at runtime, off the boot path. May be repeated")
+	parser.add_argument('--defer-threshold',
+		type=lambda text: int(text, 0),
+		metavar='BYTES',
+		help="Also defer every init range of at least BYTES")
+	parser.add_argument('--size-only',
+		dest='size_output',
+		metavar='LDFILE',
+		help="Sizing pass on the prelinked ELF: print the exact .idata size needed and write a linker script fragment "
+			"defining %s for the final link, no output ELF" % IDATA_SIZE_SYMBOL)
+	parser.add_argument('--cache',
+		metavar='FILE',
+		help="Keep the compression results in FILE and reuse them for the unchanged init ranges of later runs")
+	parser.add_argument('--table-format',
+		choices=TABLE_FORMATS,
+		default=CompressOptions.table_format,
+		help="Init table encoding: fixed 16-byte entries, compact (function index, src/dst deltas and sizes as varints, "
+			"needs the compact table walker of the sample startup code) or auto, the smaller one (default: %(default)s)")
+	parser.add_argument('--coalesce',
+		nargs='?',
+		type=lambda text: int(text, 0),
+		const=COALESCE_GAP,
+		metavar='GAP',
+		help="Merge init ranges at most GAP bytes apart in RAM (default: %d) into one entry when it saves both "
+			".idata bytes and estimated boot cycles" % COALESCE_GAP)
+	parser.add_argument('--flash-match',
+		nargs='?',
+		type=lambda text: int(text, 0),
+		const=FLASH_MATCH_MIN,
+		metavar='BYTES',
+		help="Copy the init data already present in the read-only flash contents (const tables, strings) from there. "
+			"Ranges are split around the pieces of at least BYTES found (default: %d)" % FLASH_MATCH_MIN)
+	parser.add_argument('--ram-regions',
+		action='store_true',
+		help="Also compress the segments the startup code copies from flash to RAM (load address != run address)")
+	return parser
+
+
+def main(argv=None):
+	parser = make_parser()
+	args = parser.parse_args(argv)
+	if args.size_output:
+		if args.outfile or args.bin_output or args.hex_output:
+			parser.error('--size-only writes no outfile, --bin or --hex')
+	elif not (args.outfile or args.bin_output or args.hex_output):
+		parser.error('no output: give outfile, --bin or --hex')
+
+	if args.verbose>1:
+		loglevel = logging.DEBUG
+	elif args.verbose>0:
+		loglevel = logging.INFO
 	else:
-		src = data_addr
-		src_size = len(srcdata[idx].src)
-		comp_data += srcdata[idx].src
-	tbl += dm.make_table_entry(srcdata[idx].algo, src, srcdata[idx].dst, srcdata[idx].size)
-	data_addr += src_size
-
-image = tbl
-image += decomp_code
-image += comp_data
-if len(image)>idata.size:
-	exit("ERROR: Can't fit the resulting init image of size %X into .idata section of size %X" % (len(image), idata.size))
-binary.write_to_va(table_p, image)
-
-logging.info("Shrinking .idata...")
-binary.sections[table_sym.shndx].size = len(image)
-
-logging.info("Saving...")
-open(args.outfile, 'wb').write(binary.pack())
-
-logging.info("Done")
+		loglevel = logging.WARNING
+
+	logging.basicConfig(level=loglevel, format='%(message)s')		
+
+	if args.outfile and len(args.architecture)>1 and '{arch}' not in args.outfile:
+		parser.error('outfile must contain {arch} for several targets')
+
+	try:
+		data = open(args.infile, 'rb').read()
+		outputs = compress_elf_targets(data, args.architecture, CompressOptions.from_args(args))
+	except (CompressionError, elf.ELFError) as e:
+		return str(e)
+
+	if args.size_output:
+		for arch, size in outputs.items():
+			print("%s: .idata needs %d (0x%X) bytes" % (arch, size, size))
+	elif args.outfile:
+		logging.info("Saving...")
+		for arch, out in outputs.items():
+			open(args.outfile.replace('{arch}', arch), 'wb').write(out)
+
+	logging.info("Done")
+
+
+if __name__ == '__main__':
+	from sys import exit
+	exit(main())
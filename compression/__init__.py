@@ -26,12 +26,17 @@ ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 POSSIBILITY OF SUCH DAMAGE.
 '''
 
-__all__ = ['algos', 'CopyAlgo', 'FillAlgo', 'ZeroAlgo', 'LZ77RLEAlgo', 'PackBitsAlgo']
+__all__ = ['algos', 'LEVELS', 'BaseCompressionAlgo', 'BaseStreamCompressor', 'CopyAlgo', 'FillAlgo', 'ZeroAlgo', 'LZ77RLEAlgo', 'PackBitsAlgo', 'DeltaAlgo', 'SparseAlgo', 'PatternAlgo', 'LZHuffAlgo']
 
+from .base import LEVELS, BaseCompressionAlgo, BaseStreamCompressor
 from .copy import CopyAlgo
 from .fill import FillAlgo
 from .zero import ZeroAlgo
 from .lz77rle import LZ77RLEAlgo
 from .packbits import PackBitsAlgo
+from .delta import DeltaAlgo
+from .sparse import SparseAlgo
+from .pattern import PatternAlgo
+from .lzhuff import LZHuffAlgo
 
-algos = [ZeroAlgo, FillAlgo, PackBitsAlgo, LZ77RLEAlgo, CopyAlgo]
+algos = [ZeroAlgo, FillAlgo, PatternAlgo, PackBitsAlgo, LZ77RLEAlgo, LZHuffAlgo, DeltaAlgo, SparseAlgo, CopyAlgo]
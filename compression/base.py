@@ -26,17 +26,56 @@ ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 POSSIBILITY OF SUCH DAMAGE.
 '''
 
-__all__ = ['BaseCompressionAlgo']
+__all__ = ['LEVELS', 'BaseCompressionAlgo', 'BaseStreamCompressor']
 
 import os.path
-import inspect
 from struct import pack
 
+from .registry import DecompressorBlob, get_registry
+
+# Compression effort levels, the LZ-family algos (lz77rle, lzhuff and delta's LZ77RLE stage) map them to their
+# match search parameters, the others use one fixed encoding strategy and ignore the level
+LEVELS = ('fast', 'default', 'max')
+
+
+class BaseStreamCompressor:
+	'''Incremental compressor: feed() the input in chunks, then flush().
+		This default one buffers the whole input and runs algo.compress() on flush,
+		algos with bounded state override it
+	'''
+	def __init__(self, algo):
+		self.algo = algo
+		self.chunks = []
+
+	def feed(self, chunk):
+		'''Consume the next input chunk
+			returns: bytes - compressed data ready so far (may be empty)
+		'''
+		self.chunks.append(bytes(chunk))
+		return b''
+
+	def flush(self):
+		'''Finish the stream
+			returns: the compressed tail, same kinds as BaseCompressionAlgo.compress.
+				An int or None result discards whatever feed() has returned
+		'''
+		return self.algo.compress(b''.join(self.chunks))
+
+
 class BaseCompressionAlgo:
 	name = 'base'
 	decompressor_aliases = {}
-	def __init__(self, arch):
+	# decompressor builds shipped as decompress/d_<arch>[_<variant>].bin -> relative speed,
+	# 'size' is the -Os build every algo has
+	decompressor_variants = {'size': 1}
+	# rough cycles per output byte of the 'size' decompressor (Cortex-M3, zero wait states), for planning estimates
+	decode_cycles = 8
+	def __init__(self, arch, level='default'):
+		if level not in LEVELS:
+			raise ValueError('Unknown compression level '+str(level))
 		self.arch = arch
+		self.level = level
+		self.deadline = None # time.perf_counter() value after which the algo should finish ASAP
 
 	def compress(self, src):
 		'''Data compression function
@@ -47,8 +86,52 @@ class BaseCompressionAlgo:
 		'''
 		raise NotImplementedError()
 
-	def get_decompressor(self):
-		return open(os.path.dirname(os.path.realpath(inspect.getfile(self.__class__)))+'/decompress/d_'+self.arch+'.bin', 'rb').read()
+	def decompress(self, src, size):
+		'''Reference decoder, mirrors the shipped decompressor in linear time
+			param: src - the payload (bytes-like, may extend past its end) or the int copy_table_entry.src value compress() returned
+				size - bytes to be decompressed
+			returns: bytes - what the decompressor writes to dst, longer than size if it would write past the end
+			raises: ValueError, IndexError or struct.error on a malformed payload
+		'''
+		raise NotImplementedError()
+
+	def compressor(self):
+		'''Create an incremental compressor producing the same output as compress()'''
+		return BaseStreamCompressor(self)
+
+	def suits(self, sample):
+		'''Quick check on the first bytes of the data whether compress() is worth running at all'''
+		return True
+
+	def get_decompressor_blob(self, variant='size'):
+		'''Shipped decompressor build for this arch
+			returns: registry.DecompressorBlob
+		'''
+		if self.__class__.__module__.startswith(__package__+'.'):
+			blob = get_registry().get(self.name, self.arch, variant)
+			if blob:
+				return blob
+		import inspect # slow to import, only needed for algos living outside the package
+		suffix = '' if variant=='size' else '_'+variant
+		with open(os.path.dirname(os.path.realpath(inspect.getfile(self.__class__)))+'/decompress/d_'+self.arch+suffix+'.bin', 'rb') as f:
+			return DecompressorBlob(self.name, self.arch, variant, f.read(), self.get_decompressor_align())
+
+	def get_decompressor(self, variant='size'):
+		return self.get_decompressor_blob(variant).image
+
+	def get_decompressor_variants(self):
+		'''Decompressor builds available for this arch
+			returns: dict - variant name -> image
+		'''
+		variants = {'size': self.get_decompressor()}
+		for variant in self.decompressor_variants:
+			if variant in variants:
+				continue
+			try:
+				variants[variant] = self.get_decompressor(variant)
+			except FileNotFoundError: # not built for this arch
+				pass
+		return variants
 
 	def get_decompressor_align(self):
 		return 1 # arch-dependent
@@ -56,6 +139,15 @@ class BaseCompressionAlgo:
 	def get_data_align(self):
 		return 1 # arch-dependent
 
+	def get_payload_align(self, variant, dst):
+		'''Payload placement required by a decompressor variant (None for a builtin)
+			returns: (align, phase) - the payload address must equal phase modulo align
+		'''
+		return self.get_data_align(), 0
+
+	def get_dst_align(self):
+		return 1 # destination alignment required by the decompressor
+
 	def pack_params(self, src, dst, size):
 		'''Default param order: src, dst, size'''
 		return pack('<III', src, dst, size)
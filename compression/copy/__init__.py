@@ -29,11 +29,21 @@ POSSIBILITY OF SUCH DAMAGE.
 __all__ = ["CopyAlgo"]
 
 from struct import pack
-from ..base import BaseCompressionAlgo
+from ..base import BaseCompressionAlgo, BaseStreamCompressor
+
+
+class CopyStreamCompressor(BaseStreamCompressor):
+	def feed(self, chunk):
+		return bytes(chunk)
+
+	def flush(self):
+		return b''
 
 
 class CopyAlgo(BaseCompressionAlgo):
 	name = 'copy'
+	decompressor_variants = { 'size': 1, 'speed': 4 } # word-wide unrolled loop
+	decode_cycles = 6 # byte loop
 	decompressor_aliases = { 'memcpy' : lambda src, dst, size : pack('<III', dst, src, size), 
 							'__aeabi_memcpy' : lambda src, dst, size : pack('<III', dst, src, size), 
 							'__scatterload_copy' : lambda src, dst, size : pack('<III', src, dst, size) }
@@ -42,6 +52,12 @@ class CopyAlgo(BaseCompressionAlgo):
 		'''COPY "compression"'''
 		return src
 
+	def decompress(self, src, size):
+		return bytes(src[:size])
+
+	def compressor(self):
+		return CopyStreamCompressor(self)
+
 	def get_decompressor_align(self):
 		# TODO: arch-dependent
 		# Cortex-M code w/o 32-bit fixed values wouldn't use literal pools, it is safe to align it to 2
@@ -51,3 +67,8 @@ class CopyAlgo(BaseCompressionAlgo):
 		# TODO: arch-dependent
 		# All mem accesses are 8-bit here, no alignment requirements
 		return 1 
+
+	def get_payload_align(self, variant, dst):
+		if variant=='speed':
+			return 4, dst & 3 # same word alignment as dst lets the word loop run
+		return super().get_payload_align(variant, dst)
@@ -0,0 +1,79 @@
+/*
+ * Copyright (c) 2023, FlowSwitch <flowswitch@mail.ru>
+ * All rights reserved.
+ *
+ * Redistribution and use in source and binary forms, with or without
+ * modification, are permitted provided that the following conditions are met:
+ *
+ * 1. Redistributions of source code must retain the above copyright notice,
+ *    this list of conditions and the following disclaimer.
+ * 2. Redistributions in binary form must reproduce the above copyright
+ *    notice, this list of conditions and the following disclaimer in the
+ *    documentation and/or other materials provided with the distribution.
+ * 3. The name of the author may not be used to endorse or promote products
+ *    derived from this software without specific prior written permission.
+ *
+ * THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+ * AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+ * IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ * ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+ * LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+ * CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+ * SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+ * INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+ * CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+ * ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+ * POSSIBILITY OF SUCH DAMAGE.
+ */
+
+
+#include <stddef.h>
+#include <stdint.h>
+
+typedef unsigned char u8;
+typedef uint32_t u32;
+
+#ifdef __ARM_FEATURE_UNALIGNED
+// ARMv7-M LDR handles any source alignment
+typedef u32 __attribute__((aligned(1))) src_u32;
+#define WORDS_OK(src, dst) 1
+#else
+typedef u32 src_u32;
+#define WORDS_OK(src, dst) (!(((uintptr_t)(src) ^ (uintptr_t)(dst)) & 3))
+#endif
+
+void __scatterload_algo(const u8 *src, u8 *dst, size_t size)
+{
+	if (WORDS_OK(src, dst))
+	{
+		while (((uintptr_t)dst & 3) && size)
+		{
+			*dst++ = *src++;
+			size--;
+		}
+		const src_u32 *s = (const src_u32*)src;
+		u32 *d = (u32*)dst;
+		while (size >= 16)
+		{
+			u32 w0 = s[0], w1 = s[1], w2 = s[2], w3 = s[3];
+			d[0] = w0;
+			d[1] = w1;
+			d[2] = w2;
+			d[3] = w3;
+			s += 4;
+			d += 4;
+			size -= 16;
+		}
+		while (size >= 4)
+		{
+			*d++ = *s++;
+			size -= 4;
+		}
+		src = (const u8*)s;
+		dst = (u8*)d;
+	}
+	while (size--)
+	{
+		*dst++ = *src++;
+	}
+}
@@ -0,0 +1,203 @@
+'''
+Copyright (c) 2023, FlowSwitch <flowswitch@mail.ru>
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice,
+	this list of conditions and the following disclaimer.
+2. Redistributions in binary form must reproduce the above copyright
+   notice, this list of conditions and the following disclaimer in the
+   documentation and/or other materials provided with the distribution.
+3. The name of the author may not be used to endorse or promote products
+   derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+POSSIBILITY OF SUCH DAMAGE.
+'''
+
+
+__all__ = ["DeltaAlgo", "DeltaStreamCompressor"]
+
+import sys
+from array import array
+from itertools import accumulate
+from operator import xor
+from struct import pack
+from ..base import BaseCompressionAlgo, BaseStreamCompressor
+from ..lz77rle import LZ77RLEAlgo, decode
+
+MODE_DELTA = 0 # element = previous + stored (mod 2^bits)
+MODE_XOR = 1 # element = previous ^ stored
+STRIDES = (2, 4)
+TYPECODES = { 2: 'H', 4: 'I' }
+MIN_SIZE = 16
+SAMPLE_SIZE = 0x1000 # bytes inspected to choose stride and mode
+MIN_GAIN = 0.75 # the transform must leave at most this share of the nonzero bytes to be worth trying
+
+
+def transform(data, stride, mode, prev=0):
+	'''Delta/XOR transform of little-endian elements, data length must be a multiple of stride
+		returns: (transformed bytes, last element)
+	'''
+	vals = array(TYPECODES[stride], data)
+	if sys.byteorder=='big':
+		vals.byteswap()
+	if not vals:
+		return b'', prev
+	mask = (1<<(stride*8))-1
+	if mode==MODE_DELTA:
+		out = array(vals.typecode, [(v-p) & mask for v, p in zip(vals, [prev]+vals[:-1].tolist())])
+	else:
+		out = array(vals.typecode, [v^p for v, p in zip(vals, [prev]+vals[:-1].tolist())])
+	last = vals[-1]
+	if sys.byteorder=='big':
+		out.byteswap()
+	return out.tobytes(), last
+
+
+def untransform(data, stride, mode):
+	'''Inverse of transform() from a zero previous element, data length must be a multiple of stride'''
+	vals = array(TYPECODES[stride], data)
+	if sys.byteorder=='big':
+		vals.byteswap()
+	mask = (1<<(stride*8))-1
+	if mode==MODE_DELTA:
+		out = array(vals.typecode, [v & mask for v in accumulate(vals)])
+	else:
+		out = array(vals.typecode, accumulate(vals, xor))
+	if sys.byteorder=='big':
+		out.byteswap()
+	return out.tobytes()
+
+
+def unpredictable(data, stride):
+	'''Count bytes that are neither zero nor equal to the byte one element earlier,
+		a rough measure of what LZ77RLE can't remove
+	'''
+	return sum(1 for i in range(stride, len(data)) if data[i] and data[i]!=data[i-stride])
+
+
+def choose_params(sample):
+	'''Pick the (stride, mode) leaving the fewest unpredictable bytes in the sample
+		returns: (stride, mode) or None if no transform looks better than the raw data
+	'''
+	best = None
+	best_score = min(unpredictable(sample, stride) for stride in STRIDES)*MIN_GAIN
+	for stride in STRIDES:
+		n = len(sample)//stride*stride
+		for mode in (MODE_DELTA, MODE_XOR):
+			score = unpredictable(transform(sample[:n], stride, mode)[0], stride)
+			if score<best_score:
+				best = (stride, mode)
+				best_score = score
+	return best
+
+
+class DeltaStreamCompressor(BaseStreamCompressor):
+	'''Chooses the transform on the first SAMPLE_SIZE bytes, then transforms chunks into an LZ77RLE stream'''
+	def __init__(self, algo):
+		super().__init__(algo)
+		self.params = None
+		self.pending = b'' # input not transformed yet: the sample or an incomplete element
+		self.prev = 0
+		self.failed = False
+		self.out = bytearray()
+		self.lz = None
+
+	def start(self):
+		self.params = choose_params(self.pending[:SAMPLE_SIZE])
+		if not self.params:
+			self.failed = True
+			self.pending = b''
+			return
+		lz = LZ77RLEAlgo(self.algo.arch, self.algo.level)
+		lz.deadline = self.algo.deadline
+		self.lz = lz.compressor()
+		self.out += pack('B', self.params[0] | self.params[1]<<4)
+
+	def feed(self, chunk):
+		if self.failed:
+			return b''
+		self.pending += bytes(chunk)
+		if not self.params:
+			if len(self.pending)<SAMPLE_SIZE:
+				return b''
+			self.start()
+			if self.failed:
+				return b''
+		stride, mode = self.params
+		n = len(self.pending)//stride*stride
+		data, self.prev = transform(self.pending[:n], stride, mode, self.prev)
+		self.pending = self.pending[n:]
+		self.out += self.lz.feed(data)
+		# nothing is returned before flush() since the algo may still turn out to be n/a
+		return b''
+
+	def flush(self):
+		if not self.failed and not self.params:
+			if len(self.pending)<MIN_SIZE:
+				return None
+			self.start()
+		if self.failed:
+			return None
+		stride, mode = self.params
+		n = len(self.pending)//stride*stride
+		data, self.prev = transform(self.pending[:n], stride, mode, self.prev)
+		# the trailing partial element is stored untransformed
+		self.out += self.lz.feed(data+self.pending[n:])
+		self.out += self.lz.flush()
+		return bytes(self.out)
+
+
+class DeltaAlgo(BaseCompressionAlgo):
+	'''Delta or XOR transform of 16/32-bit elements followed by LZ77RLE.
+		Payload: u8 stride | mode<<4, LZ77RLE stream of the transformed data
+	'''
+	name = 'delta'
+	decode_cycles = 14 # LZ77RLE plus the inverse transform
+	decompressor_aliases = { '__scatterload_delta': lambda src, dst, size : pack('<III', src, dst, size) }
+
+	def compress(self, src):
+		stream = self.compressor()
+		stream.feed(src)
+		return stream.flush()
+
+	def decompress(self, src, size):
+		params = src[0]
+		stride, mode = params & 0x0F, params>>4
+		if stride not in STRIDES or mode not in (MODE_DELTA, MODE_XOR):
+			raise ValueError('Invalid delta params %02X' % params)
+		data = decode(src, size, 1)[0]
+		# the decompressor undoes the transform on the whole elements inside size, the rest is left as is
+		n = size//stride*stride
+		return untransform(data[:n], stride, mode)+data[n:]
+
+	def compressor(self):
+		return DeltaStreamCompressor(self)
+
+	def suits(self, sample):
+		return len(sample)>=MIN_SIZE and choose_params(sample) is not None
+
+	def get_decompressor_align(self):
+		# TODO: arch-dependent
+		# Cortex-M code w/o 32-bit fixed values wouldn't use literal pools, it is safe to align it to 2
+		return 2 
+
+	def get_data_align(self):
+		# The payload is read byte by byte
+		return 1 
+
+	def get_dst_align(self):
+		# The inverse transform uses halfword/word accesses
+		return 4
@@ -29,23 +29,52 @@ POSSIBILITY OF SUCH DAMAGE.
 __all__ = ["FillAlgo"]
 
 from struct import pack
-from ..base import BaseCompressionAlgo
+from ..base import BaseCompressionAlgo, BaseStreamCompressor
+
+
+class FillStreamCompressor(BaseStreamCompressor):
+	def __init__(self, algo):
+		super().__init__(algo)
+		self.value = None
+		self.match = True
+
+	def feed(self, chunk):
+		if not self.match or not chunk:
+			return b''
+		if self.value is None:
+			self.value = chunk[0]
+		if chunk.count(self.value)!=len(chunk):
+			self.match = False
+		return b''
+
+	def flush(self):
+		if self.value is None:
+			return b''
+		return self.value if self.match else None
 
 
 class FillAlgo(BaseCompressionAlgo):
 	name = 'fill'
+	decompressor_variants = { 'size': 1, 'speed': 4 } # word-wide unrolled loop
+	decode_cycles = 4 # byte loop
 	decompressor_aliases = { 'memset' : lambda src, dst, size : pack('<III', dst, src, size), 
 								'__aeabi_memset' : lambda src, dst, size : pack('<III', dst, src, size) }
 
 	def compress(self, src):
-		if len(src)==0:
-			return src
-
-		val = src[0]
-		for b in src:
-			if b!=val:
-				return None
-		return val
+		stream = self.compressor()
+		stream.feed(src)
+		return stream.flush()
+
+	def decompress(self, src, size):
+		if not isinstance(src, int):
+			# compress() of empty data has no fill value, an empty payload
+			if size:
+				raise ValueError('Fill value expected, got a %d byte payload' % len(src))
+			return b''
+		return bytes([src & 0xFF])*size # memset stores the value as a byte
+
+	def compressor(self):
+		return FillStreamCompressor(self)
 
 	def get_decompressor_align(self):
 		# TODO: arch-dependent
@@ -26,72 +26,178 @@ ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 POSSIBILITY OF SUCH DAMAGE.
 '''
 
-__all__ = ["LZ77RLEAlgo"]
+__all__ = ["LZ77RLEAlgo", "LZ77RLEStreamCompressor"]
 
 from struct import pack
-from ..base import BaseCompressionAlgo
+from time import perf_counter
+from ..base import BaseCompressionAlgo, BaseStreamCompressor
 
 MIN_COPY = 3
+MAX_COPY = 254 # the match length byte stores length-2, keep it clear of the u8 overflow in the decompressor
+MAX_ZERO = 255
+LOOKAHEAD = 256 # input needed past a position before encoding it (a zero run/match plus one position for lazy parsing)
+WINDOW = 255 # match distance is a byte
+TRIM_THRESHOLD = 0x10000 # drop consumed input from the buffer in chunks of at least this size
+DEADLINE_CHECK = 1024 # positions between deadline checks
 
-class LZ77RLEAlgo(BaseCompressionAlgo):
-    name = 'lz77rle'
-    decompressor_aliases = { '__scatterload_lz77rle': lambda src, dst, size : pack('<III', src, dst, size) }
+# level -> (match search depth (None = find the longest match), lazy parsing)
+LEVEL_PARAMS = {
+    'fast': (1, False),
+    'default': (None, False),
+    'max': (None, True),
+}
 
-    def compress(self, src):
-        dst = b''
-        si = 0
-        size = len(src)
-        lit_start = 0
-        lit_len = 0
-        while si<size:
-            #print("%X: " % (si), end='')
-            # count zeroes
-            for i in range(si, min(si+255, size)):
-                if src[i]!=0:
-                    break
+
+def find_match(src, si, lo, cap, depth):
+    '''Find the longest (up to cap) match for src[si:] starting in src[lo:si], the nearest one on ties
+        depth limits the number of searches for a longer match, None for unlimited
+        returns: (length, position) or (0, 0)
+    '''
+    if cap<MIN_COPY:
+        return 0, 0
+    k = MIN_COPY
+    ncopy = 0
+    copy_ofs = 0
+    # the match may overlap the current position, the decompressor copies byte by byte
+    p = src.rfind(src[si:si+k], lo, si-1+k)
+    while p>=0:
+        l = k
+        while l<cap and src[p+l]==src[si+l]:
+            l += 1
+        ncopy = l
+        copy_ofs = p
+        if l>=cap:
+            break
+        if depth is not None:
+            depth -= 1
+            if not depth:
+                break
+        # any longer match is a nearest occurrence of one more byte
+        k = l+1
+        p = src.rfind(src[si:si+k], lo, si-1+k)
+    return ncopy, copy_ofs
+
+
+def decode(src, size, pos=0):
+    '''Reference decoder of the stream at src[pos:], mirrors the C one: runs until at least size bytes are out
+        returns: (decoded bytes, position in src after the last token)
+    '''
+    dst = bytearray()
+    out = 0
+    while out<size:
+        hdr = src[pos]
+        pos += 1
+        nlit = (hdr & 7)-1 # 1-based
+        if nlit<0:
+            nlit = src[pos]-1
+            pos += 1
+            if nlit<0:
+                raise ValueError('Invalid literal count')
+        ncomp = hdr>>4
+        if not ncomp:
+            ncomp = src[pos]
+            pos += 1
+        if nlit:
+            dst += src[pos:pos+nlit]
+            pos += nlit
+            out += nlit
+        if hdr & 8:
+            # the match is copied byte by byte from dist bytes back, the source may overlap the bytes appended
+            dist = src[pos]
+            pos += 1
+            ncomp += 2
+            start = out-dist
+            if not dist or start<0:
+                raise ValueError('Invalid match distance %d' % dist)
+            if dist>=ncomp:
+                dst += dst[start:start+ncomp]
             else:
-                i = min(si+255, size)
-            nzero = i - si
-            if nzero==min(255, size-si): #best case, no need to look for matches
+                dst += (dst[start:]*(ncomp//dist+1))[:ncomp]
+        else:
+            dst += bytes(ncomp)
+        out += ncomp
+    if len(dst)!=out:
+        raise ValueError('Literals past the end of the stream')
+    return bytes(dst), pos
+
+
+class LZ77RLEStreamCompressor(BaseStreamCompressor):
+    '''Keeps only the match window, the pending literals and the lookahead in memory'''
+    def __init__(self, algo, lazy=None):
+        super().__init__(algo)
+        self.depth, self.lazy = LEVEL_PARAMS[algo.level]
+        if lazy is not None:
+            self.lazy = lazy
+        self.buf = bytearray()
+        self.base = 0 # stream position of buf[0]
+        self.si = 0
+        self.lit_start = 0
+        self.lit_len = 0
+
+    def feed(self, chunk):
+        self.buf += chunk
+        return self.process(False)
+
+    def flush(self):
+        return self.process(True)
+
+    def count_zeroes(self, si, size):
+        run = self.buf[si:si+min(MAX_ZERO, size-si)]
+        return len(run)-len(run.lstrip(b'\0'))
+
+    def process(self, final):
+        src = self.buf
+        base = self.base
+        # all positions below are relative to buf, the stream start is only needed to clamp the match window
+        size = len(src)
+        si = self.si-base
+        lit_start = self.lit_start-base
+        lit_len = self.lit_len
+        depth = self.depth
+        lazy = self.lazy
+        deadline = self.algo.deadline
+        check = 0
+        # without the final chunk, stop where the lookahead could reach past the data seen so far
+        limit = size if final else size-LOOKAHEAD
+        dst = bytearray()
+        while si<limit:
+            if deadline is not None:
+                check += 1
+                if check>=DEADLINE_CHECK:
+                    check = 0
+                    if perf_counter()>deadline: # out of time, finish with the cheapest search
+                        depth = self.depth = 1
+                        lazy = self.lazy = False
+                        deadline = None
+            nzero = self.count_zeroes(si, size)
+            if nzero==min(MAX_ZERO, size-si): #best case, no need to look for matches
                 ncopy = 0
             else:
-                # look for matches
-                ncopy=0
-                copy_ofs = 0
-                for ofs in range(max(si-1, 0), max(si-255, 0), -1):
-                    for i in range(ofs, min(ofs+255, size)):
-                        if (si+i-ofs)>=size:
-                            break
-                        if src[i]!=src[si+i-ofs]:
-                            #print('@%X %02X!=%02X @%X' % (i, src[i], src[si+i-ofs], si+i-ofs))
-                            break
-                    l = i-ofs
-                    if l>ncopy:
-                        ncopy = l
-                        copy_ofs = ofs
-                if ncopy<MIN_COPY:
-                    ncopy = 0
+                # position 0 is never a match source, the format has always been produced this way
+                ncopy, copy_ofs = find_match(src, si, max(si-WINDOW, -base)+1, min(MAX_COPY, size-si), depth)
+                if lazy and ncopy>nzero and ncopy<MAX_COPY and lit_len<253 and si+1<size:
+                    # a literal now pays off if the next position starts a longer run
+                    next_zero = self.count_zeroes(si+1, size)
+                    next_copy = find_match(src, si+1, max(si+1-WINDOW, -base)+1, min(MAX_COPY, size-si-1), depth)[0]
+                    if max(next_zero, next_copy)>ncopy+1:
+                        nzero = ncopy = 0
 
             if nzero==0 and ncopy==0:
                 lit_len += 1
                 si += 1
                 if lit_len<254 and si<size:
-                    #print('lit %02X' % (src[si-1]))
                     continue
 
             # output
             hdr = 0
             tail = b''
-            #print("%X: nlit=%X, " % (len(dst), lit_len), end='')
             if lit_len<=6:
                 hdr |= (lit_len+1)
                 extra = b''
             else:
                 extra = pack('B', lit_len+1)
-            #print('nz=%X, nc=%X, ' % (nzero, ncopy), end='')
             if (nzero+1)>ncopy:
                 # zerofill is better
-                #print('nzero=%X' % (nzero))
                 si += nzero           
                 if nzero>0 and nzero<=15:
                     hdr |= nzero<<4
@@ -99,7 +205,6 @@ class LZ77RLEAlgo(BaseCompressionAlgo):
                     extra += pack('B', nzero)
             else:
                 dist = si-copy_ofs
-                #print('distcopy @%X(-%X)[%X]' % (copy_ofs, dist, ncopy))
                 si += ncopy
                 hdr |= 8 # DISTCOPY flag
                 ncopy -= 2
@@ -112,7 +217,54 @@ class LZ77RLEAlgo(BaseCompressionAlgo):
             lit_start = si
             lit_len = 0
 
-        return dst
+        # keep the match window and the pending literals, drop the rest
+        keep = min(lit_start, max(si-WINDOW, 0))
+        if keep>=TRIM_THRESHOLD:
+            del src[:keep]
+            base += keep
+            si -= keep
+            lit_start -= keep
+        self.base = base
+        self.si = si+base
+        self.lit_start = lit_start+base
+        self.lit_len = lit_len
+        return bytes(dst)
+
+
+class LZ77RLEBestOfStreamCompressor(BaseStreamCompressor):
+    '''Runs greedy and lazy parsing side by side and keeps the smaller result'''
+    def __init__(self, algo):
+        super().__init__(algo)
+        self.streams = [LZ77RLEStreamCompressor(algo, lazy=False), LZ77RLEStreamCompressor(algo, lazy=True)]
+        self.outputs = [bytearray(), bytearray()]
+
+    def feed(self, chunk):
+        for stream, out in zip(self.streams, self.outputs):
+            out += stream.feed(chunk)
+        return b''
+
+    def flush(self):
+        for stream, out in zip(self.streams, self.outputs):
+            out += stream.flush()
+        return bytes(min(self.outputs, key=len))
+
+
+class LZ77RLEAlgo(BaseCompressionAlgo):
+    name = 'lz77rle'
+    decode_cycles = 10 # 6 on zero runs, up to 14 on short matches
+    decompressor_aliases = { '__scatterload_lz77rle': lambda src, dst, size : pack('<III', src, dst, size) }
+
+    def compress(self, src):
+        stream = self.compressor()
+        return stream.feed(src)+stream.flush()
+
+    def decompress(self, src, size):
+        return decode(src, size)[0]
+
+    def compressor(self):
+        if self.level=='max':
+            return LZ77RLEBestOfStreamCompressor(self)
+        return LZ77RLEStreamCompressor(self)
 
     def get_decompressor_align(self):
         # TODO: arch-dependent
@@ -36,12 +36,12 @@ void __scatterload_algo(const u8 *src, u8 *dst, size_t size)
   	while(dst<dst_end)
   	{
     	u8 hdr = *src++;
-    	u8 nlit = hdr & 7;
+    	unsigned nlit = hdr & 7;
     	if (!nlit)
     	{
       		nlit = *src++;
     	}
-    	u8 ncomp = hdr >> 4;
+    	unsigned ncomp = hdr >> 4;
     	if (!ncomp)
     	{
       		ncomp = *src++;
@@ -55,14 +55,14 @@ void __scatterload_algo(const u8 *src, u8 *dst, size_t size)
       		u8 dist = *src++;
       		u8 *cpy_src = &dst[-dist];
 			ncomp += 2;
-      		while (--ncomp >= 0)
+      		while (ncomp--)
       		{
         		*dst++ = *cpy_src++;
       		}
     	}
     	else
     	{
-      		while (--ncomp >= 0)
+      		while (ncomp--)
         	*dst++ = 0;
     	}
   	}
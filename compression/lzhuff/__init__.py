@@ -0,0 +1,262 @@
+'''
+Copyright (c) 2023, FlowSwitch <flowswitch@mail.ru>
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice,
+	this list of conditions and the following disclaimer.
+2. Redistributions in binary form must reproduce the above copyright
+   notice, this list of conditions and the following disclaimer in the
+   documentation and/or other materials provided with the distribution.
+3. The name of the author may not be used to endorse or promote products
+   derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+POSSIBILITY OF SUCH DAMAGE.
+'''
+
+
+__all__ = ["LZHuffAlgo"]
+
+import heapq
+from struct import pack, unpack_from
+from time import perf_counter
+from ..base import BaseCompressionAlgo
+from ..lz77rle import find_match, LEVEL_PARAMS
+
+MIN_MATCH = 3
+N_LENGTHS = 32 # match length symbols, lengths MIN_MATCH..MIN_MATCH+N_LENGTHS-1
+MAX_MATCH = MIN_MATCH+N_LENGTHS-1
+N_SYMBOLS = 256+N_LENGTHS
+DIST_BITS = 12 # raw distance-1 bits after a length symbol
+WINDOW = 1<<DIST_BITS
+MAX_BITS = 15 # max code length
+DEADLINE_CHECK = 1024 # positions between deadline checks
+MAX_ZERO_SHARE = 0.5 # samples with more zeroes are left to the RLE-capable algos
+
+
+def tokenize(src, depth, lazy, deadline=None):
+	'''Greedy (or one step lazy) LZ parse
+		returns: list of ints, literal byte or -(length<<DIST_BITS | distance-1) for a match
+	'''
+	tokens = []
+	size = len(src)
+	si = 0
+	check = 0
+	while si<size:
+		if deadline is not None:
+			check += 1
+			if check>=DEADLINE_CHECK:
+				check = 0
+				if perf_counter()>deadline:
+					depth = 1
+					lazy = False
+					deadline = None
+		ncopy, copy_ofs = find_match(src, si, max(si-WINDOW, 0), min(MAX_MATCH, size-si), depth)
+		if ncopy and lazy and ncopy<MAX_MATCH and si+1<size:
+			if find_match(src, si+1, max(si+1-WINDOW, 0), min(MAX_MATCH, size-si-1), depth)[0]>ncopy:
+				ncopy = 0
+		if ncopy:
+			tokens.append(-(ncopy<<DIST_BITS | (si-copy_ofs-1)))
+			si += ncopy
+		else:
+			tokens.append(src[si])
+			si += 1
+	return tokens
+
+
+def code_lengths(freqs):
+	'''Huffman code lengths limited to MAX_BITS, by flattening the frequencies until the tree fits'''
+	while True:
+		heap = [(f, sym, None) for sym, f in enumerate(freqs) if f]
+		if len(heap)==1: # a lone symbol still needs a 1 bit code
+			return [1 if f else 0 for f in freqs]
+		heapq.heapify(heap)
+		uid = N_SYMBOLS
+		while len(heap)>1:
+			a = heapq.heappop(heap)
+			b = heapq.heappop(heap)
+			heapq.heappush(heap, (a[0]+b[0], uid, (a, b)))
+			uid += 1
+		lengths = [0]*len(freqs)
+		stack = [(heap[0], 0)]
+		while stack:
+			node, depth = stack.pop()
+			if node[2] is None:
+				lengths[node[1]] = depth
+			else:
+				stack.append((node[2][0], depth+1))
+				stack.append((node[2][1], depth+1))
+		if max(lengths)<=MAX_BITS:
+			return lengths
+		freqs = [(f+1)>>1 if f else 0 for f in freqs]
+
+
+def canonical(lengths):
+	'''returns: (count per length 1..MAX_BITS, symbols in code order, symbol -> (code, length))'''
+	count = [0]*(MAX_BITS+1)
+	for l in lengths:
+		count[l] += 1
+	count[0] = 0
+	symbols = sorted((sym for sym, l in enumerate(lengths) if l), key=lambda sym: (lengths[sym], sym))
+	codes = {}
+	code = 0
+	prev = 0
+	for sym in symbols:
+		code <<= lengths[sym]-prev
+		prev = lengths[sym]
+		codes[sym] = (code, prev)
+		code += 1
+	return count[1:], symbols, codes
+
+
+class BitWriter:
+	'''LSB-first bit stream'''
+	def __init__(self):
+		self.out = bytearray()
+		self.buf = 0
+		self.cnt = 0
+
+	def put(self, val, n):
+		self.buf |= val<<self.cnt
+		self.cnt += n
+		while self.cnt>=8:
+			self.out.append(self.buf & 0xFF)
+			self.buf >>= 8
+			self.cnt -= 8
+
+	def finish(self):
+		if self.cnt:
+			self.out.append(self.buf & 0xFF)
+		return bytes(self.out)
+
+
+def reverse_bits(val, n):
+	return int(format(val, '0%db' % n)[::-1], 2)
+
+
+def decode_table(count, symbol):
+	'''Lookup table on the next stream bits, as many as the longest code has: (literal byte or minus the match length,
+		code length) for every value, None where no code matches
+		returns: (table, its index bits)
+	'''
+	bits = max((l+1 for l in range(MAX_BITS) if count[l]), default=1)
+	lut = [None]*(1<<bits)
+	code = 0
+	index = 0
+	for l in range(1, bits+1):
+		for sym in symbol[index:index+count[l-1]]:
+			if code>>l:
+				raise ValueError('Invalid code lengths')
+			hit = (sym if sym<256 else 256-MIN_MATCH-sym, l)
+			# every value starting with the code (sent MSB first, so reversed in the LSB first buffer)
+			lut[reverse_bits(code, l)::1<<l] = [hit]*(1<<(bits-l))
+			code += 1
+		index += count[l-1]
+		code <<= 1
+	return lut, bits
+
+
+class LZHuffAlgo(BaseCompressionAlgo):
+	'''LZ77 with a canonical Huffman code over literals and match lengths, raw 12-bit distances.
+		Payload (halfword aligned):
+			u16 count[MAX_BITS] - number of codes of length 1..MAX_BITS
+			u16 symbol[] - symbols in canonical code order
+			bit stream, LSB first. Codes are sent MSB first, a length symbol is followed by DIST_BITS of distance-1
+		The code table is built per section, the selector weighs it against the bigger decompressor,
+		so the stream compressor buffers the whole section
+	'''
+	name = 'lzhuff'
+	decode_cycles = 40 # bitwise Huffman decoding
+	decompressor_aliases = { '__scatterload_lzhuff': lambda src, dst, size : pack('<III', src, dst, size) }
+
+	def compress(self, src):
+		if len(src)<MIN_MATCH:
+			return None
+		depth, lazy = LEVEL_PARAMS[self.level]
+		tokens = tokenize(bytes(src), depth, lazy, self.deadline)
+		freqs = [0]*N_SYMBOLS
+		for tok in tokens:
+			freqs[tok if tok>=0 else 256+((-tok)>>DIST_BITS)-MIN_MATCH] += 1
+		count, symbols, codes = canonical(code_lengths(freqs))
+		# the stream reader consumes codes bit by bit, starting from the code MSB
+		rev = {sym: (reverse_bits(code, n), n) for sym, (code, n) in codes.items()}
+		bits = BitWriter()
+		dist_mask = WINDOW-1
+		for tok in tokens:
+			if tok>=0:
+				bits.put(*rev[tok])
+			else:
+				tok = -tok
+				bits.put(*rev[256+(tok>>DIST_BITS)-MIN_MATCH])
+				bits.put(tok & dist_mask, DIST_BITS)
+		return pack('<%dH' % MAX_BITS, *count)+pack('<%dH' % len(symbols), *symbols)+bits.finish()
+
+	def decompress(self, src, size):
+		'''Reference decoder: every code by a single lookup on a table as wide as the longest one, the distance
+			of a match taken from the same bit buffer
+		'''
+		count = unpack_from('<%dH' % MAX_BITS, src, 0)
+		nsym = sum(count)
+		symbol = unpack_from('<%dH' % nsym, src, MAX_BITS*2)
+		lut, bits = decode_table(count, symbol)
+		mask = (1<<bits)-1
+		# a literal takes up to MAX_BITS, slices of bytes are cheaper to read than the ones of a memoryview of .idata
+		pos = (MAX_BITS+nsym)*2
+		src = bytes(src[pos:pos+(size*MAX_BITS+7)//8])
+		pos = 0
+		bitbuf = 0
+		bitcnt = 0
+		dst = bytearray()
+		out = 0
+		try:
+			while out<size:
+				# enough bits for the longest code and a distance, zeroes past the end of src
+				if bitcnt<MAX_BITS+DIST_BITS:
+					bitbuf |= int.from_bytes(src[pos:pos+8], 'little')<<bitcnt
+					pos += 8
+					bitcnt += 64
+				sym, l = lut[bitbuf & mask]
+				if sym>=0:
+					dst.append(sym)
+					out += 1
+				else:
+					# copied byte by byte from dist bytes back, an overlapping source repeats
+					start = out-(bitbuf>>l & (WINDOW-1))-1
+					if start<0:
+						raise ValueError('Invalid match distance %d' % (out-start))
+					end = start-sym
+					if end<=out:
+						dst += dst[start:end]
+					else:
+						dst += (dst[start:]*-sym)[:-sym]
+					out -= sym
+					l += DIST_BITS
+				bitbuf >>= l
+				bitcnt -= l
+		except TypeError: # no code matches
+			raise ValueError('Invalid code')
+		return bytes(dst)
+
+	def suits(self, sample):
+		return len(sample)>=MIN_MATCH and sample.count(0)<len(sample)*MAX_ZERO_SHARE
+
+	def get_decompressor_align(self):
+		# TODO: arch-dependent
+		# Cortex-M code w/o 32-bit fixed values wouldn't use literal pools, it is safe to align it to 2
+		return 2 
+
+	def get_data_align(self):
+		# The code tables are read as halfwords
+		return 2 
@@ -0,0 +1,103 @@
+/*
+ * Copyright (c) 2023, FlowSwitch <flowswitch@mail.ru>
+ * All rights reserved.
+ *
+ * Redistribution and use in source and binary forms, with or without
+ * modification, are permitted provided that the following conditions are met:
+ *
+ * 1. Redistributions of source code must retain the above copyright notice,
+ *    this list of conditions and the following disclaimer.
+ * 2. Redistributions in binary form must reproduce the above copyright
+ *    notice, this list of conditions and the following disclaimer in the
+ *    documentation and/or other materials provided with the distribution.
+ * 3. The name of the author may not be used to endorse or promote products
+ *    derived from this software without specific prior written permission.
+ *
+ * THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+ * AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+ * IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ * ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+ * LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+ * CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+ * SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+ * INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+ * CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+ * ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+ * POSSIBILITY OF SUCH DAMAGE.
+ */
+
+
+#include <stddef.h>
+#include <stdint.h>
+
+typedef uint8_t u8;
+typedef uint16_t u16;
+typedef uint32_t u32;
+
+#define MAX_BITS 15
+#define MIN_MATCH 3
+#define DIST_BITS 12
+
+void __scatterload_algo(const u16 *src, u8 *dst, size_t size)
+{
+	const u16 *count = src;
+	const u16 *symbol = src + MAX_BITS;
+	unsigned nsym = 0;
+	for (unsigned i = 0; i<MAX_BITS; i++)
+	{
+		nsym += count[i];
+	}
+	const u8 *in = (const u8*)(symbol + nsym);
+	u32 bitbuf = 0;
+	unsigned bitcnt = 0;
+	u8 *dst_end = &dst[size];
+
+	while(dst<dst_end)
+	{
+		// canonical Huffman decode, the tables are used right from flash
+		int code = 0;
+		int first = 0;
+		int index = 0;
+		unsigned sym = 0;
+		for (unsigned len = 0; len<MAX_BITS; len++)
+		{
+			if (!bitcnt)
+			{
+				bitbuf = *in++;
+				bitcnt = 8;
+			}
+			code |= bitbuf & 1;
+			bitbuf >>= 1;
+			bitcnt--;
+			int n = count[len];
+			if (code - n < first)
+			{
+				sym = symbol[index + (code - first)];
+				break;
+			}
+			index += n;
+			first = (first + n) << 1;
+			code <<= 1;
+		}
+
+		if (sym<256)
+		{
+			*dst++ = sym;
+			continue;
+		}
+
+		while (bitcnt<DIST_BITS)
+		{
+			bitbuf |= (u32)(*in++) << bitcnt;
+			bitcnt += 8;
+		}
+		const u8 *cpy_src = dst - (bitbuf & ((1<<DIST_BITS)-1)) - 1;
+		bitbuf >>= DIST_BITS;
+		bitcnt -= DIST_BITS;
+		sym -= 256 - MIN_MATCH;
+		while (sym--)
+		{
+			*dst++ = *cpy_src++;
+		}
+	}
+}
@@ -26,34 +26,43 @@ ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 POSSIBILITY OF SUCH DAMAGE.
 '''
 
-__all__ = ["PackBitsAlgo"]
+__all__ = ["PackBitsAlgo", "PackBitsStreamCompressor"]
 
 from struct import pack
-from ..base import BaseCompressionAlgo
+from ..base import BaseCompressionAlgo, BaseStreamCompressor
 
 MIN_RLE = 2
 MAX_RLE = 128
 MAX_LIT = 128
 
-class PackBitsAlgo(BaseCompressionAlgo):
-	name = 'packbits'
-	decompressor_aliases = { '__scatterload_packbits': lambda src, dst, size : pack('<III', src, dst, size) }
 
-	def compress(self, src):
-		dst = b''
-		si = 0
-		size = len(src)
-		lit_start = 0
-		lit_len = 0
+class PackBitsStreamCompressor(BaseStreamCompressor):
+	'''Keeps only the pending literal run and the run length lookahead in memory'''
+	def __init__(self, algo):
+		super().__init__(algo)
+		self.buf = bytearray()
+		self.si = 0 # positions are relative to buf
+		self.lit_start = 0
+		self.lit_len = 0
 
-		def out_lit():
-			if lit_len:
-				print("out LIT")
-				dst += pack('<B', lit_len-1)+src[lit_start:si]
-			lit_start = si
-			lit_len = 0
+	def feed(self, chunk):
+		self.buf += chunk
+		return self.process(False)
+
+	def flush(self):
+		return self.process(True)
+
+	def process(self, final):
+		dst = bytearray()
+		src = self.buf
+		si = self.si
+		size = len(src)
+		lit_start = self.lit_start
+		lit_len = self.lit_len
+		# without the final chunk, stop where a run could continue past the data seen so far
+		limit = size if final else size-MAX_RLE
 
-		while si<size:
+		while si<limit:
 			data = src[si]
 			#print("%X: %02X " % (si, data), end='')
 			# count repeats
@@ -84,29 +93,46 @@ class PackBitsAlgo(BaseCompressionAlgo):
 					lit_len = 0
 				#else:
 				#	print("")
-		if lit_len:
-			#print("out LIT")
-			dst += pack('<B', lit_len-1)+src[lit_start:si]
-		lit_start = si
-		lit_len = 0
+		if final:
+			if lit_len:
+				#print("out LIT")
+				dst += pack('<B', lit_len-1)+src[lit_start:si]
+			lit_start = si
+			lit_len = 0
 
-		return dst
+		# only the pending literals are needed from the consumed input
+		del src[:lit_start]
+		self.si = si-lit_start
+		self.lit_start = 0
+		self.lit_len = lit_len
+		return bytes(dst)
 
-	def decompress(self, src):
-		'''For testing'''
-		dst = b''
-		size = len(src)
+
+class PackBitsAlgo(BaseCompressionAlgo):
+	name = 'packbits'
+	decode_cycles = 6 # byte runs and literals
+	decompressor_aliases = { '__scatterload_packbits': lambda src, dst, size : pack('<III', src, dst, size) }
+
+	def compress(self, src):
+		stream = self.compressor()
+		return stream.feed(src)+stream.flush()
+
+	def compressor(self):
+		return PackBitsStreamCompressor(self)
+
+	def decompress(self, src, size):
+		dst = bytearray()
 		si = 0
-		while si<size:
+		while len(dst)<size:
 			hdr = src[si]
 			si += 1
 			if hdr<128:
 				dst += src[si:si+hdr+1]
 				si += hdr+1
 			else:
-				dst += src[si:si+1]*(256-hdr)
+				dst += bytes([src[si]])*(256-hdr)
 				si += 1
-		return dst
+		return bytes(dst)
 
 	def get_decompressor_align(self):
 		# TODO: arch-dependent
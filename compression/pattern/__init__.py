@@ -0,0 +1,117 @@
+'''
+Copyright (c) 2023, FlowSwitch <flowswitch@mail.ru>
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice,
+	this list of conditions and the following disclaimer.
+2. Redistributions in binary form must reproduce the above copyright
+   notice, this list of conditions and the following disclaimer in the
+   documentation and/or other materials provided with the distribution.
+3. The name of the author may not be used to endorse or promote products
+   derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+POSSIBILITY OF SUCH DAMAGE.
+'''
+
+
+__all__ = ["PatternAlgo", "PatternStreamCompressor"]
+
+from math import lcm
+from struct import pack, unpack_from
+from ..base import BaseCompressionAlgo, BaseStreamCompressor
+
+MAX_PERIOD = 64
+
+
+def periods(data, candidates):
+	'''Filter the candidate periods data is periodic with (data[i]==data[i-p]), memcmp speed per candidate'''
+	return [p for p in candidates if p<len(data) and data[p:]==data[:-p]]
+
+
+class PatternStreamCompressor(BaseStreamCompressor):
+	'''Keeps the pattern head and the last MAX_PERIOD bytes to check periodicity across chunk borders'''
+	def __init__(self, algo):
+		super().__init__(algo)
+		self.candidates = list(range(1, MAX_PERIOD+1))
+		self.head = b''
+		self.tail = b''
+		self.size = 0
+
+	def feed(self, chunk):
+		if not self.candidates or not chunk:
+			return b''
+		chunk = bytes(chunk)
+		data = self.tail+chunk
+		self.size += len(chunk)
+		if len(self.head)<4*MAX_PERIOD:
+			self.head = (self.head+chunk)[:4*MAX_PERIOD]
+		# a period longer than the data seen so far is still possible
+		self.candidates = [p for p in self.candidates if p>=len(data)] + periods(data, [p for p in self.candidates if p<len(data)])
+		self.candidates.sort()
+		self.tail = data[-MAX_PERIOD:]
+		return b''
+
+	def flush(self):
+		for p in self.candidates:
+			# store a whole number of words of the pattern, so the decompressor can copy it word by word
+			period = lcm(p, 4)
+			if period+4>=self.size or period>len(self.head):
+				continue
+			return pack('<I', period//4)+self.head[:period]
+		return None
+
+
+class PatternAlgo(BaseCompressionAlgo):
+	'''Multi-byte fill: the data repeats a pattern of up to MAX_PERIOD bytes.
+		Payload: u32 pattern length in words, the pattern extended to a multiple of 4 bytes
+	'''
+	name = 'pattern'
+	decode_cycles = 2 # word stores
+	decompressor_aliases = { '__scatterload_pattern': lambda src, dst, size : pack('<III', src, dst, size) }
+
+	def compress(self, src):
+		stream = self.compressor()
+		stream.feed(src)
+		return stream.flush()
+
+	def decompress(self, src, size):
+		nwords = unpack_from('<I', src)[0]
+		if not nwords:
+			raise ValueError('Empty pattern')
+		pattern = bytes(src[4:4+nwords*4])
+		if len(pattern)<nwords*4:
+			raise ValueError('Truncated pattern')
+		# the trailing bytes of a partial word continue the pattern as well
+		return (pattern*(size//len(pattern)+1))[:size]
+
+	def compressor(self):
+		return PatternStreamCompressor(self)
+
+	def suits(self, sample):
+		return bool(periods(sample, range(1, MAX_PERIOD+1)))
+
+	def get_decompressor_align(self):
+		# TODO: arch-dependent
+		# Cortex-M code w/o 32-bit fixed values wouldn't use literal pools, it is safe to align it to 2
+		return 2 
+
+	def get_data_align(self):
+		# The pattern is read as words
+		return 4 
+
+	def get_dst_align(self):
+		# Words are stored
+		return 4
@@ -0,0 +1,129 @@
+'''
+Copyright (c) 2023, FlowSwitch <flowswitch@mail.ru>
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice,
+	this list of conditions and the following disclaimer.
+2. Redistributions in binary form must reproduce the above copyright
+   notice, this list of conditions and the following disclaimer in the
+   documentation and/or other materials provided with the distribution.
+3. The name of the author may not be used to endorse or promote products
+   derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+POSSIBILITY OF SUCH DAMAGE.
+'''
+
+__all__ = ['PACK_FILE', 'DecompressorBlob', 'DecompressorRegistry', 'get_registry']
+
+import json
+import os.path
+from glob import glob
+from hashlib import sha256
+from struct import pack, unpack_from
+
+ROOT = os.path.dirname(os.path.realpath(__file__))
+PACK_FILE = os.path.join(ROOT, 'decompressors.pack') # all d_*.bin in one resource, built by python -m compression
+PACK_MAGIC = b'DREG'
+PACK_VERSION = 1
+
+
+class DecompressorBlob:
+	'''One shipped decompressor build: compression/<algo>/decompress/d_<arch>[_<variant>].bin'''
+	def __init__(self, algo, arch, variant, image, align=2):
+		self.algo = algo
+		self.arch = arch
+		self.variant = variant
+		self.image = image
+		self.align = align
+		self.size = len(image)
+		self.sha256 = sha256(image).hexdigest()
+
+	def describe(self):
+		return {'algo': self.algo, 'arch': self.arch, 'variant': self.variant, 'size': self.size, 'align': self.align, 'sha256': self.sha256}
+
+
+class DecompressorRegistry:
+	'''Index of all decompressor builds of the package, read once.
+		Loaded from PACK_FILE with a single read, or by scanning the d_*.bin files when there is no pack
+	'''
+	def __init__(self, blobs=()):
+		self.blobs = {(blob.algo, blob.arch, blob.variant): blob for blob in blobs}
+
+	def get(self, algo, arch, variant='size'):
+		'''returns: DecompressorBlob or None if not built'''
+		return self.blobs.get((algo, arch, variant))
+
+	def variants(self, algo, arch):
+		'''returns: dict - variant name -> DecompressorBlob'''
+		return {key[2]: blob for key, blob in self.blobs.items() if key[:2]==(algo, arch)}
+
+	@classmethod
+	def scan(cls, root=ROOT):
+		from . import algos # the algos define the decompressor alignment
+		classes = {algo.name: algo for algo in algos}
+		blobs = []
+		for path in sorted(glob(os.path.join(root, '*', 'decompress', 'd_*.bin'))):
+			algo = os.path.basename(os.path.dirname(os.path.dirname(path)))
+			arch, _, variant = os.path.basename(path)[2:-4].partition('_')
+			align = classes[algo](arch).get_decompressor_align() if algo in classes else 2
+			with open(path, 'rb') as f:
+				blobs.append(DecompressorBlob(algo, arch, variant or 'size', f.read(), align))
+		return cls(blobs)
+
+	@classmethod
+	def load(cls, path=PACK_FILE):
+		'''Read a pack written by save()'''
+		with open(path, 'rb') as f:
+			data = f.read()
+		if data[:4]!=PACK_MAGIC:
+			raise ValueError(path+' is not a decompressor pack')
+		version, header_size = unpack_from('<II', data, 4)
+		if version!=PACK_VERSION:
+			raise ValueError('Unsupported decompressor pack version %d' % version)
+		offset = 12+header_size
+		blobs = []
+		for info in json.loads(data[12:offset]):
+			blob = DecompressorBlob(info['algo'], info['arch'], info['variant'], data[offset:offset+info['size']], info['align'])
+			if blob.sha256!=info['sha256']:
+				raise ValueError('Corrupted decompressor pack '+path)
+			blobs.append(blob)
+			offset += blob.size
+		return cls(blobs)
+
+	def save(self, path=PACK_FILE):
+		'''Pack layout: magic, u32 version, u32 header size, JSON header (list of blob descriptions), images in header order'''
+		blobs = [self.blobs[key] for key in sorted(self.blobs)]
+		header = json.dumps([blob.describe() for blob in blobs]).encode()
+		with open(path, 'wb') as f:
+			f.write(PACK_MAGIC+pack('<II', PACK_VERSION, len(header))+header+b''.join(blob.image for blob in blobs))
+
+	def describe(self):
+		return [self.blobs[key].describe() for key in sorted(self.blobs)]
+
+
+_registry = None
+
+def get_registry():
+	'''The package registry, built on first use: from PACK_FILE if it exists, otherwise by scanning the d_*.bin files.
+		The pack is not checked against the .bin files, rebuild it with python -m compression (or make) after changing them
+	'''
+	global _registry
+	if _registry is None:
+		if os.path.exists(PACK_FILE):
+			_registry = DecompressorRegistry.load(PACK_FILE)
+		else:
+			_registry = DecompressorRegistry.scan()
+	return _registry
@@ -0,0 +1,132 @@
+'''
+Copyright (c) 2023, FlowSwitch <flowswitch@mail.ru>
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice,
+	this list of conditions and the following disclaimer.
+2. Redistributions in binary form must reproduce the above copyright
+   notice, this list of conditions and the following disclaimer in the
+   documentation and/or other materials provided with the distribution.
+3. The name of the author may not be used to endorse or promote products
+   derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+POSSIBILITY OF SUCH DAMAGE.
+'''
+
+
+__all__ = ["SparseAlgo", "SparseStreamCompressor"]
+
+import sys
+from array import array
+from struct import pack, unpack_from
+from ..base import BaseCompressionAlgo, BaseStreamCompressor
+
+GROUP = 32 # words per presence bitmap
+MIN_ZERO_SHARE = 0.25 # share of zero words in the sample needed to try the algo
+
+
+def words(data):
+	vals = array('I', data)
+	if sys.byteorder=='big':
+		vals.byteswap()
+	return vals
+
+
+class SparseStreamCompressor(BaseStreamCompressor):
+	'''Encodes whole groups of GROUP words as they arrive, keeps only an incomplete group'''
+	def __init__(self, algo):
+		super().__init__(algo)
+		self.pending = b''
+		self.size = 0
+
+	def encode(self, data):
+		vals = words(data)
+		out = array('I')
+		for start in range(0, len(vals), GROUP):
+			group = vals[start:start+GROUP]
+			bitmap = 0
+			present = array('I')
+			for i, val in enumerate(group):
+				if val:
+					bitmap |= 1<<i
+					present.append(val)
+			out.append(bitmap)
+			out += present
+		if sys.byteorder=='big':
+			out.byteswap()
+		return out.tobytes()
+
+	def feed(self, chunk):
+		self.size += len(chunk)
+		self.pending += bytes(chunk)
+		n = len(self.pending)//(GROUP*4)*(GROUP*4)
+		data = self.pending[:n]
+		self.pending = self.pending[n:]
+		return self.encode(data)
+
+	def flush(self):
+		if self.size % 4:
+			return None # only whole words are written
+		return self.encode(self.pending)
+
+
+class SparseAlgo(BaseCompressionAlgo):
+	'''Presence bitmap per GROUP words followed by the nonzero words of the group.
+		For mostly-zero word arrays, the decompressor clears and scatters with word stores
+	'''
+	name = 'sparse'
+	decode_cycles = 3 # bitmap scan and word stores
+	decompressor_aliases = { '__scatterload_sparse': lambda src, dst, size : pack('<III', src, dst, size) }
+
+	def compress(self, src):
+		stream = self.compressor()
+		out = stream.feed(src)
+		tail = stream.flush()
+		return None if tail is None else out+tail
+
+	def decompress(self, src, size):
+		n = size//4 # a partial word is not written
+		out = []
+		pos = 0
+		for start in range(0, n, GROUP):
+			count = min(GROUP, n-start)
+			bitmap = unpack_from('<I', src, pos)[0] & ((1<<count)-1)
+			present = iter(unpack_from('<%dI' % bitmap.bit_count(), src, pos+4))
+			pos += 4+bitmap.bit_count()*4
+			out += [next(present) if bitmap>>i & 1 else 0 for i in range(count)]
+		return pack('<%dI' % n, *out)
+
+	def compressor(self):
+		return SparseStreamCompressor(self)
+
+	def suits(self, sample):
+		n = len(sample)//4
+		if not n:
+			return False
+		return words(sample[:n*4]).count(0)>=n*MIN_ZERO_SHARE
+
+	def get_decompressor_align(self):
+		# TODO: arch-dependent
+		# Cortex-M code w/o 32-bit fixed values wouldn't use literal pools, it is safe to align it to 2
+		return 2 
+
+	def get_data_align(self):
+		# Bitmaps and values are read as words
+		return 4 
+
+	def get_dst_align(self):
+		# Words are stored
+		return 4
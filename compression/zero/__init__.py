@@ -29,11 +29,31 @@ POSSIBILITY OF SUCH DAMAGE.
 __all__ = ["ZeroAlgo"]
 
 from struct import pack
-from ..base import BaseCompressionAlgo
+from ..base import BaseCompressionAlgo, BaseStreamCompressor
+
+
+class ZeroStreamCompressor(BaseStreamCompressor):
+	def __init__(self, algo):
+		super().__init__(algo)
+		self.size = 0
+		self.match = True
+
+	def feed(self, chunk):
+		if self.match and chunk.count(0)!=len(chunk):
+			self.match = False
+		self.size += len(chunk)
+		return b''
+
+	def flush(self):
+		if not self.size:
+			return b''
+		return 0 if self.match else None
 
 
 class ZeroAlgo(BaseCompressionAlgo):
 	name = 'zero'
+	decompressor_variants = { 'size': 1, 'speed': 4 } # word-wide unrolled loop
+	decode_cycles = 4 # byte loop
 	decompressor_aliases = { '__scatterload_zeroinit' : lambda src, dst, size : pack('<III', 0, dst, size), 
 							'__aeabi_memclr' : lambda src, dst, size : pack('<III', dst, size, 0),
 							'__aeabi_memset' : lambda src, dst, size : pack('<III', dst, size, 0),
@@ -42,14 +62,15 @@ class ZeroAlgo(BaseCompressionAlgo):
 							}
 
 	def compress(self, src):
-		if len(src)==0:
-			return src
-
-		val = 0
-		for b in src:
-			if b!=val:
-				return None
-		return val
+		stream = self.compressor()
+		stream.feed(src)
+		return stream.flush()
+
+	def decompress(self, src, size):
+		return bytes(size)
+
+	def compressor(self):
+		return ZeroStreamCompressor(self)
 
 	def get_decompressor_align(self):
 		# TODO: arch-dependent
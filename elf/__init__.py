@@ -38,13 +38,14 @@ from .segment import *
 from .section import *
 from .symbol_table import *
 from .string_table import *
+from .flash_image import *
+from .builder import *
 
 
 class ELF:
     def __init__(self, data=None, readonly=True):
         if not data:
-            # TODO: empty ELF creation
-            raise NotImplementedError("ELF creation is not supported")
+            raise NotImplementedError("ELF creation is not supported, synthesize an image with ELFBuilder")
         self.readonly = readonly
         self.unpack(data)
 
@@ -108,7 +109,86 @@ class ELF:
     def pack_sht(self):
         return b''.join([s.pack() for s in self.sections])
 
-    def pack(self):
+    def compact(self):
+        '''Relayout the file: trim the segments to the sections still holding data (after NOBITS conversions and
+            section shrinking), then place the segments and the sections outside them one after another
+            at the lowest offsets their alignment allows. Addresses are not changed
+        '''
+        for seg in self.segments:
+            if not seg.filesz:
+                continue
+            inside = [sct for sct in self.sections if sct.flags & SHF.ALLOC and sct.size and seg.contains_va(sct.addr)]
+            if not inside:
+                continue
+            end = max([sct.addr+sct.size-seg.vaddr for sct in inside if sct.has_data()], default=0)
+            if end<seg.filesz:
+                logging.debug("Segment %X: file size %X -> %X" % (seg.vaddr, seg.filesz, end))
+                seg.filesz = end
+                seg.payload = seg.payload[:end]
+
+        header_end = max(self.header.ehsize, self.header.phoff+len(self.segments)*self.header.phentsize)
+        # movable file ranges: (start, end, align, address) of the segments not nested into another one
+        # (i.e. PT_ARM_EXIDX inside a PT_LOAD) and of the sections with data outside the segments
+        ranges = {}
+        for seg in self.segments:
+            if seg.filesz:
+                ranges.setdefault((seg.offset, seg.offset+seg.filesz), (max(seg.align, 1), seg.vaddr))
+        def nested(start, end, outer):
+            return any(ostart<=start and end<=oend and (ostart, oend)!=(start, end) for ostart, oend in outer)
+        blocks = [(start, end)+ranges[(start, end)] for start, end in ranges if not nested(start, end, ranges)]
+        for sct in self.sections:
+            start, end = sct.offset, sct.offset+sct.size
+            if sct.has_data() and sct.size and not any(bstart<=start and end<=bend for bstart, bend, align, addr in blocks):
+                blocks.append((start, end, max(sct.align, 1), 0))
+        blocks.sort()
+        if any(blocks[idx][1]>blocks[idx+1][0] for idx in range(len(blocks)-1)):
+            logging.warning("Overlapping file ranges, keeping the ELF layout")
+            return
+
+        moves = [] # (old start, old end, delta)
+        cursor = header_end
+        for start, end, align, addr in blocks:
+            if start<header_end: # covers the headers, stays in place
+                cursor = max(cursor, end)
+                moves.append((start, end, 0))
+                continue
+            offset = cursor+(addr-cursor) % align
+            moves.append((start, end, offset-start))
+            cursor = offset+end-start
+
+        def relocate(offset, size):
+            for start, end, delta in moves:
+                if start<=offset and offset+size<=end:
+                    return offset+delta
+            return None
+
+        for seg in self.segments:
+            new = relocate(seg.offset, seg.filesz) if seg.filesz else None
+            if new is not None:
+                seg.offset = new
+            elif seg.offset>=header_end: # nothing in the file, keep the offset congruent to the address
+                seg.offset = cursor+(seg.vaddr-cursor) % max(seg.align, 1)
+        for sct in self.sections:
+            if sct.typ==SHT.NULL:
+                continue
+            if sct.has_data() and sct.size:
+                new = relocate(sct.offset, sct.size)
+                if new is not None:
+                    sct.offset = new
+                continue
+            # no data: next to its address inside a segment, or at the end
+            seg = self.find_segment_by_va(sct.addr) if sct.flags & SHF.ALLOC else None
+            if seg and sct.offset>=header_end:
+                sct.offset = seg.offset+sct.addr-seg.vaddr
+            elif sct.offset>=header_end:
+                sct.offset = cursor
+
+    def pack(self, compact=False):
+        '''Build the ELF file image
+            param: compact - relayout the file first, dropping the unused payload ranges, see compact()
+        '''
+        if compact:
+            self.compact()
         # determine image size needed to fit all segments/sections
         # we can't just append all segments sequentially, they can be unordered
         self.image_size = 0
@@ -0,0 +1,251 @@
+'''
+Copyright (c) 2023, FlowSwitch <flowswitch@mail.ru>
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice,
+	this list of conditions and the following disclaimer.
+2. Redistributions in binary form must reproduce the above copyright
+   notice, this list of conditions and the following disclaimer in the
+   documentation and/or other materials provided with the distribution.
+3. The name of the author may not be used to endorse or promote products
+   derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+POSSIBILITY OF SUCH DAMAGE.
+'''
+
+__all__ = ['PATTERNS', 'ELFBuilder', 'make_pattern', 'synthesize']
+
+from struct import pack
+
+from .common import *
+from .section import SHT, SHF
+from .segment import PT, PF
+from .symbol_table import STB, STT
+
+EM_ARM = 40
+EF_ARM_EABI5_SOFT = 0x5000200 # EABI v5, soft-float
+SHN_ABS = 0xFFF1
+
+PATTERNS = ('zero', 'fill', 'text', 'counter', 'sparse', 'random', 'mixed')
+
+
+class BuilderSection:
+    def __init__(self, name, typ, flags, addr, data, size, align):
+        self.name = name
+        self.typ = typ
+        self.flags = flags
+        self.addr = addr
+        self.data = data
+        self.size = size
+        self.align = align
+        self.offset = 0
+
+
+class ELFBuilder:
+    '''Synthesizes little-endian 32-bit ARM executables: sections, program headers and a symbol table,
+        i.e. test inputs for comp.py without a toolchain. Parse the result with ELF()
+    '''
+    def __init__(self, entry=0, machine=EM_ARM, flags=EF_ARM_EABI5_SOFT):
+        self.entry = entry
+        self.machine = machine
+        self.flags = flags
+        self.sections = []
+        self.segments = [] # (section names, paddr, flags, align, typ)
+        self.symbols = [] # (name, value, size, typ, bind, section)
+
+    def add_section(self, name, addr, data=None, size=None, flags=SHF.ALLOC, align=4, typ=None):
+        '''Add a PROGBITS section holding data, or a NOBITS one of size bytes if data is None
+            returns: section index in the output
+        '''
+        if typ is None:
+            typ = SHT.NOBITS if data is None else SHT.PROGBITS
+        if data is not None:
+            data = bytes(data)
+            size = len(data)
+        self.sections.append(BuilderSection(name, typ, flags, addr, data, size or 0, align))
+        return len(self.sections)
+
+    def add_segment(self, sections, paddr=None, flags=PF.R, align=4, typ=PT.LOAD):
+        '''Add a segment covering the named sections, loaded at paddr (the run address if None).
+            Nested into the earlier ones if they cover all of its sections already
+        '''
+        self.segments.append((list(sections), paddr, flags, align, typ))
+
+    def add_symbol(self, name, value, size=0, typ=STT.OBJECT, bind=STB.GLOBAL, section=None):
+        '''param: section - name or index of the section defining the symbol, None for an absolute one'''
+        self.symbols.append((name, value, size, typ, bind, section))
+
+    def add_init_table(self, addr, ranges, capacity, name='.idata', symbol='__data_init_table'):
+        '''Add the linker-made init table placeholder comp.py expects: dd n_entries, {src, dst, size, pfn}[n_entries],
+            padded with 0xFF to capacity bytes
+            param: ranges - list of (dst, size, initialized), src is dst for initialized data and 0 for bss
+        '''
+        table = pack('<I', len(ranges))
+        for dst, size, initialized in ranges:
+            table += pack('<4I', dst if initialized else 0, dst, size, 0)
+        if len(table)>capacity:
+            raise ELFError("Init table of %d entries does not fit into %X bytes" % (len(ranges), capacity))
+        index = self.add_section(name, addr, table+b'\xFF'*(capacity-len(table)))
+        self.add_symbol(symbol, addr, 0, STT.NOTYPE, STB.GLOBAL, index)
+        return index
+
+    def section_index(self, section):
+        if isinstance(section, int):
+            return section
+        for idx, sct in enumerate(self.sections):
+            if sct.name==section:
+                return idx+1
+        raise ELFError("No section "+str(section))
+
+    def build(self):
+        '''returns: bytes - the ELF file'''
+        phnum = len(self.segments)
+        out = bytearray(0x34+0x20*phnum)
+        def place(data, align, congruent=0):
+            offset = len(out)+(congruent-len(out)) % max(align, 1)
+            out.extend(b'\0'*(offset-len(out)))
+            out.extend(data)
+            return offset
+
+        # segments as a whole, so that offset-vaddr is the same for all of their sections.
+        # A segment of sections placed by an earlier one already (PT_ARM_EXIDX inside a PT_LOAD) is nested into it
+        phdrs = []
+        placed = set()
+        for names, paddr, flags, align, typ in self.segments:
+            scts = sorted((self.sections[self.section_index(name)-1] for name in names), key=lambda sct: sct.addr)
+            vaddr = scts[0].addr
+            memsz = max(sct.addr+sct.size for sct in scts)-vaddr
+            filesz = max([sct.addr+sct.size-vaddr for sct in scts if sct.typ!=SHT.NOBITS], default=0)
+            if all(id(sct) in placed for sct in scts):
+                phdrs.append(pack('<8I', typ, scts[0].offset, vaddr, vaddr if paddr is None else paddr, filesz, memsz, flags, align))
+                continue
+            image = bytearray(filesz)
+            for sct in scts:
+                if sct.typ!=SHT.NOBITS:
+                    image[sct.addr-vaddr:sct.addr-vaddr+sct.size] = sct.data
+            offset = place(image, align, vaddr)
+            for sct in scts:
+                sct.offset = offset+sct.addr-vaddr
+                placed.add(id(sct))
+            phdrs.append(pack('<8I', typ, offset, vaddr, vaddr if paddr is None else paddr, filesz, memsz, flags, align))
+        for sct in self.sections:
+            if id(sct) not in placed:
+                sct.offset = len(out) if sct.typ==SHT.NOBITS else place(sct.data, sct.align)
+
+        shstrtab = bytearray(b'\0')
+        def shname(name):
+            shstrtab.extend(name.encode()+b'\0')
+            return len(shstrtab)-len(name)-1
+        strtab = bytearray(b'\0')
+        symtab = bytearray(16)
+        # locals first, sh_info is the index of the first global
+        symbols = sorted(self.symbols, key=lambda sym: sym[4]!=STB.LOCAL)
+        n_local = 1+sum(sym[4]==STB.LOCAL for sym in symbols)
+        for name, value, size, typ, bind, section in symbols:
+            shndx = SHN_ABS if section is None else self.section_index(section)
+            symtab += pack('<IIIBBH', len(strtab), value, size, (bind<<4) | typ, 0, shndx)
+            strtab += name.encode()+b'\0'
+
+        k = len(self.sections)
+        shdrs = [b'\0'*40]
+        for sct in self.sections:
+            shdrs.append(pack('<10I', shname(sct.name), sct.typ, sct.flags, sct.addr, sct.offset, sct.size, 0, 0, sct.align, 0))
+        names = [shname('.shstrtab'), shname('.symtab'), shname('.strtab')]
+        offset = place(shstrtab, 1)
+        shdrs.append(pack('<10I', names[0], SHT.STRTAB, 0, 0, offset, len(shstrtab), 0, 0, 1, 0))
+        offset = place(symtab, 4)
+        shdrs.append(pack('<10I', names[1], SHT.SYMTAB, 0, 0, offset, len(symtab), k+3, n_local, 4, 16))
+        offset = place(strtab, 1)
+        shdrs.append(pack('<10I', names[2], SHT.STRTAB, 0, 0, offset, len(strtab), 0, 0, 1, 0))
+        shoff = place(b''.join(shdrs), 4)
+
+        out[0:0x34] = b'\x7FELF'+bytes([1, 1, 1, 0, 0])+b'\0'*7+pack('<HHIIIIIHHHHHH', 2, self.machine, 1, self.entry,
+            0x34 if phnum else 0, shoff, self.flags, 0x34, 0x20, phnum, 40, len(shdrs), k+1)
+        out[0x34:0x34+0x20*phnum] = b''.join(phdrs)
+        return bytes(out)
+
+
+def make_pattern(pattern, size, rnd):
+    '''Init data of a kind comp.py meets in firmware
+        param: pattern - one of PATTERNS but 'mixed'
+        param: rnd - random.Random
+    '''
+    if pattern=='zero':
+        return bytes(size)
+    if pattern=='fill':
+        return bytes([rnd.randrange(1, 256)])*size
+    if pattern=='text':
+        words = [b'error', b'state', b'config', b'timeout', b'sensor', b'%d', b'\n', b'\0', b'OK', b'retry']
+        out = bytearray()
+        while len(out)<size:
+            out += rnd.choice(words)+b' '
+        return bytes(out[:size])
+    if pattern=='counter':
+        start, step = rnd.randrange(0x10000), rnd.randrange(1, 64)
+        return b''.join(pack('<I', (start+step*idx) & 0xFFFFFFFF) for idx in range((size+3)//4))[:size]
+    if pattern=='sparse':
+        out = bytearray(size)
+        for pos in range(0, size-3, 4):
+            if rnd.random()<0.1:
+                out[pos:pos+4] = pack('<I', rnd.getrandbits(32))
+        return bytes(out)
+    if pattern=='random':
+        return rnd.randbytes(size)
+    raise ValueError('Unknown data pattern '+str(pattern))
+
+
+def synthesize(data_size=0x1000, n_sections=1, n_symbols=16, pattern='mixed', seed=1, flash=0x08000000, ram=0x20000000,
+    code_size=0x400, idata_size=None):
+    '''A firmware-like ELF: .text and the .idata table placeholder in flash, n_sections initialized data sections
+        totalling data_size bytes plus a .bss in RAM, each RAM section in its own segment and listed in the init table,
+        n_symbols objects spread over them
+        param: pattern - one of PATTERNS, 'mixed' cycles through the others per section
+        returns: bytes - the ELF file
+    '''
+    import random
+
+    rnd = random.Random(seed)
+    builder = ELFBuilder(entry=flash+1)
+    builder.add_section('.text', flash, rnd.randbytes(code_size), flags=SHF.ALLOC | SHF.EXECINSTR)
+    kinds = [kind for kind in PATTERNS if kind!='mixed']
+    names = ['.data%d' % (idx) for idx in range(n_sections)]+['.bss']
+    ranges = []
+    addr = ram
+    for idx, name in enumerate(names):
+        if idx<n_sections:
+            size = data_size//n_sections+(idx<data_size % n_sections)
+            kind = kinds[idx % len(kinds)] if pattern=='mixed' else pattern
+            builder.add_section(name, addr, make_pattern(kind, size, rnd), flags=SHF.ALLOC | SHF.WRITE)
+        else:
+            size = max(data_size//4, 4) & ~3
+            builder.add_section(name, addr, size=size, flags=SHF.ALLOC | SHF.WRITE)
+        ranges.append((addr, size, idx<n_sections))
+        addr = (addr+size+3) & ~3
+    if idata_size is None:
+        idata_size = 4+16*len(ranges)+data_size+data_size//8+0x1000
+    idata_addr = (flash+code_size+3) & ~3
+    builder.add_init_table(idata_addr, ranges, idata_size)
+    builder.add_segment(['.text', '.idata'], flags=PF.R | PF.X)
+    for name in names:
+        builder.add_segment([name], flags=PF.R | PF.W)
+    builder.add_symbol('Reset_Handler', flash+1, 2, STT.FUNC, STB.GLOBAL, '.text')
+    for idx in range(n_symbols):
+        name = names[idx % len(names)]
+        dst, size, initialized = ranges[idx % len(names)]
+        offset = rnd.randrange(size) & ~3 if size else 0
+        builder.add_symbol('obj_%d' % (idx), dst+offset, min(4, size-offset), STT.OBJECT,
+            STB.LOCAL if idx % 3==0 else STB.GLOBAL, name)
+    return builder.build()
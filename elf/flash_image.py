@@ -0,0 +1,109 @@
+'''
+Copyright (c) 2023, FlowSwitch <flowswitch@mail.ru>
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice,
+	this list of conditions and the following disclaimer.
+2. Redistributions in binary form must reproduce the above copyright
+   notice, this list of conditions and the following disclaimer in the
+   documentation and/or other materials provided with the distribution.
+3. The name of the author may not be used to endorse or promote products
+   derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+POSSIBILITY OF SUCH DAMAGE.
+'''
+
+__all__ = ['flash_chunks', 'write_bin', 'write_hex']
+
+from struct import pack
+
+from .common import *
+from .section import SHF
+from .segment import PT
+
+GAP_BLOCK = 0x10000 # gap filling is written in pieces of this size
+
+
+def flash_chunks(elf):
+    '''Flash contents as objcopy sees them: the loadable sections of PT_LOAD segments at their physical addresses.
+        NOBITS sections and the data past a shrunk section size are left out
+        returns: list of (address, bytes) sorted by address, adjacent pieces merged
+    '''
+    pieces = []
+    for sct in elf.sections:
+        if not sct.flags & SHF.ALLOC or not sct.has_data() or not sct.size:
+            continue
+        for seg in elf.segments:
+            if seg.typ==PT.LOAD and seg.filesz and seg.vaddr<=sct.addr and sct.addr+sct.size<=seg.vaddr+seg.filesz:
+                pieces.append((seg.paddr+sct.addr-seg.vaddr, sct.payload[:sct.size]))
+                break
+    pieces.sort(key=lambda piece: piece[0])
+    chunks = []
+    for addr, data in pieces:
+        if chunks:
+            last_addr, last_data = chunks[-1]
+            end = last_addr+len(last_data)
+            if addr<end:
+                raise ELFError("Load images overlap at %X" % (addr))
+            if addr==end:
+                last_data += data
+                continue
+        chunks.append((addr, bytearray(data)))
+    return [(addr, bytes(data)) for addr, data in chunks]
+
+
+def write_bin(elf, f, gap_fill=0):
+    '''Stream a raw binary (objcopy -O binary) starting at the lowest load address to the file object f
+        returns: base address of the image, None if there is nothing to load
+    '''
+    chunks = flash_chunks(elf)
+    if not chunks:
+        return None
+    base = pos = chunks[0][0]
+    fill = bytes([gap_fill])*GAP_BLOCK
+    for addr, data in chunks:
+        while pos<addr:
+            n = min(addr-pos, GAP_BLOCK)
+            f.write(fill[:n])
+            pos += n
+        f.write(data)
+        pos += len(data)
+    return base
+
+
+def hex_record(typ, addr, data=b''):
+    record = pack('>BHB', len(data), addr, typ)+data
+    return (':%s%02X\r\n' % (record.hex().upper(), -sum(record) & 0xFF)).encode()
+
+
+def write_hex(elf, f, record_size=16):
+    '''Stream Intel HEX (objcopy -O ihex) to the binary file object f: data records, extended linear address records
+        on every 64 KiB boundary and a start linear address record for the entry point
+    '''
+    upper = 0
+    for addr, data in flash_chunks(elf):
+        pos = 0
+        while pos<len(data):
+            if (addr+pos)>>16!=upper:
+                upper = (addr+pos)>>16
+                f.write(hex_record(4, 0, pack('>H', upper)))
+            offset = (addr+pos) & 0xFFFF
+            n = min(record_size, len(data)-pos, 0x10000-offset)
+            f.write(hex_record(0, offset, data[pos:pos+n]))
+            pos += n
+    if elf.header.entry:
+        f.write(hex_record(5, 0, pack('>I', elf.header.entry)))
+    f.write(hex_record(1, 0))
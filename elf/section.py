@@ -26,7 +26,7 @@ ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 POSSIBILITY OF SUCH DAMAGE.
 '''
 
-__all__ = ['SHT', 'ELFSection', 'ELFSectionTable']
+__all__ = ['SHT', 'SHF', 'ELFSection', 'ELFSectionTable']
 
 from struct import pack, unpack_from, calcsize
 from enum import IntEnum, IntFlag
@@ -0,0 +1,60 @@
+'''
+Copyright (c) 2023, FlowSwitch <flowswitch@mail.ru>
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice,
+	this list of conditions and the following disclaimer.
+2. Redistributions in binary form must reproduce the above copyright
+   notice, this list of conditions and the following disclaimer in the
+   documentation and/or other materials provided with the distribution.
+3. The name of the author may not be used to endorse or promote products
+   derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+POSSIBILITY OF SUCH DAMAGE.
+'''
+
+__all__ = ['CYCLE_TABLES', 'ARCH_PROFILES']
+
+# Per-core instruction timings in cycles, after the cores' Technical Reference Manuals,
+# assuming zero wait-state memory and a pipeline refill of 1 cycle (P=1) on ARMv7-M.
+#   alu       - data processing, moves, extends, IT, hints
+#   mul       - MUL/MLA/MLS
+#   div       - SDIV/UDIV (2..12 on M3/M4, early-terminating; the middle is taken)
+#   load      - single LDR*/LDRD adds one more access
+#   store     - single STR*
+#   multi     - LDM/STM/PUSH/POP base cost, +1 per transferred register
+#   pc_load   - extra cycles when LDM/POP/LDR writes the PC
+#   branch    - taken B/Bcc/CBZ/TBB
+#   branch_nt - not taken conditional branch, also an instruction skipped by IT
+#   bl        - BL
+#   bx        - BX/BLX
+# Cortex-M7 is dual-issue with a branch predictor, its numbers are the single-issue bound
+CYCLE_TABLES = {
+    'cortex-m0':     dict(alu=1, mul=1, div=None, load=2, store=2, multi=1, pc_load=3, branch=3, branch_nt=1, bl=4, bx=3),
+    'cortex-m0plus': dict(alu=1, mul=1, div=None, load=2, store=2, multi=1, pc_load=2, branch=2, branch_nt=1, bl=3, bx=2),
+    'cortex-m3':     dict(alu=1, mul=1, div=7,    load=2, store=1, multi=1, pc_load=1, branch=2, branch_nt=1, bl=2, bx=2),
+    'cortex-m4':     dict(alu=1, mul=1, div=7,    load=2, store=1, multi=1, pc_load=1, branch=2, branch_nt=1, bl=2, bx=2),
+    'cortex-m7':     dict(alu=1, mul=1, div=7,    load=1, store=1, multi=1, pc_load=1, branch=1, branch_nt=1, bl=1, bx=2),
+}
+
+# Instruction set of each core: 'v6m' is the Thumb subset of ARMv6-M, 'v7m' adds Thumb-2
+ARCH_PROFILES = {
+    'cortex-m0': 'v6m',
+    'cortex-m0plus': 'v6m',
+    'cortex-m3': 'v7m',
+    'cortex-m4': 'v7m',
+    'cortex-m7': 'v7m',
+}
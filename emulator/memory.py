@@ -0,0 +1,124 @@
+'''
+Copyright (c) 2023, FlowSwitch <flowswitch@mail.ru>
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice,
+	this list of conditions and the following disclaimer.
+2. Redistributions in binary form must reproduce the above copyright
+   notice, this list of conditions and the following disclaimer in the
+   documentation and/or other materials provided with the distribution.
+3. The name of the author may not be used to endorse or promote products
+   derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+POSSIBILITY OF SUCH DAMAGE.
+'''
+
+__all__ = ['EmulatorError', 'MemoryRegion', 'Memory']
+
+from bisect import bisect_right
+
+
+class EmulatorError(Exception):
+    pass
+
+
+class MemoryRegion:
+    def __init__(self, start, data, writable=False, name=''):
+        self.start = start
+        self.data = data if writable else bytes(data)
+        self.end = start+len(data)
+        self.writable = writable
+        self.name = name
+
+    def __repr__(self):
+        return '%s@%08X[%X]%s' % (self.name or 'region', self.start, len(self.data), '' if self.writable else ' ro')
+
+
+class Memory:
+    '''Flat little-endian address space made of non-overlapping regions'''
+    def __init__(self):
+        self.regions = []
+        self.starts = []
+        self.last = None # most recently hit region, accesses are mostly sequential
+
+    def map(self, start, data, writable=False, name=''):
+        '''Map data (bytes, or a size for a zero-filled region) at start
+            returns: MemoryRegion
+        '''
+        if isinstance(data, int):
+            data = bytearray(data)
+        elif writable:
+            data = bytearray(data)
+        region = MemoryRegion(start, data, writable, name)
+        idx = bisect_right(self.starts, start)
+        if (idx and self.regions[idx-1].end>start) or (idx<len(self.regions) and self.regions[idx].start<region.end):
+            raise EmulatorError('Region %r overlaps an existing one' % (region))
+        self.regions.insert(idx, region)
+        self.starts.insert(idx, start)
+        return region
+
+    def find(self, addr):
+        '''Region containing addr or None'''
+        idx = bisect_right(self.starts, addr)
+        if idx and addr<self.regions[idx-1].end:
+            return self.regions[idx-1]
+        return None
+
+    def free_range(self, size, align=0x1000, above=0):
+        '''Lowest unmapped aligned address range of size bytes above the given address'''
+        addr = (above+align-1) & -align
+        for region in self.regions:
+            if region.end<=addr:
+                continue
+            if region.start>=addr+size:
+                break
+            addr = (region.end+align-1) & -align
+        if addr+size>0x100000000:
+            raise EmulatorError('No free address range of size %X' % (size))
+        return addr
+
+    def locate(self, addr, size):
+        region = self.last
+        if region is None or addr<region.start or addr+size>region.end:
+            region = self.find(addr)
+            if region is None or addr+size>region.end:
+                raise EmulatorError('Access to unmapped memory @%08X[%d]' % (addr, size))
+            self.last = region
+        return region
+
+    def read(self, addr, size):
+        region = self.locate(addr, size)
+        ofs = addr-region.start
+        return int.from_bytes(region.data[ofs:ofs+size], 'little')
+
+    def write(self, addr, size, value):
+        region = self.locate(addr, size)
+        if not region.writable:
+            raise EmulatorError('Write to read-only memory @%08X' % (addr))
+        ofs = addr-region.start
+        region.data[ofs:ofs+size] = (value & ((1<<(size*8))-1)).to_bytes(size, 'little')
+
+    def read_bytes(self, addr, size):
+        region = self.locate(addr, size)
+        ofs = addr-region.start
+        return bytes(region.data[ofs:ofs+size])
+
+    def write_bytes(self, addr, data):
+        region = self.locate(addr, len(data))
+        if not region.writable:
+            raise EmulatorError('Write to read-only memory @%08X' % (addr))
+        ofs = addr-region.start
+        region.data[ofs:ofs+len(data)] = data
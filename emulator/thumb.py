@@ -0,0 +1,963 @@
+'''
+Copyright (c) 2023, FlowSwitch <flowswitch@mail.ru>
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice,
+	this list of conditions and the following disclaimer.
+2. Redistributions in binary form must reproduce the above copyright
+   notice, this list of conditions and the following disclaimer in the
+   documentation and/or other materials provided with the distribution.
+3. The name of the author may not be used to endorse or promote products
+   derived from this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+POSSIBILITY OF SUCH DAMAGE.
+'''
+
+__all__ = ['ThumbCPU']
+
+from .memory import EmulatorError
+from .cycles import CYCLE_TABLES, ARCH_PROFILES
+
+M32 = 0xFFFFFFFF
+
+SHIFT_LSL, SHIFT_LSR, SHIFT_ASR, SHIFT_ROR, SHIFT_RRX = range(5)
+
+
+def sign_extend(value, bits):
+    sign = 1<<(bits-1)
+    return (value & (sign-1))-(value & sign)
+
+
+def add_with_carry(x, y, carry):
+    '''returns: (result, carry, overflow) of x+y+carry'''
+    total = x+y+carry
+    result = total & M32
+    return result, total>>32, (((x ^ result) & (y ^ result))>>31) & 1
+
+
+def shift_c(value, typ, amount, carry):
+    '''returns: (result, carry out) of an ARM barrel shifter operation'''
+    if typ==SHIFT_RRX:
+        return (carry<<31) | (value>>1), value & 1
+    if not amount:
+        return value, carry
+    if typ==SHIFT_LSL:
+        if amount>32:
+            return 0, 0
+        return (value<<amount) & M32, (value>>(32-amount)) & 1
+    if typ==SHIFT_LSR:
+        if amount>32:
+            return 0, 0
+        return value>>amount, (value>>(amount-1)) & 1
+    if typ==SHIFT_ASR:
+        if amount>=32:
+            return (M32 if value>>31 else 0), value>>31
+        signed = value-((value & 0x80000000)<<1)
+        return (signed>>amount) & M32, (signed>>(amount-1)) & 1
+    # ROR
+    amount &= 31
+    if not amount:
+        return value, value>>31
+    result = ((value>>amount) | (value<<(32-amount))) & M32
+    return result, result>>31
+
+
+def decode_imm_shift(typ, imm5):
+    '''returns: (shift type, amount) of an immediate shift field'''
+    if typ==SHIFT_LSL:
+        return SHIFT_LSL, imm5
+    if typ==SHIFT_ROR:
+        return (SHIFT_ROR, imm5) if imm5 else (SHIFT_RRX, 1)
+    return typ, imm5 or 32
+
+
+def thumb_expand_imm_c(imm12, carry):
+    '''returns: (value, carry out) of a Thumb-2 modified immediate'''
+    if not imm12>>10:
+        byte = imm12 & 0xFF
+        return (byte, byte<<16 | byte, byte<<24 | byte<<8, byte*0x01010101)[(imm12>>8) & 3], carry
+    return shift_c(0x80 | (imm12 & 0x7F), SHIFT_ROR, imm12>>7, carry)
+
+
+def condition_passed(cpu, cond):
+    base = cond>>1
+    if base==0:
+        result = cpu.z
+    elif base==1:
+        result = cpu.c
+    elif base==2:
+        result = cpu.n
+    elif base==3:
+        result = cpu.v
+    elif base==4:
+        result = cpu.c and not cpu.z
+    elif base==5:
+        result = cpu.n==cpu.v
+    elif base==6:
+        result = cpu.n==cpu.v and not cpu.z
+    else:
+        return True
+    return bool(result)!=bool(cond & 1)
+
+
+def reg_list(bits):
+    return [i for i in range(16) if bits>>i & 1]
+
+
+class ThumbCPU:
+    '''Instruction-level ARMv6-M/ARMv7-M Thumb interpreter with a per-core cycle estimate.
+        Covers the integer instructions compiled C code uses; no exceptions, FPU or system registers
+    '''
+    RETURN_ADDRESS = 0xFFFFFFFE # LR value of call(), reaching it ends the run
+
+    def __init__(self, arch, memory):
+        if arch not in CYCLE_TABLES:
+            raise EmulatorError('Unsupported architecture '+str(arch))
+        self.arch = arch
+        self.v7 = ARCH_PROFILES[arch]=='v7m'
+        self.timing = CYCLE_TABLES[arch]
+        self.mem = memory
+        self.r = [0]*16
+        self.n = self.z = self.c = self.v = 0
+        self.itstate = 0
+        self.in_it = False
+        self.next_pc = 0
+        self.cycles = 0
+        self.instructions = 0
+        self.decoded = {} # address -> (handler, size), code is assumed not to change
+        self.stack_top = None # set by run_function()
+
+    def call(self, address, args=(), sp=None, max_instructions=100000000):
+        '''Run the function at address with args in r0-r3 until it returns
+            returns: int - cycles spent
+        '''
+        r = self.r
+        for i, arg in enumerate(args):
+            r[i] = arg & M32
+        if sp is not None:
+            r[13] = sp
+        r[14] = self.RETURN_ADDRESS | 1
+        self.itstate = 0
+        pc = address & ~1
+        start_cycles = self.cycles
+        decoded = self.decoded
+        branch_nt = self.timing['branch_nt']
+        cycles = 0
+        count = 0
+        while pc!=self.RETURN_ADDRESS:
+            entry = decoded.get(pc)
+            if entry is None:
+                entry = decoded[pc] = self.decode(pc)
+            handler, size = entry
+            self.next_pc = pc+size
+            count += 1
+            if self.itstate:
+                cond = self.itstate>>4
+                self.itstate = 0 if not self.itstate & 7 else (self.itstate & 0xE0) | ((self.itstate<<1) & 0x1F)
+                if condition_passed(self, cond):
+                    self.in_it = True
+                    cycles += handler()
+                    self.in_it = False
+                else:
+                    cycles += branch_nt
+            else:
+                cycles += handler()
+            pc = self.next_pc
+            if count>=max_instructions:
+                raise EmulatorError('Instruction limit reached @%08X' % (pc))
+        self.cycles += cycles
+        self.instructions += count
+        return self.cycles-start_cycles
+
+    # memory access helpers
+
+    def load(self, addr, size, multi=False):
+        if addr & (size-1) and (multi or not self.v7):
+            raise EmulatorError('Unaligned %d-byte load @%08X' % (size, addr))
+        return self.mem.read(addr, size)
+
+    def store(self, addr, size, value, multi=False):
+        if addr & (size-1) and (multi or not self.v7):
+            raise EmulatorError('Unaligned %d-byte store @%08X' % (size, addr))
+        self.mem.write(addr, size, value)
+
+    def branch(self, target):
+        self.next_pc = target & ~1
+
+    # decoder
+
+    def decode(self, pc):
+        hw = self.mem.read(pc, 2)
+        if hw>>11 in (0b11101, 0b11110, 0b11111):
+            hw2 = self.mem.read(pc+2, 2)
+            handler = self.decode32(hw, hw2, pc)
+            if handler is None:
+                raise EmulatorError('Unsupported instruction %04X %04X @%08X' % (hw, hw2, pc))
+            return handler, 4
+        handler = self.decode16(hw, pc)
+        if handler is None:
+            raise EmulatorError('Unsupported instruction %04X @%08X' % (hw, pc))
+        return handler, 2
+
+    def decode16(self, hw, pc):
+        cpu = self
+        r = self.r
+        t = self.timing
+        alu = t['alu']
+        top = hw>>11
+        if top<3: # LSL/LSR/ASR (immediate)
+            typ, amount = decode_imm_shift(top, (hw>>6) & 31)
+            rm = (hw>>3) & 7
+            rd = hw & 7
+            def op():
+                result, carry = shift_c(r[rm], typ, amount, cpu.c)
+                r[rd] = result
+                if not cpu.in_it:
+                    cpu.n = result>>31
+                    cpu.z = not result
+                    cpu.c = carry
+                return alu
+            return op
+        if top==3: # ADD/SUB (register/3-bit immediate)
+            imm = hw>>10 & 1
+            sub = hw>>9 & 1
+            operand = (hw>>6) & 7
+            rn = (hw>>3) & 7
+            rd = hw & 7
+            def op():
+                y = operand if imm else r[operand]
+                if sub:
+                    result, carry, overflow = add_with_carry(r[rn], y ^ M32, 1)
+                else:
+                    result, carry, overflow = add_with_carry(r[rn], y, 0)
+                r[rd] = result
+                if not cpu.in_it:
+                    cpu.n = result>>31
+                    cpu.z = not result
+                    cpu.c = carry
+                    cpu.v = overflow
+                return alu
+            return op
+        if top<8: # MOV/CMP/ADD/SUB (8-bit immediate)
+            kind = top & 3
+            rdn = (hw>>8) & 7
+            imm8 = hw & 0xFF
+            def op():
+                if kind==0:
+                    result = imm8
+                    r[rdn] = result
+                    if not cpu.in_it:
+                        cpu.n = 0
+                        cpu.z = not result
+                    return alu
+                if kind==2:
+                    result, carry, overflow = add_with_carry(r[rdn], imm8, 0)
+                else:
+                    result, carry, overflow = add_with_carry(r[rdn], imm8 ^ M32, 1)
+                if kind!=1:
+                    r[rdn] = result
+                if kind==1 or not cpu.in_it:
+                    cpu.n = result>>31
+                    cpu.z = not result
+                    cpu.c = carry
+                    cpu.v = overflow
+                return alu
+            return op
+        if hw>>10==0b010000: # data processing
+            return self.decode16_dp((hw>>6) & 15, (hw>>3) & 7, hw & 7)
+        if hw>>10==0b010001: # special data processing, branch and exchange
+            kind = (hw>>8) & 3
+            rm = (hw>>3) & 15
+            rdn = (hw & 7) | ((hw>>4) & 8)
+            pc_value = pc+4
+            if kind==3:
+                link = hw>>7 & 1
+                def op():
+                    target = pc_value if rm==15 else r[rm]
+                    if link:
+                        r[14] = (pc+2) | 1
+                    cpu.branch(target)
+                    return t['bx']
+                return op
+            def op():
+                y = pc_value if rm==15 else r[rm]
+                if kind==2: # MOV
+                    result = y
+                else:
+                    x = pc_value if rdn==15 else r[rdn]
+                    if kind==1: # CMP
+                        result, cpu.c, cpu.v = add_with_carry(x, y ^ M32, 1)
+                        cpu.n = result>>31
+                        cpu.z = not result
+                        return alu
+                    result = (x+y) & M32
+                if rdn==15:
+                    cpu.branch(result)
+                    return t['bx']
+                r[rdn] = result
+                return alu
+            return op
+        if top==0b01001: # LDR (literal)
+            rt = (hw>>8) & 7
+            addr = ((pc+4) & ~3)+(hw & 0xFF)*4
+            def op():
+                r[rt] = cpu.load(addr, 4)
+                return t['load']
+            return op
+        if top in (0b01010, 0b01011): # load/store (register offset)
+            kind = (hw>>9) & 7
+            rm = (hw>>6) & 7
+            rn = (hw>>3) & 7
+            rt = hw & 7
+            size = (4, 2, 1, 1, 4, 2, 1, 2)[kind]
+            signed = kind in (3, 7)
+            if kind<3:
+                def op():
+                    cpu.store((r[rn]+r[rm]) & M32, size, r[rt])
+                    return t['store']
+            else:
+                def op():
+                    value = cpu.load((r[rn]+r[rm]) & M32, size)
+                    r[rt] = sign_extend(value, size*8) & M32 if signed else value
+                    return t['load']
+            return op
+        if 0b01100<=top<=0b10001: # load/store (immediate offset)
+            size = (4, 4, 1, 1, 2, 2)[top-0b01100]
+            is_load = top & 1
+            offset = ((hw>>6) & 31)*size
+            rn = (hw>>3) & 7
+            rt = hw & 7
+            if is_load:
+                def op():
+                    r[rt] = cpu.load((r[rn]+offset) & M32, size)
+                    return t['load']
+            else:
+                def op():
+                    cpu.store((r[rn]+offset) & M32, size, r[rt])
+                    return t['store']
+            return op
+        if top in (0b10010, 0b10011): # LDR/STR (SP-relative)
+            rt = (hw>>8) & 7
+            offset = (hw & 0xFF)*4
+            if top & 1:
+                def op():
+                    r[rt] = cpu.load((r[13]+offset) & M32, 4)
+                    return t['load']
+            else:
+                def op():
+                    cpu.store((r[13]+offset) & M32, 4, r[rt])
+                    return t['store']
+            return op
+        if top==0b10100: # ADR
+            rd = (hw>>8) & 7
+            value = ((pc+4) & ~3)+(hw & 0xFF)*4
+            def op():
+                r[rd] = value
+                return alu
+            return op
+        if top==0b10101: # ADD (SP plus immediate)
+            rd = (hw>>8) & 7
+            offset = (hw & 0xFF)*4
+            def op():
+                r[rd] = (r[13]+offset) & M32
+                return alu
+            return op
+        if top in (0b10110, 0b10111):
+            return self.decode16_misc(hw, pc)
+        if top in (0b11000, 0b11001): # STM/LDM
+            rn = (hw>>8) & 7
+            regs = reg_list(hw & 0xFF)
+            if not regs:
+                return None
+            return self.make_multi(top & 1, rn, regs, False, top & 1==0 or rn not in regs)
+        if top in (0b11010, 0b11011): # conditional branch, SVC, UDF
+            cond = (hw>>8) & 15
+            if cond>=14:
+                return None
+            target = pc+4+sign_extend(hw & 0xFF, 8)*2
+            def op():
+                if condition_passed(cpu, cond):
+                    cpu.next_pc = target
+                    return t['branch']
+                return t['branch_nt']
+            return op
+        if top==0b11100: # B
+            target = (pc+4+sign_extend(hw & 0x7FF, 11)*2) & M32
+            def op():
+                cpu.next_pc = target
+                return t['branch']
+            return op
+        return None
+
+    def decode16_dp(self, opcode, rm, rdn):
+        cpu = self
+        r = self.r
+        alu = self.timing['alu']
+        mul = self.timing['mul']
+        def op():
+            x = r[rdn]
+            y = r[rm]
+            carry = cpu.c
+            overflow = cpu.v
+            write = True
+            cost = alu
+            if opcode==0: # AND
+                result = x & y
+            elif opcode==1: # EOR
+                result = x ^ y
+            elif opcode in (2, 3, 4, 7): # LSL/LSR/ASR/ROR (register)
+                result, carry = shift_c(x, (None, None, SHIFT_LSL, SHIFT_LSR, SHIFT_ASR, None, None, SHIFT_ROR)[opcode], y & 0xFF, carry)
+            elif opcode==5: # ADC
+                result, carry, overflow = add_with_carry(x, y, carry)
+            elif opcode==6: # SBC
+                result, carry, overflow = add_with_carry(x, y ^ M32, carry)
+            elif opcode==8: # TST
+                result = x & y
+                write = False
+            elif opcode==9: # RSB #0
+                result, carry, overflow = add_with_carry(y ^ M32, 0, 1)
+            elif opcode==10: # CMP
+                result, carry, overflow = add_with_carry(x, y ^ M32, 1)
+                write = False
+            elif opcode==11: # CMN
+                result, carry, overflow = add_with_carry(x, y, 0)
+                write = False
+            elif opcode==12: # ORR
+                result = x | y
+            elif opcode==13: # MUL
+                result = (x*y) & M32
+                cost = mul
+            elif opcode==14: # BIC
+                result = x & ~y & M32
+            else: # MVN
+                result = y ^ M32
+            if write:
+                r[rdn] = result
+            if not write or not cpu.in_it:
+                cpu.n = result>>31
+                cpu.z = not result
+                cpu.c = carry
+                cpu.v = overflow
+            return cost
+        return op
+
+    def decode16_misc(self, hw, pc):
+        cpu = self
+        r = self.r
+        t = self.timing
+        alu = t['alu']
+        code = (hw>>5) & 0x7F
+        if code>>3==0: # ADD/SUB SP, SP, #imm7
+            offset = (hw & 0x7F)*4
+            if code & 4:
+                offset = -offset
+            def op():
+                r[13] = (r[13]+offset) & M32
+                return alu
+            return op
+        if hw & 0x500==0x100: # CBZ/CBNZ
+            if not self.v7:
+                return None
+            nonzero = hw>>11 & 1
+            rn = hw & 7
+            target = pc+4+((hw>>3) & 0x40)+((hw>>2) & 0x3E)
+            def op():
+                if bool(r[rn])==bool(nonzero):
+                    cpu.next_pc = target
+                    return t['branch']
+                return t['branch_nt']
+            return op
+        if code>>3==0b0010: # SXTH/SXTB/UXTH/UXTB
+            kind = (hw>>6) & 3
+            rm = (hw>>3) & 7
+            rd = hw & 7
+            def op():
+                value = r[rm]
+                if kind==0:
+                    value = sign_extend(value, 16) & M32
+                elif kind==1:
+                    value = sign_extend(value, 8) & M32
+                elif kind==2:
+                    value &= 0xFFFF
+                else:
+                    value &= 0xFF
+                r[rd] = value
+                return alu
+            return op
+        if code>>4==0b010: # PUSH
+            regs = reg_list((hw & 0xFF) | ((hw & 0x100)<<6))
+            return self.make_multi(False, 13, regs, True, True)
+        if code>>4==0b110: # POP
+            regs = reg_list((hw & 0xFF) | ((hw & 0x100)<<7))
+            return self.make_multi(True, 13, regs, False, True)
+        if code>>1 in (0b101000, 0b101001, 0b101011): # REV/REV16/REVSH
+            kind = (hw>>6) & 3
+            rm = (hw>>3) & 7
+            rd = hw & 7
+            def op():
+                r[rd] = self.reverse(r[rm], kind)
+                return alu
+            return op
+        if code==0b0110011: # CPS
+            return lambda: alu
+        if code>>3==0b1111:
+            mask = hw & 15
+            if not mask: # NOP/YIELD/WFE/WFI/SEV
+                return lambda: alu
+            if not self.v7:
+                return None
+            state = hw & 0xFF
+            def op():
+                cpu.itstate = state
+                return alu
+            return op
+        return None
+
+    def reverse(self, value, kind):
+        if kind==0: # REV
+            return int.from_bytes(value.to_bytes(4, 'little'), 'big')
+        if kind==1: # REV16
+            return ((value & 0x00FF00FF)<<8) | ((value>>8) & 0x00FF00FF)
+        if kind==2: # RBIT
+            return int('{:032b}'.format(value)[::-1], 2)
+        # REVSH
+        return sign_extend(((value & 0xFF)<<8) | ((value>>8) & 0xFF), 16) & M32
+
+    def make_multi(self, is_load, rn, regs, decrement, writeback):
+        '''LDM/STM/PUSH/POP: decrement is the DB addressing mode, IA otherwise'''
+        cpu = self
+        r = self.r
+        t = self.timing
+        cost = t['multi']+len(regs)
+        if is_load and 15 in regs:
+            cost += t['pc_load']
+        span = 4*len(regs)
+        def op():
+            base = r[rn]
+            addr = (base-span) & M32 if decrement else base
+            for i in regs:
+                if is_load:
+                    value = cpu.load(addr, 4, True)
+                    if i==15:
+                        cpu.branch(value)
+                    else:
+                        r[i] = value
+                else:
+                    cpu.store(addr, 4, r[i], True)
+                addr += 4
+            if writeback and not (is_load and rn in regs):
+                r[rn] = (base-span if decrement else base+span) & M32
+            return cost
+        return op
+
+    def decode32(self, hw1, hw2, pc):
+        op1 = (hw1>>11) & 3
+        op2 = (hw1>>4) & 0x7F
+        if op1==2 and hw2>>15: # branches and miscellaneous control
+            return self.decode32_branch(hw1, hw2, pc)
+        if not self.v7:
+            return None
+        if op1==1:
+            if op2 & 0x64==0x00:
+                kind = (hw1>>7) & 3
+                if kind not in (1, 2):
+                    return None
+                regs = reg_list(hw2 & 0xDFFF)
+                return self.make_multi(hw1>>4 & 1, hw1 & 15, regs, kind==2, hw1>>5 & 1)
+            if op2 & 0x64==0x04:
+                return self.decode32_dual(hw1, hw2, pc)
+            if op2 & 0x60==0x20:
+                return self.decode32_dp_shifted(hw1, hw2)
+            return None
+        if op1==2:
+            if op2 & 0x20:
+                return self.decode32_plain_imm(hw1, hw2, pc)
+            return self.decode32_modified_imm(hw1, hw2)
+        if op2 & 0x71==0x00 or (op2 & 0x60==0 and op2 & 7 in (1, 3, 5)):
+            return self.decode32_single(hw1, hw2, pc)
+        if op2 & 0x70==0x20:
+            return self.decode32_dp_register(hw1, hw2)
+        if op2 & 0x78==0x30:
+            return self.decode32_multiply(hw1, hw2)
+        if op2 & 0x78==0x38:
+            return self.decode32_long_multiply(hw1, hw2)
+        return None
+
+    def decode32_branch(self, hw1, hw2, pc):
+        cpu = self
+        r = self.r
+        t = self.timing
+        kind = (hw2>>12) & 5
+        s = hw1>>10 & 1
+        j1 = hw2>>13 & 1
+        j2 = hw2>>11 & 1
+        if kind==0:
+            if (hw1>>7) & 7==7: # MSR/MRS/hints/barriers
+                if (hw1>>4) & 0x7F in (0x3E, 0x3F): # MRS reads as zero, no system registers here
+                    rd = (hw2>>8) & 15
+                    def op():
+                        r[rd] = 0
+                        return t['alu']
+                    return op
+                return lambda: t['alu']
+            if not self.v7:
+                return None
+            cond = (hw1>>6) & 15
+            target = pc+4+sign_extend(s<<20 | j2<<19 | j1<<18 | (hw1 & 0x3F)<<12 | (hw2 & 0x7FF)<<1, 21)
+            def op():
+                if condition_passed(cpu, cond):
+                    cpu.next_pc = target
+                    return t['branch']
+                return t['branch_nt']
+            return op
+        i1 = 1-(j1 ^ s)
+        i2 = 1-(j2 ^ s)
+        target = (pc+4+sign_extend(s<<24 | i1<<23 | i2<<22 | (hw1 & 0x3FF)<<12 | (hw2 & 0x7FF)<<1, 25)) & M32
+        if kind==5: # BL
+            link = (pc+4) | 1
+            def op():
+                r[14] = link
+                cpu.next_pc = target
+                return t['bl']
+            return op
+        if kind==1 and self.v7: # B.W
+            def op():
+                cpu.next_pc = target
+                return t['branch']
+            return op
+        return None
+
+    def decode32_dual(self, hw1, hw2, pc):
+        cpu = self
+        r = self.r
+        t = self.timing
+        rn = hw1 & 15
+        kind1 = (hw1>>7) & 3
+        kind2 = (hw1>>4) & 3
+        if kind1==1 and kind2==1 and (hw2>>4) & 15 in (0, 1): # TBB/TBH
+            half = hw2>>4 & 1
+            rm = hw2 & 15
+            def op():
+                base = pc+4 if rn==15 else r[rn]
+                if half:
+                    offset = cpu.load((base+r[rm]*2) & M32, 2)
+                else:
+                    offset = cpu.load((base+r[rm]) & M32, 1)
+                cpu.next_pc = (pc+4+offset*2) & M32
+                return t['load']+t['branch']
+            return op
+        if not (kind1 & 2 or kind2 & 2):
+            return None # exclusives
+        # LDRD/STRD (immediate)
+        index = hw1>>8 & 1
+        add = hw1>>7 & 1
+        writeback = hw1>>5 & 1
+        is_load = hw1>>4 & 1
+        rt = hw2>>12
+        rt2 = (hw2>>8) & 15
+        offset = (hw2 & 0xFF)*4
+        if not add:
+            offset = -offset
+        def op():
+            base = ((pc+4) & ~3) if rn==15 else r[rn]
+            addr = (base+offset) & M32 if index else base
+            if is_load:
+                r[rt] = cpu.load(addr, 4, True)
+                r[rt2] = cpu.load(addr+4, 4, True)
+            else:
+                cpu.store(addr, 4, r[rt], True)
+                cpu.store(addr+4, 4, r[rt2], True)
+            if writeback:
+                r[rn] = (base+offset) & M32
+            return (t['load']+1) if is_load else (t['store']+1)
+        return op
+
+    def make_dp(self, opcode, setflags, rd, rn, operand):
+        '''Thumb-2 data processing, operand() returns (value, shifter carry)'''
+        cpu = self
+        r = self.r
+        alu = self.timing['alu']
+        if opcode in (5, 6, 7, 9, 12, 15): # PKHBT and unallocated
+            return None
+        test = rd==15 and setflags and opcode in (0, 4, 8, 13) # TST/TEQ/CMN/CMP
+        if rd==15 and not test:
+            return None
+        def op():
+            x = 0 if rn==15 else r[rn]
+            y, carry = operand()
+            overflow = cpu.v
+            if opcode==0: # AND/TST
+                result = x & y
+            elif opcode==1: # BIC
+                result = x & ~y & M32
+            elif opcode==2: # ORR/MOV
+                result = x | y
+            elif opcode==3: # ORN/MVN
+                result = x | (y ^ M32)
+            elif opcode==4: # EOR/TEQ
+                result = x ^ y
+            elif opcode==8: # ADD/CMN
+                result, carry, overflow = add_with_carry(x, y, 0)
+            elif opcode==10: # ADC
+                result, carry, overflow = add_with_carry(x, y, cpu.c)
+            elif opcode==11: # SBC
+                result, carry, overflow = add_with_carry(x, y ^ M32, cpu.c)
+            elif opcode==13: # SUB/CMP
+                result, carry, overflow = add_with_carry(x, y ^ M32, 1)
+            else: # RSB
+                result, carry, overflow = add_with_carry(x ^ M32, y, 1)
+            if not test:
+                r[rd] = result
+            if setflags:
+                cpu.n = result>>31
+                cpu.z = not result
+                cpu.c = carry
+                cpu.v = overflow
+            return alu
+        return op
+
+    def decode32_modified_imm(self, hw1, hw2):
+        cpu = self
+        imm12 = (hw1>>10 & 1)<<11 | ((hw2>>12) & 7)<<8 | (hw2 & 0xFF)
+        value, carry_out = thumb_expand_imm_c(imm12, 0)
+        rotated = imm12>>10!=0
+        def operand():
+            return value, (carry_out if rotated else cpu.c)
+        return self.make_dp((hw1>>5) & 15, hw1>>4 & 1, (hw2>>8) & 15, hw1 & 15, operand)
+
+    def decode32_dp_shifted(self, hw1, hw2):
+        cpu = self
+        r = self.r
+        typ, amount = decode_imm_shift((hw2>>4) & 3, ((hw2>>12) & 7)<<2 | ((hw2>>6) & 3))
+        rm = hw2 & 15
+        def operand():
+            return shift_c(r[rm], typ, amount, cpu.c)
+        return self.make_dp((hw1>>5) & 15, hw1>>4 & 1, (hw2>>8) & 15, hw1 & 15, operand)
+
+    def decode32_plain_imm(self, hw1, hw2, pc):
+        r = self.r
+        alu = self.timing['alu']
+        opcode = (hw1>>4) & 0x1F
+        rn = hw1 & 15
+        rd = (hw2>>8) & 15
+        imm12 = (hw1>>10 & 1)<<11 | ((hw2>>12) & 7)<<8 | (hw2 & 0xFF)
+        lsb = ((hw2>>12) & 7)<<2 | ((hw2>>6) & 3)
+        if opcode in (0, 10): # ADDW/SUBW/ADR
+            offset = -imm12 if opcode else imm12
+            def op():
+                base = ((pc+4) & ~3) if rn==15 else r[rn]
+                r[rd] = (base+offset) & M32
+                return alu
+            return op
+        if opcode in (4, 12): # MOVW/MOVT
+            imm16 = rn<<12 | imm12
+            top = opcode==12
+            def op():
+                r[rd] = (r[rd] & 0xFFFF) | imm16<<16 if top else imm16
+                return alu
+            return op
+        if opcode in (20, 28): # SBFX/UBFX
+            width = (hw2 & 31)+1
+            signed = opcode==20
+            def op():
+                value = (r[rn]>>lsb) & ((1<<width)-1)
+                r[rd] = sign_extend(value, width) & M32 if signed else value
+                return alu
+            return op
+        if opcode==22: # BFI/BFC
+            msb = hw2 & 31
+            if msb<lsb:
+                return None
+            mask = ((1<<(msb-lsb+1))-1)<<lsb
+            def op():
+                insert = 0 if rn==15 else (r[rn]<<lsb) & mask
+                r[rd] = (r[rd] & ~mask & M32) | insert
+                return alu
+            return op
+        return None
+
+    def decode32_single(self, hw1, hw2, pc):
+        '''LDR*/STR* with 12-bit, 8-bit (pre/post-indexed), literal or register offsets'''
+        cpu = self
+        r = self.r
+        t = self.timing
+        signed = hw1>>8 & 1
+        size = (1, 2, 4, None)[(hw1>>5) & 3]
+        is_load = hw1>>4 & 1
+        rn = hw1 & 15
+        rt = hw2>>12
+        if size is None or (signed and (not is_load or size==4)):
+            return None
+        if is_load and rt==15 and size!=4:
+            return lambda: t['alu'] # PLD/PLI hints
+        index = True
+        writeback = False
+        rm = None
+        if rn==15:
+            if not is_load:
+                return None
+            offset = hw2 & 0xFFF
+            if not hw1>>7 & 1:
+                offset = -offset
+        elif hw1>>7 & 1:
+            offset = hw2 & 0xFFF
+        elif hw2 & 0x800:
+            index = hw2>>10 & 1
+            writeback = hw2>>8 & 1
+            offset = hw2 & 0xFF
+            if not hw2>>9 & 1:
+                offset = -offset
+        elif not (hw2>>6) & 63:
+            rm = hw2 & 15
+            offset = (hw2>>4) & 3 # shift of rm
+        else:
+            return None
+        cost = (t['load']+(t['pc_load'] if rt==15 else 0)) if is_load else t['store']
+        def op():
+            base = ((pc+4) & ~3) if rn==15 else r[rn]
+            if rm is not None:
+                addr = (base+(r[rm]<<offset)) & M32
+            else:
+                addr = (base+offset) & M32
+            access = addr if index else base
+            if is_load:
+                value = cpu.load(access, size)
+                if signed:
+                    value = sign_extend(value, size*8) & M32
+            else:
+                cpu.store(access, size, r[rt])
+            if writeback:
+                r[rn] = addr
+            if is_load:
+                if rt==15:
+                    cpu.branch(value)
+                else:
+                    r[rt] = value
+            return cost
+        return op
+
+    def decode32_dp_register(self, hw1, hw2):
+        cpu = self
+        r = self.r
+        alu = self.timing['alu']
+        op1 = (hw1>>4) & 15
+        op2 = (hw2>>4) & 15
+        rn = hw1 & 15
+        rd = (hw2>>8) & 15
+        rm = hw2 & 15
+        if hw2>>12!=15:
+            return None
+        if not op2 and op1<8: # LSL/LSR/ASR/ROR (register)
+            typ = op1>>1
+            setflags = op1 & 1
+            def op():
+                result, carry = shift_c(r[rn], typ, r[rm] & 0xFF, cpu.c)
+                r[rd] = result
+                if setflags:
+                    cpu.n = result>>31
+                    cpu.z = not result
+                    cpu.c = carry
+                return alu
+            return op
+        if op2 & 8 and op1 in (0, 1, 4, 5): # [SU]XT[AB][BH]
+            rotation = ((hw2>>4) & 3)*8
+            bits = 16 if op1 in (0, 1) else 8
+            signed = not op1 & 1
+            def op():
+                value, _ = shift_c(r[rm], SHIFT_ROR, rotation, 0)
+                value &= (1<<bits)-1
+                if signed:
+                    value = sign_extend(value, bits) & M32
+                if rn!=15:
+                    value = (value+r[rn]) & M32
+                r[rd] = value
+                return alu
+            return op
+        if op1>>2==2 and op2>>2==2:
+            kind = op2 & 3
+            if op1 & 3==1: # REV/REV16/RBIT/REVSH
+                def op():
+                    r[rd] = self.reverse(r[rm], kind)
+                    return alu
+                return op
+            if op1 & 3==3 and kind==0: # CLZ
+                def op():
+                    r[rd] = 32-r[rm].bit_length()
+                    return alu
+                return op
+        return None
+
+    def decode32_multiply(self, hw1, hw2):
+        r = self.r
+        mul = self.timing['mul']
+        if (hw1>>4) & 7 or (hw2>>4) & 15 not in (0, 1):
+            return None
+        rn = hw1 & 15
+        ra = hw2>>12
+        rd = (hw2>>8) & 15
+        rm = hw2 & 15
+        subtract = hw2>>4 & 1
+        def op():
+            product = r[rn]*r[rm]
+            if ra!=15:
+                product = r[ra]-product if subtract else r[ra]+product
+            r[rd] = product & M32
+            return mul if ra==15 else mul+1
+        return op
+
+    def decode32_long_multiply(self, hw1, hw2):
+        r = self.r
+        t = self.timing
+        op1 = (hw1>>4) & 7
+        op2 = (hw2>>4) & 15
+        rn = hw1 & 15
+        rlo = hw2>>12
+        rhi = (hw2>>8) & 15
+        rm = hw2 & 15
+        if op2==15 and op1 in (1, 3): # SDIV/UDIV
+            signed = op1==1
+            def op():
+                x = r[rn]
+                y = r[rm]
+                if signed:
+                    x = sign_extend(x, 32)
+                    y = sign_extend(y, 32)
+                if not y:
+                    result = 0 # division by zero trap is off after reset
+                else:
+                    result = abs(x)//abs(y)
+                    if (x<0)!=(y<0):
+                        result = -result
+                r[rhi] = result & M32
+                return t['div']
+            return op
+        if op2==0 and op1 in (0, 2, 4, 6): # [SU]MULL/[SU]MLAL
+            signed = op1 in (0, 4)
+            accumulate = op1>=4
+            def op():
+                x = r[rn]
+                y = r[rm]
+                if signed:
+                    x = sign_extend(x, 32)
+                    y = sign_extend(y, 32)
+                result = x*y
+                if accumulate:
+                    result += r[rhi]<<32 | r[rlo]
+                r[rlo] = result & M32
+                r[rhi] = (result>>32) & M32
+                return t['mul']+1
+            return op
+        return None
@@ -135,6 +135,10 @@ static void sys_init(void)
 //test data to fill .data/.bss
 volatile unsigned test_data[64] = { 0, 1, 2, 3 };
 volatile unsigned test_zero[64];
+//large table unpacked after the boot-critical init, see --defer in the Makefile
+volatile unsigned test_deferred[256] = { 1, 1, 2, 3, 5, 8, 13, 21 };
+
+void data_init_deferred(void);
 
 int main(void)
 {
@@ -148,8 +152,10 @@ int main(void)
 
   uart_puts("\r\nHello, world!\r\n");
 
+  data_init_deferred();
+
   //manipulate test data to keep it
-  test_zero[2] = test_data[4];
+  test_zero[2] = test_data[4] + test_deferred[7];
 
   HAL_GPIO_LED_out();
   HAL_GPIO_LED_set();
@@ -137,26 +137,97 @@ void (* const vectors[])(void) =
 
 //-----------------------------------------------------------------------------
 
-extern uint32_t __data_init_table;
-typedef void(*pInitFunc_t)( void *dst, const void *src, uint32_t size);
+extern const uint32_t __data_init_table[];
+extern const uint32_t *const __data_init_table_deferred; /* set by the tool, NULL if nothing is deferred */
+/* the tool packs each decompressor's arguments in its own order */
+typedef void(*pInitFunc_t)(uint32_t param0, uint32_t param1, uint32_t param2);
 typedef struct 
 { 
-	const void *src;
-	void *dst;
-	uint32_t size;
+	uint32_t param[3];
 	uintptr_t pfn;
 } InitEntry_t;
 
-void irq_handler_reset(void)
+#define INIT_TABLE_COMPACT 0x80000000u
+
+static uint32_t read_varint(const uint8_t **p)
+{
+	uint32_t value = 0;
+	unsigned shift = 0;
+	uint8_t byte;
+	do
+	{
+		byte = *(*p)++;
+		value |= (uint32_t)(byte & 0x7f) << shift;
+		shift += 7;
+	} while (byte & 0x80);
+	return value;
+}
+
+static uint32_t read_delta(const uint8_t **p)
+{
+	uint32_t value = read_varint(p);
+	return (value >> 1) ^ -(value & 1); /* zigzag */
+}
+
+/* comp.py --table-format compact: dd n_entries|INIT_TABLE_COMPACT, dd n_funcs, dd pfn[n_funcs],
+   db order[n_funcs] (2 bits per param: 0 src, 1 dst, 2 size, 3 zero), then per entry:
+   db function index (bit 7: src follows as is), varint src or zigzag delta to the previous payload,
+   zigzag varint dst delta to the previous entry end, varint size */
+static void data_init_compact(const uint32_t *table)
+{
+	uint32_t n_entries = table[0] & ~INIT_TABLE_COMPACT;
+	uint32_t n_funcs = table[1];
+	const uint32_t *pfns = table+2;
+	const uint8_t *orders = (const uint8_t*)(pfns+n_funcs);
+	const uint8_t *p = orders+n_funcs;
+	uint32_t payload = (uint32_t)table;
+	uint32_t end = 0;
+	while(n_entries-- > 0)
+	{
+		uint8_t head = *p++;
+		uint32_t values[4];
+		if (head & 0x80)
+			values[0] = read_varint(&p);
+		else
+			values[0] = payload += read_delta(&p);
+		values[1] = end += read_delta(&p);
+		values[2] = read_varint(&p);
+		values[3] = 0;
+		end += values[2];
+		uint8_t order = orders[head & 0x7f];
+		pInitFunc_t pfn = (pInitFunc_t)(pfns[head & 0x7f] | 1);
+		pfn(values[order & 3], values[(order >> 2) & 3], values[(order >> 4) & 3]);
+	}
+}
+
+/* table: dd n_entries, InitEntry_t[n_entries], or the compact format above */
+static void data_init(const uint32_t *table)
 {
-	InitEntry_t *ptbl = (InitEntry_t*)(&__data_init_table+1);
-	uint32_t n_entries = __data_init_table;
+	const InitEntry_t *ptbl = (const InitEntry_t*)(table+1);
+	uint32_t n_entries = table[0];
+	if (n_entries & INIT_TABLE_COMPACT)
+	{
+		data_init_compact(table);
+		return;
+	}
 	while(n_entries-- > 0)
 	{
 		pInitFunc_t pfn = (pInitFunc_t)(ptbl->pfn | 1);
-		pfn(ptbl->dst, ptbl->src, ptbl->size);
+		pfn(ptbl->param[0], ptbl->param[1], ptbl->param[2]);
 		ptbl++;
 	}
+}
+
+/* unpack the entries deferred by comp.py --defer, call once before using them */
+void data_init_deferred(void)
+{
+	if (__data_init_table_deferred)
+		data_init(__data_init_table_deferred);
+}
+
+void irq_handler_reset(void)
+{
+	data_init(__data_init_table);
 
   SCB->VTOR = (uint32_t)vectors;
 
@@ -0,0 +1,41 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+	sys.path.insert(0, ROOT)
+
+import elf
+
+
+@pytest.fixture(scope='session')
+def synthetic_elf():
+	'''Small firmware-like ELF with every data pattern, compresses in a fraction of a second'''
+	return elf.synthesize(data_size=0x2000, n_sections=6, n_symbols=24, pattern='mixed', seed=7)
+
+
+CODE_ADDR = 0x08000000
+PAYLOAD_ADDR = 0x08010000
+RAM_ADDR = 0x20000000
+GUARD = 64 # RAM bytes past the destination, a decompressor may overrun into them by design
+
+
+def emulate(algo, payload, size, variant='size'):
+	'''Run the shipped decompressor of algo the way the startup code calls it
+		returns: (bytes written at dst with GUARD bytes more, cycles)
+	'''
+	import emulator
+
+	mem = emulator.Memory()
+	mem.map(CODE_ADDR, algo.get_decompressor(variant), name='code')
+	if isinstance(payload, int):
+		src = payload
+	else:
+		mem.map(PAYLOAD_ADDR, bytes(payload)+bytes(8), name='payload')
+		src = PAYLOAD_ADDR
+	mem.map(RAM_ADDR, b'\xa5'*(size+GUARD), writable=True, name='ram')
+	cpu = emulator.ThumbCPU(algo.arch, mem)
+	cycles = emulator.run_function(cpu, CODE_ADDR | 1, (src, RAM_ADDR, size))
+	return mem.read_bytes(RAM_ADDR, size+GUARD), cycles
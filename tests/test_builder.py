@@ -0,0 +1,94 @@
+import csv
+import random
+from struct import unpack_from
+
+import pytest
+
+import bench
+import comp
+import elf
+from elf.builder import ELFBuilder, make_pattern
+from elf.section import SHF, SHT
+from elf.segment import PT
+
+
+def test_sections_segments_symbols():
+	builder = ELFBuilder(entry=0x08000001)
+	builder.add_section('.text', 0x08000000, b'\x70\x47'*8, flags=SHF.ALLOC | SHF.EXECINSTR)
+	builder.add_section('.data', 0x20000000, b'abcdefgh', flags=SHF.ALLOC | SHF.WRITE)
+	builder.add_section('.bss', 0x20000008, size=0x20, flags=SHF.ALLOC | SHF.WRITE)
+	builder.add_segment(['.text'], flags=5)
+	builder.add_segment(['.data', '.bss'], paddr=0x08000010, flags=6)
+	builder.add_symbol('counter', 0x20000004, 4, section='.data')
+	builder.add_symbol('limit', 0x1234)
+	binary = elf.ELF(builder.build())
+
+	assert binary.header.entry==0x08000001
+	data = binary.find_section_by_name('.data')
+	assert data.typ==SHT.PROGBITS and data.payload==b'abcdefgh'
+	bss = binary.find_section_by_name('.bss')
+	assert bss.typ==SHT.NOBITS and bss.size==0x20
+	seg = binary.find_segment_by_va(0x20000000)
+	assert seg.typ==PT.LOAD and seg.paddr==0x08000010
+	assert (seg.filesz, seg.memsz)==(8, 0x28)
+	assert binary.read_from_va(0x20000002, 10)==b'cdefgh'+bytes(4)
+	assert binary.find_symbol('counter').value==0x20000004
+	assert binary.find_symbol('limit').value==0x1234
+	# the section offsets agree with the segment's
+	assert data.offset-seg.offset==data.addr-seg.vaddr
+
+
+def test_init_table():
+	builder = ELFBuilder()
+	builder.add_init_table(0x08000400, [(0x20000000, 16, True), (0x20000010, 32, False)], 0x100)
+	builder.add_segment(['.idata'])
+	binary = elf.ELF(builder.build())
+	table = binary.read_from_va(binary.find_symbol('__data_init_table').value, 0x100)
+	assert unpack_from('<9I', table)==(2, 0x20000000, 0x20000000, 16, 0, 0, 0x20000010, 32, 0)
+	assert table[36:]==b'\xFF'*(0x100-36)
+	with pytest.raises(elf.ELFError):
+		ELFBuilder().add_init_table(0, [(0, 4, True)]*4, 32)
+
+
+@pytest.mark.parametrize('pattern', [kind for kind in elf.PATTERNS if kind!='mixed'])
+def test_patterns(pattern):
+	data = make_pattern(pattern, 1001, random.Random(1))
+	assert len(data)==1001
+	if pattern=='zero':
+		assert not any(data)
+	elif pattern=='fill':
+		assert len(set(data))==1
+	with pytest.raises(ValueError):
+		make_pattern('mixed', 4, random.Random(1))
+
+
+@pytest.mark.parametrize('pattern', elf.PATTERNS)
+def test_synthesize(pattern):
+	data = elf.synthesize(data_size=0x1003, n_sections=3, n_symbols=10, pattern=pattern, seed=2)
+	assert data==elf.synthesize(data_size=0x1003, n_sections=3, n_symbols=10, pattern=pattern, seed=2)
+	binary = elf.ELF(data)
+	assert sum(binary.find_section_by_name('.data%d' % idx).size for idx in range(3))==0x1003
+	out = comp.compress_elf(data, 'cortex-m0', comp.CompressOptions(verify=True))
+	assert len(out)<=len(data)
+
+
+def test_synthesize_empty_sections():
+	# less data than sections: the empty ones still get their symbols
+	binary = elf.ELF(elf.synthesize(data_size=3, n_sections=5, n_symbols=12))
+	assert binary.find_section_by_name('.data4').size==0
+	assert binary.find_symbol('obj_4').size==0
+
+
+def test_bench_sweep(tmp_path, capsys):
+	path = tmp_path/'bench.csv'
+	assert bench.main(['data', '--max-data', '0x4000', '--csv', str(path)]) is None
+	rows = list(csv.reader(open(path)))
+	assert rows[0]==['sweep', 'x', 'time_s', 'peak_bytes']
+	assert [int(row[1]) for row in rows[1:]]==[0x1000, 0x4000]
+	assert 'time ~ data_size^' in capsys.readouterr().out
+
+
+def test_bench_slope():
+	assert bench.slope([(1, 1), (10, 100), (100, 10000)])==pytest.approx(2)
+	assert bench.slope([(1, 1)]) is None
+	assert bench.main(['data', '--max-data', '0x4000', '--max-slope', '-10']).startswith('Scaling regression')
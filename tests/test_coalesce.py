@@ -0,0 +1,79 @@
+import random
+
+import pytest
+
+import comp
+import elf
+from elf import ELFBuilder
+from elf.section import SHF
+from elf.segment import PF
+
+FLASH = 0x08000000
+RAM = 0x20000000
+KEEP = RAM+2*52+48 # a section outside the init table sits in this gap
+
+
+def build(pattern):
+	'''Six 48-byte data sections 4 bytes apart, .keep in the gap after the third one, .far and .bss 16 bytes apart'''
+	rnd = random.Random(3)
+	builder = ELFBuilder(entry=FLASH+1)
+	builder.add_section('.text', FLASH, rnd.randbytes(0x200), flags=SHF.ALLOC | SHF.EXECINSTR)
+	builder.add_symbol('__data_init_table_deferred', FLASH+0x1FC, 4, section='.text')
+	ranges = []
+	names = []
+	for idx in range(6):
+		names.append('.data%d' % idx)
+		builder.add_section(names[-1], RAM+idx*52, elf.make_pattern(pattern, 48, rnd), flags=SHF.ALLOC | SHF.WRITE)
+		ranges.append((RAM+idx*52, 48, True))
+	builder.add_section('.keep', KEEP, size=4, flags=SHF.ALLOC | SHF.WRITE)
+	builder.add_section('.far', RAM+0x1000, elf.make_pattern(pattern, 48, rnd), flags=SHF.ALLOC | SHF.WRITE)
+	builder.add_section('.bss', RAM+0x1040, size=64, flags=SHF.ALLOC | SHF.WRITE)
+	ranges += [(RAM+0x1000, 48, True), (RAM+0x1040, 64, False)]
+	builder.add_init_table(FLASH+0x200, ranges, 0x400)
+	builder.add_segment(['.text', '.idata'], flags=PF.R | PF.X)
+	for name in names+['.keep', '.far', '.bss']:
+		builder.add_segment([name], flags=PF.R | PF.W)
+	return builder.build()
+
+
+def run(data, **options):
+	'''returns: (init ranges after coalescing, .idata bytes used)'''
+	compressor = comp.ELFCompressor('cortex-m3', comp.CompressOptions(verify=True, cycles=True, **options))
+	comp.run_compressor(compressor, data)
+	return compressor.ranges, compressor.manifest()['idata']['used']
+
+
+ORIGINAL = [(RAM+idx*52, 48) for idx in range(6)]+[(RAM+0x1000, 48), (RAM+0x1040, 64)]
+
+
+def test_coalesce(capsys):
+	data = build('sparse')
+	ranges, used = run(data, coalesce=32)
+	# merged up to the section in the gap, .far and .bss 16 bytes apart merged as well
+	assert ranges==[(RAM, 152), (RAM+3*52, 152), (RAM+0x1000, 128)]
+	assert used<run(data)[1]
+
+
+@pytest.mark.parametrize('coalesce, ranges', [
+	(None, ORIGINAL),
+	(0, ORIGINAL),
+	(4, [(RAM, 152), (RAM+3*52, 152), (RAM+0x1000, 48), (RAM+0x1040, 64)]),
+])
+def test_distance(coalesce, ranges, capsys):
+	assert run(build('sparse'), coalesce=coalesce)[0]==ranges
+
+
+def test_merge_must_pay_off(capsys):
+	# counters cost the same per byte merged or not, a merge only adds the gap
+	assert run(build('counter'), coalesce=0x1000)[0]==ORIGINAL
+
+
+def test_deferred_not_mixed(capsys):
+	ranges, used = run(build('sparse'), coalesce=32, defer=('.data1', ))
+	assert ranges==[(RAM, 48), (RAM+52, 48), (RAM+2*52, 48), (RAM+3*52, 152), (RAM+0x1000, 128)]
+
+
+@pytest.mark.parametrize('pattern', ['zero', 'sparse', 'text', 'fill'])
+def test_gap_section_kept(pattern, capsys):
+	for dst, size in run(build(pattern), coalesce=0x1000)[0]:
+		assert not (dst<KEEP+4 and KEEP<dst+size)
@@ -0,0 +1,66 @@
+import subprocess
+import sys
+
+import pytest
+
+import comp
+import elf
+from conftest import ROOT
+
+# startup time comp.py may add to the bare interpreter start, seconds
+STARTUP_BUDGET = 0.25
+
+
+def startup_time(args):
+	'''Best of a few runs: the noise of a loaded machine only ever adds time'''
+	from time import perf_counter
+
+	best = None
+	for _ in range(3):
+		start = perf_counter()
+		subprocess.run([sys.executable]+args, cwd=ROOT, check=True, stdout=subprocess.DEVNULL)
+		elapsed = perf_counter()-start
+		best = elapsed if best is None else min(best, elapsed)
+	return best
+
+
+def test_import_is_lazy():
+	code = 'import sys, comp; print(" ".join(name for name in ("argparse", "inspect", "numpy", "cProfile", "tracemalloc", "emulator") if name in sys.modules))'
+	result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, check=True, capture_output=True, text=True)
+	assert result.stdout.split()==[]
+
+
+@pytest.mark.parametrize('args', [['-c', 'import comp'], ['comp.py', '--help']], ids=['import', 'help'])
+def test_startup_budget(args):
+	assert startup_time(args)-startup_time(['-c', 'pass'])<STARTUP_BUDGET
+
+
+def test_compress_elf_roundtrip(synthetic_elf):
+	out = comp.compress_elf(synthetic_elf, 'cortex-m3', comp.CompressOptions(verify=True))
+	assert len(out)<len(synthetic_elf)
+	binary = elf.ELF(out)
+	assert binary.find_symbol('__data_init_table') is not None
+
+
+def test_unknown_option():
+	with pytest.raises(TypeError):
+		comp.CompressOptions(no_such_option=1)
+
+
+def test_time_budget():
+	data = elf.synthesize(data_size=0x40000, n_sections=4, pattern='mixed', seed=3)
+	budget = 0.1
+	compressor = comp.ELFCompressor('cortex-m3', comp.CompressOptions(time_budget=budget, level='max', verify=True))
+	out = comp.run_compressor(compressor, data)
+	# every range still gets the first result found and an algo in progress finishes its block
+	assert compressor.timings['compress']<budget+0.25
+	unlimited = comp.ELFCompressor('cortex-m3', comp.CompressOptions(level='max'))
+	best = comp.run_compressor(unlimited, data)
+	assert compressor.timings['compress']<unlimited.timings['compress']
+	assert len(out)>=len(best)
+
+
+def test_zero_time_budget(synthetic_elf):
+	# out of time from the start: the first algo that fits each range is kept, the image is still valid
+	out = comp.compress_elf(synthetic_elf, 'cortex-m3', comp.CompressOptions(time_budget=0, verify=True))
+	assert elf.ELF(out)
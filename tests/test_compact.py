@@ -0,0 +1,118 @@
+import logging
+import random
+
+import pytest
+
+import comp
+import elf
+from elf import ELFBuilder
+from elf.section import SHF, SHT
+from elf.segment import PF, PT
+
+FLASH = 0x08000000
+RAM = 0x20000000
+PT_ARM_EXIDX = 0x70000001
+DEBUG = ('.debug_info', '.comment', '.symtab', '.strtab', '.shstrtab')
+
+
+def build():
+	'''Flash segment with .ARM.exidx in a nested PT_ARM_EXIDX, a RAM segment loaded from flash whose .data
+		the compressor would empty, .bss, and debug sections outside the segments
+	'''
+	rnd = random.Random(5)
+	builder = ELFBuilder(entry=FLASH+1)
+	builder.add_section('.text', FLASH, rnd.randbytes(0x300), flags=SHF.ALLOC | SHF.EXECINSTR)
+	builder.add_section('.ARM.exidx', FLASH+0x300, rnd.randbytes(0x20), flags=SHF.ALLOC | SHF.LINK_ORDER)
+	builder.add_section('.rodata', FLASH+0x320, rnd.randbytes(0x100))
+	builder.add_section('.data_keep', RAM, rnd.randbytes(0x40), flags=SHF.ALLOC | SHF.WRITE)
+	builder.add_section('.data', RAM+0x40, rnd.randbytes(0x800), flags=SHF.ALLOC | SHF.WRITE)
+	builder.add_section('.bss', RAM+0x840, size=0x200, flags=SHF.ALLOC | SHF.WRITE)
+	builder.add_section('.debug_info', 0, rnd.randbytes(0x90), flags=0, align=1)
+	builder.add_section('.comment', 0, b'GCC: (synthetic) 13.2\0', flags=SHF.MERGE | SHF.STRINGS, align=1)
+	builder.add_segment(['.text', '.ARM.exidx', '.rodata'], flags=PF.R | PF.X, align=0x1000)
+	builder.add_segment(['.ARM.exidx'], flags=PF.R, typ=PT_ARM_EXIDX)
+	builder.add_segment(['.data_keep', '.data'], paddr=FLASH+0x420, flags=PF.R | PF.W, align=8)
+	builder.add_segment(['.bss'], flags=PF.R | PF.W, align=8)
+	builder.add_symbol('main', FLASH+1, 0x10, section='.text')
+	return builder.build()
+
+
+def packed(data, compact, release=('.data',)):
+	'''The ELF with the named sections turned into NOBITS as the compressor does, packed and parsed again'''
+	binary = elf.ELF(data, readonly=False)
+	for name in release:
+		binary.find_section_by_name(name).typ = SHT.NOBITS
+	return bytes(binary.pack(compact))
+
+
+def test_compact_layout():
+	data = build()
+	plain = packed(data, False)
+	compact = packed(data, True)
+	assert len(compact)<=len(plain)-0x800
+	binary = elf.ELF(compact)
+	load = [seg for seg in binary.segments if seg.typ==PT.LOAD]
+	for seg in load:
+		assert (seg.offset-seg.vaddr) % seg.align==0
+	# the RAM segment ends with the last section still holding data
+	assert load[1].filesz==0x40
+	# the nested segment keeps its place inside the flash segment, as do the sections
+	exidx = next(seg for seg in binary.segments if seg.typ==PT_ARM_EXIDX)
+	assert exidx.offset-load[0].offset==exidx.vaddr-load[0].vaddr
+	for sct in binary.sections:
+		seg = next((seg for seg in load if seg.filesz and seg.vaddr<=sct.addr<seg.vaddr+seg.filesz), None)
+		if sct.has_data() and sct.flags & SHF.ALLOC and seg:
+			assert sct.offset-seg.offset==sct.addr-seg.vaddr
+
+
+def test_compact_contents():
+	data = build()
+	plain = elf.ELF(packed(data, False))
+	compact = elf.ELF(packed(data, True))
+	assert len(plain.segments)==len(compact.segments)
+	for a, b in zip(plain.segments, compact.segments):
+		assert (a.typ, a.vaddr, a.paddr, a.memsz, a.flags, a.align)==(b.typ, b.vaddr, b.paddr, b.memsz, b.flags, b.align)
+		# only the tail of NOBITS sections is dropped
+		assert b.filesz<=a.filesz and a.payload[:b.filesz]==b.payload
+	for a, b in zip(plain.sections, compact.sections):
+		assert (a.name, a.typ, a.addr, a.size)==(b.name, b.typ, b.addr, b.size)
+		if a.has_data():
+			assert a.payload[:a.size]==b.payload[:b.size]
+	# the debug sections outside the segments are kept, the symbols still resolve
+	for name in DEBUG:
+		assert compact.find_section_by_name(name).size
+	assert compact.find_symbol('main').value==FLASH+1
+	assert elf.ELF(data).find_section_by_name('.debug_info').payload==compact.find_section_by_name('.debug_info').payload
+
+
+def test_compact_idempotent():
+	compact = packed(build(), True)
+	assert packed(compact, True, ())==compact
+
+
+def test_overlapping_file_ranges(caplog):
+	'''A section straddling a segment end can't be moved with it, the layout is kept'''
+	binary = elf.ELF(build(), readonly=False)
+	seg = binary.segments[0]
+	binary.find_section_by_name('.comment').offset = seg.offset+seg.filesz-4
+	plain = bytes(elf.ELF(bytes(binary.pack()), readonly=False).pack())
+	with caplog.at_level(logging.WARNING):
+		assert bytes(elf.ELF(plain, readonly=False).pack(True))==plain
+	assert 'Overlapping file ranges' in caplog.text
+
+
+@pytest.mark.parametrize('arch', ['cortex-m0', 'cortex-m4'])
+def test_compressed_output(synthetic_elf, arch):
+	compact = comp.compress_elf(synthetic_elf, arch)
+	plain = comp.compress_elf(synthetic_elf, arch, comp.CompressOptions(compact=False))
+	assert len(compact)<len(plain)
+	a, b = elf.ELF(plain), elf.ELF(compact)
+	for sa, sb in zip(a.segments, b.segments):
+		assert sa.payload[:sb.filesz]==sb.payload
+		if sb.typ==PT.LOAD and sb.align:
+			assert (sb.offset-sb.vaddr) % sb.align==0
+	for sa, sb in zip(a.sections, b.sections):
+		if sa.has_data():
+			assert sa.payload[:sa.size]==sb.payload[:sb.size]
+	# the flash image is the same
+	assert elf.flash_chunks(a)==elf.flash_chunks(b)
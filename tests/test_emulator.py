@@ -0,0 +1,213 @@
+import random
+from struct import pack
+
+import pytest
+
+import compression
+import emulator
+from conftest import emulate, GUARD
+
+ARCHS = tuple(emulator.CYCLE_TABLES)
+V7M = tuple(arch for arch in ARCHS if emulator.cycles.ARCH_PROFILES[arch]=='v7m')
+CODE = 0x08000000
+DATA = 0x20000000
+BX_LR = 0x4770
+
+
+def run(arch, halfwords, args=(), data=bytes(64)):
+	'''Call the hand-assembled code with data mapped writable at DATA
+		returns: (cpu, cycles without the final BX LR)
+	'''
+	mem = emulator.Memory()
+	mem.map(CODE, pack('<%dH' % (len(halfwords)+1), *halfwords, BX_LR))
+	mem.map(DATA, data, writable=True, name='data')
+	cpu = emulator.ThumbCPU(arch, mem)
+	cycles = emulator.run_function(cpu, CODE | 1, args)
+	return cpu, cycles-cpu.timing['bx']
+
+
+def flags(cpu):
+	return cpu.n, bool(cpu.z), cpu.c, cpu.v
+
+
+@pytest.mark.parametrize('arch', ARCHS)
+def test_data_processing(arch):
+	t = emulator.CYCLE_TABLES[arch]
+	cpu, cycles = run(arch, [
+		0x2005, # MOVS r0, #5
+		0x21FF, # MOVS r1, #255
+		0x1842, # ADDS r2, r0, r1
+		0x0213, # LSLS r3, r2, #8
+		0x1F5C, # SUBS r4, r3, #5
+		0x4345, # MULS r5, r0
+	], (0, 0, 0, 0))
+	assert cpu.r[:6]==[5, 255, 260, 260<<8, (260<<8)-5, 0]
+	assert cycles==5*t['alu']+t['mul']
+
+
+@pytest.mark.parametrize('arch', ARCHS)
+def test_flags(arch):
+	cpu, cycles = run(arch, [0x2800], (0, )) # CMP r0, #0
+	assert flags(cpu)==(0, True, 1, 0)
+	cpu, cycles = run(arch, [0x2801], (0, )) # CMP r0, #1
+	assert flags(cpu)==(1, False, 0, 0)
+	cpu, cycles = run(arch, [0x1840], (0x7FFFFFFF, 1)) # ADDS r0, r0, r1
+	assert cpu.r[0]==0x80000000 and flags(cpu)==(1, False, 0, 1)
+	cpu, cycles = run(arch, [0x1840], (0xFFFFFFFF, 1))
+	assert cpu.r[0]==0 and flags(cpu)==(0, True, 1, 0)
+
+
+@pytest.mark.parametrize('arch', ARCHS)
+def test_load_store(arch):
+	t = emulator.CYCLE_TABLES[arch]
+	cpu, cycles = run(arch, [
+		0x6801, # LDR r1, [r0]
+		0x7902, # LDRB r2, [r0, #4]
+		0x6081, # STR r1, [r0, #8]
+		0x7302, # STRB r2, [r0, #12]
+	], (DATA, ), bytes(range(64)))
+	assert cpu.r[1]==0x03020100 and cpu.r[2]==4
+	assert cpu.mem.read_bytes(DATA+8, 5)==bytes([0, 1, 2, 3, 4])
+	assert cycles==2*t['load']+2*t['store']
+
+
+@pytest.mark.parametrize('arch', ARCHS)
+def test_push_pop(arch):
+	t = emulator.CYCLE_TABLES[arch]
+	mem = emulator.Memory()
+	mem.map(CODE, pack('<6H',
+		0xB510, # PUSH {r4, lr}
+		0x2407, # MOVS r4, #7
+		0xF000, 0xF802, # BL +4
+		0xBD10, # POP {r4, pc}
+		0x0000,
+		)+pack('<2H',
+		0x1C60, # ADDS r0, r4, #1
+		BX_LR,
+	))
+	cpu = emulator.ThumbCPU(arch, mem)
+	cycles = emulator.run_function(cpu, CODE | 1, (0, 0, 0, 0), stack_size=0x100)
+	assert cpu.r[0]==8 and cpu.r[4]==0
+	assert cycles==(t['multi']+2)+t['alu']+t['bl']+t['alu']+t['bx']+(t['multi']+2+t['pc_load'])
+	assert cpu.r[13]==cpu.stack_top
+
+
+@pytest.mark.parametrize('arch', ARCHS)
+def test_loop_cycles(arch):
+	'''Known sequence: a count-down loop, the branch is taken n-1 times and falls through once'''
+	t = emulator.CYCLE_TABLES[arch]
+	n = 10
+	cpu, cycles = run(arch, [
+		0x3801, # loop: SUBS r0, #1
+		0xD1FD, # BNE loop
+	], (n, ))
+	assert cpu.r[0]==0
+	assert cycles==n*t['alu']+(n-1)*t['branch']+t['branch_nt']
+
+
+@pytest.mark.parametrize('arch', V7M)
+def test_it_block(arch):
+	t = emulator.CYCLE_TABLES[arch]
+	code = [
+		0x2800, # CMP r0, #0
+		0xBF0C, # ITE EQ
+		0x2101, # MOVEQ r1, #1
+		0x2102, # MOVNE r1, #2
+	]
+	cpu, cycles = run(arch, code, (0, 0))
+	assert cpu.r[1]==1
+	# CMP, IT and the executed MOV, the skipped one costs a not taken branch
+	assert cycles==3*t['alu']+t['branch_nt']
+	cpu, cycles = run(arch, code, (5, 0))
+	assert cpu.r[1]==2
+	# MOVS in an IT block leaves the flags alone
+	assert flags(cpu)==(0, False, 1, 0)
+
+
+@pytest.mark.parametrize('arch', V7M)
+def test_cbz(arch):
+	code = [
+		0xB108, # CBZ r0, +2
+		0x2101, # MOVS r1, #1
+		BX_LR,
+		0x2102, # MOVS r1, #2
+	]
+	assert run(arch, code, (0, 0))[0].r[1]==2
+	assert run(arch, code, (3, 0))[0].r[1]==1
+
+
+@pytest.mark.parametrize('arch', V7M)
+def test_udiv(arch):
+	t = emulator.CYCLE_TABLES[arch]
+	cpu, cycles = run(arch, [0xFBB0, 0xF2F1], (100, 7)) # UDIV r2, r0, r1
+	assert cpu.r[2]==14
+	assert cycles==t['div']
+
+
+@pytest.mark.parametrize('arch', ('cortex-m0', 'cortex-m0plus'))
+def test_v6m_rejects_thumb2(arch):
+	with pytest.raises(emulator.EmulatorError):
+		run(arch, [0xFBB0, 0xF2F1], (100, 7))
+	with pytest.raises(emulator.EmulatorError):
+		run(arch, [0x6801], (DATA+2, )) # unaligned LDR
+
+
+def test_memory():
+	mem = emulator.Memory()
+	mem.map(0x1000, b'\x01\x02\x03\x04')
+	mem.map(0x2000, 16, writable=True)
+	assert mem.read(0x1000, 4)==0x04030201
+	with pytest.raises(emulator.EmulatorError):
+		mem.write(0x1000, 1, 0)
+	with pytest.raises(emulator.EmulatorError):
+		mem.read(0x1002, 4) # runs past the region
+	with pytest.raises(emulator.EmulatorError):
+		mem.map(0x200C, 8)
+	mem.write(0x2004, 2, 0x12345)
+	assert mem.read_bytes(0x2004, 3)==b'\x45\x23\x00'
+	assert mem.free_range(0x1000, above=0x1000)==0x3000
+
+
+def test_unsupported_architecture():
+	with pytest.raises(emulator.EmulatorError):
+		emulator.ThumbCPU('cortex-a9', emulator.Memory())
+
+
+def samples():
+	rnd = random.Random(1)
+	yield bytes(300)
+	yield b'\x5a'*1001
+	yield b'\xde\xad\xbe\xef\x01'*200+b'\xde\xad'
+	yield rnd.randbytes(3000)
+	yield b''.join(rnd.choice([b'hello ', b'world ', b'foo', bytes(20)]) for _ in range(800))
+	yield b''.join((i*37+5).to_bytes(4, 'little') for i in range(500))
+	yield b''.join((i*3).to_bytes(2, 'little') for i in range(1001))+b'\x07'
+	yield b''.join(rnd.choice([bytes(4), rnd.randbytes(4)]) for _ in range(500))
+	yield b'ab'*2000
+	yield b'x'
+
+
+SAMPLES = list(samples())
+
+
+def decompressors():
+	return [pytest.param(cls, arch, variant, id='%s-%s-%s' % (cls.name, arch, variant))
+		for cls in compression.algos for variant in cls.decompressor_variants for arch in ARCHS]
+
+
+@pytest.mark.parametrize('cls, arch, variant', decompressors())
+def test_shipped_decompressor(cls, arch, variant):
+	'''The shipped image writes what the reference decoder says, and that is the original data'''
+	algo = cls(arch)
+	tested = 0
+	for data in SAMPLES:
+		payload = algo.compress(data)
+		if payload is None:
+			continue
+		out, cycles = emulate(algo, payload, len(data), variant)
+		ref = algo.decompress(payload if isinstance(payload, int) else payload+bytes(8), len(data))
+		assert ref[:len(data)]==data
+		assert out[:len(ref)]==ref[:len(data)+GUARD]
+		assert out[len(ref):]==b'\xa5'*(len(data)+GUARD-len(ref)) # nothing written past the decoder's output
+		tested += 1
+	assert tested
@@ -0,0 +1,113 @@
+import io
+import shutil
+import subprocess
+
+import pytest
+
+import comp
+import elf
+from elf import ELFBuilder
+from elf.section import SHF
+from elf.segment import PF
+
+TEXT = 0x0800FFF8 # crosses the 64 KiB boundary at 0x08010000
+RODATA = 0x08010010
+DATA_LOAD = 0x08010020
+ENTRY = 0x0800FFF9
+
+
+def image():
+	'''.text and .rodata 8 bytes apart in one segment, .data loaded behind them, .bss not loaded'''
+	builder = ELFBuilder(entry=ENTRY)
+	builder.add_section('.text', TEXT, bytes(range(16)), flags=SHF.ALLOC | SHF.EXECINSTR)
+	builder.add_section('.rodata', RODATA, bytes.fromhex('AABBCCDD'))
+	builder.add_section('.data', 0x20000000, bytes.fromhex('11223344'), flags=SHF.ALLOC | SHF.WRITE)
+	builder.add_section('.bss', 0x20000004, size=0x100, flags=SHF.ALLOC | SHF.WRITE)
+	builder.add_segment(['.text', '.rodata'], flags=PF.R | PF.X)
+	builder.add_segment(['.data'], paddr=DATA_LOAD, flags=PF.R | PF.W)
+	builder.add_segment(['.bss'], flags=PF.R | PF.W)
+	return builder.build()
+
+
+BIN = bytes(range(16))+b'\xFF'*8+bytes.fromhex('AABBCCDD')+b'\xFF'*12+bytes.fromhex('11223344')
+
+HEX = [
+	':020000040800F2', # extended linear address 0x0800
+	':08FFF8000001020304050607E5', # cut at the 64 KiB boundary
+	':020000040801F1',
+	':0800000008090A0B0C0D0E0F9C',
+	':04001000AABBCCDDDE', # gap, new record at .rodata
+	':040020001122334432', # .data at its load address
+	':040000050800FFF9F7', # start linear address
+	':00000001FF',
+]
+
+
+def test_bin():
+	f = io.BytesIO()
+	assert elf.write_bin(elf.ELF(image()), f, 0xFF)==TEXT
+	assert f.getvalue()==BIN
+
+
+def test_bin_default_gap_fill():
+	f = io.BytesIO()
+	elf.write_bin(elf.ELF(image()), f)
+	assert f.getvalue()==BIN.replace(b'\xFF', b'\0')
+
+
+def test_bin_long_gap():
+	builder = ELFBuilder()
+	builder.add_section('.a', 0x08000000, b'\x01\x02')
+	builder.add_section('.b', 0x08025001, b'\x03')
+	builder.add_segment(['.a'])
+	builder.add_segment(['.b'])
+	f = io.BytesIO()
+	elf.write_bin(elf.ELF(builder.build()), f, 0x5A)
+	assert f.getvalue()==b'\x01\x02'+b'\x5A'*(0x25001-2)+b'\x03'
+
+
+def test_bin_nothing_to_load():
+	builder = ELFBuilder()
+	builder.add_section('.bss', 0x20000000, size=0x10, flags=SHF.ALLOC | SHF.WRITE)
+	builder.add_segment(['.bss'])
+	f = io.BytesIO()
+	assert elf.write_bin(elf.ELF(builder.build()), f) is None
+	assert f.getvalue()==b''
+
+
+def test_hex():
+	f = io.BytesIO()
+	elf.write_hex(elf.ELF(image()), f)
+	assert f.getvalue().decode().split('\r\n')==HEX+['']
+
+
+def test_hex_without_entry():
+	builder = ELFBuilder()
+	builder.add_section('.a', 0x100, bytes(20))
+	builder.add_segment(['.a'])
+	f = io.BytesIO()
+	elf.write_hex(elf.ELF(builder.build()), f)
+	# below 64 KiB, no extended address record is needed
+	assert f.getvalue().decode().split('\r\n')==[
+		':1001000000000000000000000000000000000000EF',
+		':0401100000000000EB',
+		':00000001FF',
+		'',
+	]
+
+
+@pytest.mark.skipif(not shutil.which('llvm-objcopy'), reason='llvm-objcopy not installed')
+@pytest.mark.parametrize('target', ['binary', 'ihex'])
+@pytest.mark.parametrize('source', ['known', 'compressed'])
+def test_objcopy(tmp_path, synthetic_elf, source, target):
+	'''Same output as objcopy, also on a compressed image with shrunk .idata and NOBITS data sections'''
+	out = image() if source=='known' else comp.compress_elf(synthetic_elf, 'cortex-m3')
+	path = tmp_path/'out.elf'
+	path.write_bytes(out)
+	subprocess.run(['llvm-objcopy', '-O', target, str(path), str(tmp_path/'objcopy')], check=True)
+	f = io.BytesIO()
+	if target=='binary':
+		elf.write_bin(elf.ELF(out), f)
+	else:
+		elf.write_hex(elf.ELF(out), f)
+	assert f.getvalue()==(tmp_path/'objcopy').read_bytes()
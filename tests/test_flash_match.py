@@ -0,0 +1,148 @@
+import json
+import random
+
+import pytest
+
+import comp
+import elf
+from comp import FlashIndex
+from elf import ELFBuilder
+from elf.section import SHF
+from elf.segment import PF
+
+FLASH = 0x08000000
+RAM = 0x20000000
+
+
+def flash_bytes(regions, addr, size):
+	for base, data in regions:
+		if base<=addr and addr+size<=base+len(data):
+			return data[addr-base:addr-base+size]
+	return None
+
+
+def test_find_whole():
+	rnd = random.Random(1)
+	chunk = rnd.randbytes(40)
+	regions = [(FLASH, rnd.randbytes(101)+chunk+rnd.randbytes(3)+chunk)]
+	# the copy at the same word offset as dst is preferred, a word copy loop can run on it
+	index = FlashIndex(regions, 16)
+	assert index.find_whole(chunk, RAM+1)==FLASH+101
+	assert index.find_whole(chunk, RAM)==FLASH+144
+	assert index.find_whole(rnd.randbytes(40), RAM) is None
+
+
+@pytest.mark.parametrize('seed', range(10))
+@pytest.mark.parametrize('min_match', [8, 16, 64])
+def test_find(seed, min_match):
+	rnd = random.Random(seed)
+	flash = rnd.randbytes(2000)
+	data = bytearray()
+	while len(data)<3000:
+		if rnd.random()<0.5:
+			pos = rnd.randrange(len(flash)-200)
+			data += flash[pos:pos+rnd.randrange(1, 200)]
+		else:
+			data += rnd.randbytes(rnd.randrange(1, 100))
+	data = bytes(data)
+	regions = [(FLASH, flash[:1000]), (FLASH+0x1000, flash[1000:])]
+	matches = FlashIndex(regions, min_match).find(data)
+	end = 0
+	for offset, size, addr in matches:
+		assert offset>=end and size>=min_match
+		assert flash_bytes(regions, addr, size)==data[offset:offset+size]
+		end = offset+size
+	# about half of the data was cut out of the flash contents
+	assert sum(size for offset, size, addr in matches)>=len(data)//4
+
+
+def test_uniform_data_is_left_to_fill():
+	regions = [(FLASH, bytes(64)+b'\x55'*64)]
+	index = FlashIndex(regions, 16)
+	assert index.find(bytes(100))==[]
+	assert index.find(b'\x55'*100)==[]
+	assert index.find(bytes(40)+b'\x55'*40)==[(0, 80, FLASH+24)]
+
+
+def build(rnd):
+	'''ELF whose init data repeats a string table and a const array of .rodata'''
+	table = rnd.randbytes(301)
+	strings = b'Default configuration string for the device, version 1.2.3; '*4
+	rodata = b'\x11'*7+table+b'abc'+strings+rnd.randbytes(100)
+	builder = ELFBuilder(entry=FLASH+1)
+	builder.add_section('.text', FLASH, rnd.randbytes(0x400), flags=SHF.ALLOC | SHF.EXECINSTR)
+	builder.add_section('.rodata', FLASH+0x400, rodata, flags=SHF.ALLOC)
+	ranges = []
+	addr = RAM
+	for name, data in (('.data0', table), ('.data1', elf.make_pattern('text', 500, rnd)+strings+rnd.randbytes(300))):
+		builder.add_section(name, addr, data, flags=SHF.ALLOC | SHF.WRITE)
+		ranges.append((addr, len(data), True))
+		addr = (addr+len(data)+3) & ~3
+	builder.add_section('.bss', addr, size=256, flags=SHF.ALLOC | SHF.WRITE)
+	ranges.append((addr, 256, False))
+	builder.add_init_table((FLASH+0x400+len(rodata)+3) & ~3, ranges, 0x2000)
+	builder.add_segment(['.text', '.rodata', '.idata'], flags=PF.R | PF.X)
+	for name in ('.data0', '.data1', '.bss'):
+		builder.add_segment([name], flags=PF.R | PF.W)
+	return builder.build(), rodata
+
+
+def test_flash_match(tmp_path):
+	data, rodata = build(random.Random(7))
+	manifests = {}
+	for flash_match in (None, 64):
+		path = str(tmp_path/('%s.json' % flash_match))
+		comp.compress_elf(data, 'cortex-m3', comp.CompressOptions(flash_match=flash_match, verify=True, cycles=True, manifest=path))
+		with open(path) as f:
+			manifests[flash_match] = json.load(f)
+	assert manifests[64]['idata']['used']<manifests[None]['idata']['used']
+	found = [entry for entry in manifests[64]['entries'] if entry['flash']]
+	assert [entry['size'] for entry in found]==[301, 240]
+	for entry in found:
+		assert entry['src']>=FLASH+0x400 and entry['src']+entry['size']<=FLASH+0x400+len(rodata)
+	assert not any(entry['flash'] for entry in manifests[None]['entries'])
+
+
+def build_loaded_elsewhere(rnd, vaddr, load):
+	'''.rodata in its own read-only segment, running at vaddr and loaded at load, the init data repeats a table of it'''
+	table = rnd.randbytes(301)
+	rodata = rnd.randbytes(40)+table+rnd.randbytes(20)
+	builder = ELFBuilder(entry=FLASH+1)
+	builder.add_section('.text', FLASH, rnd.randbytes(0x400), flags=SHF.ALLOC | SHF.EXECINSTR)
+	builder.add_section('.rodata', vaddr, rodata, flags=SHF.ALLOC)
+	builder.add_section('.data0', RAM, table, flags=SHF.ALLOC | SHF.WRITE)
+	builder.add_section('.data1', RAM+0x200, elf.make_pattern('text', 0x100, rnd), flags=SHF.ALLOC | SHF.WRITE)
+	builder.add_init_table(FLASH+0x400, [(RAM, len(table), True), (RAM+0x200, 0x100, True)], 0x1000)
+	builder.add_segment(['.text', '.idata'], flags=PF.R | PF.X)
+	builder.add_segment(['.rodata'], paddr=load, flags=PF.R)
+	builder.add_segment(['.data0'], flags=PF.R | PF.W)
+	builder.add_segment(['.data1'], flags=PF.R | PF.W)
+	return builder.build(), table
+
+
+# run from the flash alias at 0, or from a region the copy of the startup code doesn't see
+LOADED_ELSEWHERE = [(0x2000, FLASH+0x2000), (FLASH+0x2000, FLASH+0x12000)]
+
+
+@pytest.mark.parametrize('vaddr, load', LOADED_ELSEWHERE, ids=['alias', 'bank'])
+def test_flash_match_load_address(vaddr, load):
+	'''The flash matches are copied from the load address, --verify and --cycles read them from there'''
+	data, table = build_loaded_elsewhere(random.Random(3), vaddr, load)
+	compressor = comp.ELFCompressor('cortex-m3', comp.CompressOptions(flash_match=64, verify=True, cycles=True))
+	comp.run_compressor(compressor, data)
+	entry = next(entry for entry in compressor.srcdata if entry and entry.flash)
+	assert entry.src==load+40 and entry.call[1][0]==load+40
+	assert entry.cycles is not None
+
+
+def test_flash_match_verify_detects(monkeypatch):
+	'''A flash source off by a byte is caught'''
+	data, table = build_loaded_elsewhere(random.Random(3), *LOADED_ELSEWHERE[1])
+	find_flash_matches = comp.ELFCompressor.find_flash_matches
+	def shifted(self):
+		find_flash_matches(self)
+		for idx in self.flash_src:
+			self.flash_src[idx] += 1
+	monkeypatch.setattr(comp.ELFCompressor, 'find_flash_matches', shifted)
+	with pytest.raises(comp.CompressionError, match='wrongly'):
+		comp.compress_elf(data, 'cortex-m3', comp.CompressOptions(flash_match=64, verify=True))
@@ -0,0 +1,95 @@
+import random
+from itertools import permutations
+
+import pytest
+
+from comp import plan_layout
+
+
+def check(address, blobs, result):
+	'''Every blob at its phase, one after another with the reported padding
+		returns: total padding
+	'''
+	addresses, pads = result
+	placed = sorted(range(len(blobs)), key=lambda idx: addresses[idx])
+	addr = address
+	for idx in placed:
+		size, align, phase = blobs[idx]
+		assert addresses[idx] % align==phase % align
+		assert addresses[idx]==addr+pads[idx]
+		assert 0<=pads[idx]<align
+		addr = addresses[idx]+size
+	return sum(pads)
+
+
+def least_padding(address, blobs):
+	best = None
+	for order in permutations(range(len(blobs))):
+		addr = address
+		total = 0
+		for idx in order:
+			size, align, phase = blobs[idx]
+			pad = (phase-addr) % align
+			total += pad
+			addr += pad+size
+		best = total if best is None else min(best, total)
+	return best
+
+
+def random_blobs(rnd, n):
+	blobs = []
+	for _ in range(n):
+		align = rnd.choice([1, 2, 4, 4, 8])
+		blobs.append((rnd.randrange(1, 40), align, rnd.randrange(align)))
+	return blobs
+
+
+def test_keeps_perfect_order():
+	blobs = [(4, 4, 0), (2, 2, 0), (2, 2, 0), (3, 1, 0)]
+	assert plan_layout(0x1000, blobs)==([0x1000, 0x1004, 0x1006, 0x1008], [0, 0, 0, 0])
+
+
+def test_reorders():
+	# in the given order the word-aligned blob needs 3 bytes of padding
+	blobs = [(1, 1, 0), (4, 4, 0), (3, 1, 0)]
+	addresses, pads = plan_layout(0x1000, blobs)
+	assert sum(pads)==0
+	assert addresses[1] % 4==0
+
+
+def test_phase():
+	# a word copy loop needs the payload at the same word offset as dst
+	addresses, pads = plan_layout(0x1001, [(8, 4, 3), (2, 1, 0)])
+	assert addresses[0] % 4==3
+	assert sum(pads)==0
+
+
+def test_empty():
+	assert plan_layout(0x1000, [])==([], [])
+
+
+@pytest.mark.parametrize('seed', range(30))
+def test_optimal(seed):
+	rnd = random.Random(seed)
+	address = 0x08000000+rnd.randrange(8)
+	blobs = random_blobs(rnd, rnd.randrange(1, 7))
+	assert check(address, blobs, plan_layout(address, blobs))==least_padding(address, blobs)
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_greedy(seed):
+	# too many states for the exact search: the greedy order, never worse than the given one
+	rnd = random.Random(seed)
+	blobs = random_blobs(rnd, 300)
+	given = sum((phase-addr) % align for addr, (size, align, phase) in zip(in_order(0, blobs), blobs))
+	assert check(0, blobs, plan_layout(0, blobs, max_states=0))<=given
+	assert check(0, blobs, plan_layout(0, blobs))<=given
+
+
+def in_order(address, blobs):
+	'''Unpadded start of each blob placed in the given order'''
+	starts = []
+	for size, align, phase in blobs:
+		starts.append(address)
+		address += (phase-address) % align+size
+	return starts
@@ -0,0 +1,43 @@
+import random
+
+import pytest
+
+import compression
+import elf
+
+LZ_FAMILY = {'lz77rle', 'lzhuff', 'delta'}
+
+
+def data_for(algo):
+	rnd = random.Random(6)
+	if algo.name=='delta':
+		return elf.make_pattern('counter', 0x1000, rnd)+elf.make_pattern('text', 0x400, rnd)
+	if algo.name=='pattern':
+		return rnd.randbytes(12)*0x100
+	if algo.name=='sparse':
+		return elf.make_pattern('sparse', 0x1000, rnd)
+	if algo.name in ('zero', 'fill'):
+		return bytes(0x1000)
+	return elf.make_pattern('text', 0x1000, rnd)+elf.make_pattern('counter', 0x400, rnd)
+
+
+@pytest.mark.parametrize('algo_cls', [algo for algo in compression.algos if algo.name not in LZ_FAMILY], ids=lambda algo: algo.name)
+def test_level_ignored(algo_cls):
+	data = data_for(algo_cls)
+	outputs = [algo_cls('cortex-m3', level).compress(data) for level in compression.LEVELS]
+	assert outputs[0] is not None
+	assert all(out==outputs[0] for out in outputs)
+
+
+@pytest.mark.parametrize('algo_cls', [algo for algo in compression.algos if algo.name in LZ_FAMILY], ids=lambda algo: algo.name)
+def test_level_honoured(algo_cls):
+	data = data_for(algo_cls)
+	fast, default, best = (algo_cls('cortex-m3', level).compress(data) for level in compression.LEVELS)
+	assert len(fast)>len(default)>=len(best)
+	for out in (fast, default, best):
+		assert algo_cls('cortex-m3').decompress(out, len(data))[:len(data)]==data
+
+
+def test_unknown_level():
+	with pytest.raises(ValueError):
+		compression.LZ77RLEAlgo('cortex-m3', 'extreme')
@@ -0,0 +1,106 @@
+import random
+
+import pytest
+
+from compression.lzhuff import BitWriter, LZHuffAlgo, MAX_BITS, N_SYMBOLS, canonical, code_lengths, reverse_bits
+from conftest import emulate
+from struct import pack
+
+ARCHS = ('cortex-m0', 'cortex-m3', 'cortex-m7')
+
+
+def fibonacci(n):
+	seq = [1, 1]
+	while len(seq)<n:
+		seq.append(seq[-1]+seq[-2])
+	return seq[:n]
+
+
+def encode_literals(data):
+	'''Payload of data coded as literals only, with the code lengths of its byte counts: the matches
+		compress() finds would flatten the frequencies the long codes come from
+	'''
+	freqs = [0]*N_SYMBOLS
+	for byte in data:
+		freqs[byte] += 1
+	count, symbols, codes = canonical(code_lengths(freqs))
+	bits = BitWriter()
+	for byte in data:
+		code, n = codes[byte]
+		bits.put(reverse_bits(code, n), n)
+	return pack('<%dH' % MAX_BITS, *count)+pack('<%dH' % len(symbols), *symbols)+bits.finish(), count
+
+
+def skewed(n_symbols, seed=1):
+	'''Shuffled data with Fibonacci byte counts, the most skewed distribution for its size'''
+	data = bytearray()
+	for sym, n in enumerate(fibonacci(n_symbols)):
+		data += bytes([sym*7+1])*n
+	random.Random(seed).shuffle(data)
+	return bytes(data)
+
+
+def roundtrip(data, arch='cortex-m3'):
+	algo = LZHuffAlgo(arch)
+	payload = algo.compress(data)
+	assert payload is not None
+	assert algo.decompress(payload, len(data))==data
+	return algo, payload
+
+
+@pytest.mark.parametrize('size', [0, 1, 2])
+def test_short_input(size):
+	# nothing to gain below a match length, the selector falls back to another algo
+	assert LZHuffAlgo('cortex-m3').compress(b'x'*size) is None
+
+
+def test_empty_output():
+	algo, payload = roundtrip(b'hello, hello, hello')
+	assert algo.decompress(payload, 0)==b''
+
+
+def test_single_symbol():
+	# a lone literal gets a one bit code
+	algo, payload = roundtrip(b'aaa')
+	assert payload[:2*MAX_BITS]==pack('<%dH' % MAX_BITS, 1, *[0]*(MAX_BITS-1))
+	roundtrip(b'a'*1000)
+
+
+@pytest.mark.parametrize('n_symbols, flattened', [(16, False), (29, True)])
+def test_code_length_limit(n_symbols, flattened):
+	freqs = fibonacci(n_symbols)+[0]*(N_SYMBOLS-n_symbols)
+	lengths = code_lengths(freqs)
+	assert max(lengths)==MAX_BITS
+	assert sum(2**(MAX_BITS-l) for l in lengths if l)==1<<MAX_BITS # complete prefix code
+	if not flattened:
+		assert sorted(l for l in lengths if l)==sorted([MAX_BITS]+list(range(1, MAX_BITS+1)))
+
+
+@pytest.mark.parametrize('arch', ARCHS)
+def test_max_code_length(arch):
+	data = skewed(16)
+	payload, count = encode_literals(data)
+	assert count[MAX_BITS-1]==2
+	algo = LZHuffAlgo(arch)
+	assert algo.decompress(payload, len(data))==data
+	out, cycles = emulate(algo, payload, len(data))
+	assert out[:len(data)]==data
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_roundtrip(seed):
+	rnd = random.Random(seed)
+	words = [rnd.randbytes(rnd.randrange(1, 12)) for _ in range(40)]
+	data = b''.join(rnd.choice(words) for _ in range(2000))
+	roundtrip(data)
+	roundtrip(rnd.randbytes(3000))
+	roundtrip(skewed(20, seed))
+
+
+@pytest.mark.parametrize('arch', ARCHS)
+def test_decompressor(arch):
+	data = b''.join(random.Random(3).choice([b'GET /', b'index.html ', b'HTTP/1.1\r\n', b'\0\1\2']) for _ in range(600))
+	algo, payload = roundtrip(data, arch)
+	out, cycles = emulate(algo, payload, len(data))
+	assert out[:len(data)]==data
+	assert len(algo.get_decompressor())<256
@@ -0,0 +1,55 @@
+import pstats
+import sys
+import tracemalloc
+
+import comp
+
+
+def run_main(tmp_path, data, *args):
+	infile = tmp_path/'in.elf'
+	infile.write_bytes(data)
+	return comp.main(['cortex-m3', str(infile), str(tmp_path/'out.elf')]+list(args))
+
+
+def test_profile_report(tmp_path, capsys, synthetic_elf):
+	prof = tmp_path/'run.prof'
+	assert run_main(tmp_path, synthetic_elf, '--profile-output', str(prof)) is None
+	report = capsys.readouterr().err
+	for phase in ('parse', 'read_table', 'compress', 'build', 'pack'):
+		assert 'phase.'+phase in report
+	assert 'compress.lz77rle' in report
+	assert 'cProfile data saved to '+str(prof) in report
+	assert 'peak, KiB' not in report
+	stats = pstats.Stats(str(prof))
+	assert any(func[2]=='compress_entries' for func in stats.stats)
+	# the output is the same as without profiling
+	assert (tmp_path/'out.elf').read_bytes()==comp.compress_elf(synthetic_elf, 'cortex-m3')
+
+
+def test_profile_memory(tmp_path, capsys, synthetic_elf):
+	compressor = comp.ELFCompressor('cortex-m3', comp.CompressOptions(profile_memory=True))
+	comp.run_compressor(compressor, synthetic_elf)
+	assert not tracemalloc.is_tracing()
+	peaks = compressor.profiler.peaks
+	assert set(peaks)>={'phase.parse', 'phase.compress', 'phase.build', 'phase.pack'}
+	assert peaks['phase.compress']>0
+	report = capsys.readouterr().err
+	assert 'peak, KiB' in report
+	assert 'phase.compress' in report.split('peak, KiB')[1]
+
+
+def test_profile_disabled(capsys, synthetic_elf):
+	tracing = []
+
+	class Checking(comp.ELFCompressor):
+		def compress_entries(self):
+			tracing.append((tracemalloc.is_tracing(), sys.getprofile()))
+			super().compress_entries()
+
+	compressor = Checking('cortex-m3')
+	assert compressor.profiler is None
+	comp.run_compressor(compressor, synthetic_elf)
+	assert tracing==[(False, None)] # neither tracemalloc nor cProfile running
+	# the ELF accessors are not wrapped into timers
+	assert compressor.binary.read_from_va.__func__ is comp.elf.ELF.read_from_va
+	assert capsys.readouterr().err==''
@@ -0,0 +1,86 @@
+import random
+
+import comp
+import elf
+from elf import ELFBuilder
+from elf.section import SHF, SHT
+from elf.segment import PF, PT
+
+FLASH = 0x08000000
+RAM = 0x20000000
+DATA_LOAD = FLASH+0x800
+RAMFUNC = RAM+0x1000
+RAMFUNC_LOAD = FLASH+0xA00
+
+
+def build():
+	'''.data loaded from flash and listed in the init table, .ramfunc and .ramfunc.rodata loaded from flash
+		by a copy loop of the startup code in one segment
+	'''
+	rnd = random.Random(8)
+	builder = ELFBuilder(entry=FLASH+1)
+	builder.add_section('.text', FLASH, rnd.randbytes(0x200), flags=SHF.ALLOC | SHF.EXECINSTR)
+	builder.add_section('.data', RAM, elf.make_pattern('text', 0x100, rnd), flags=SHF.ALLOC | SHF.WRITE)
+	builder.add_section('.bss', RAM+0x100, size=0x80, flags=SHF.ALLOC | SHF.WRITE)
+	builder.add_section('.ramfunc', RAMFUNC, elf.make_pattern('text', 0x180, rnd), flags=SHF.ALLOC | SHF.WRITE | SHF.EXECINSTR)
+	builder.add_section('.ramfunc.rodata', RAMFUNC+0x180, elf.make_pattern('counter', 0x80, rnd), flags=SHF.ALLOC | SHF.WRITE)
+	builder.add_init_table(FLASH+0x200, [(RAM, 0x100, True), (RAM+0x100, 0x80, False)], 0x600)
+	builder.add_segment(['.text', '.idata'], flags=PF.R | PF.X)
+	builder.add_segment(['.data'], paddr=DATA_LOAD, flags=PF.R | PF.W)
+	builder.add_segment(['.bss'], flags=PF.R | PF.W)
+	builder.add_segment(['.ramfunc', '.ramfunc.rodata'], paddr=RAMFUNC_LOAD, flags=PF.R | PF.W | PF.X)
+	return builder.build()
+
+
+DATA = build()
+
+
+def run(**options):
+	compressor = comp.ELFCompressor('cortex-m3', comp.CompressOptions(verify=True, cycles=True, **options))
+	return compressor, comp.run_compressor(compressor, DATA)
+
+
+def segment_at(binary, vaddr):
+	return next(seg for seg in binary.segments if seg.typ==PT.LOAD and seg.vaddr==vaddr)
+
+
+def table_dsts(compressor, out):
+	binary = elf.ELF(out)
+	table_p = binary.find_symbol('__data_init_table').value
+	image = binary.read_from_va(table_p, compressor.idata.size)
+	dsts = []
+	for entry, (pfn, params) in zip([entry for entry in compressor.srcdata if entry], comp.parse_init_table(image, table_p)):
+		dsts.append(compressor.dm.unpack_params(entry.algo.name, params)[1:])
+	return dsts
+
+
+def test_ram_region_compressed():
+	compressor, out = run(ram_regions=True)
+	assert compressor.ranges==[(RAM, 0x100), (RAM+0x100, 0x80), (RAMFUNC, 0x200)]
+	assert table_dsts(compressor, out)==compressor.ranges
+	binary = elf.ELF(out)
+	for name in ('.ramfunc', '.ramfunc.rodata'):
+		assert binary.find_section_by_name(name).typ==SHT.NOBITS
+	seg = segment_at(binary, RAMFUNC)
+	assert seg.filesz==0 and seg.memsz==0x200 and seg.paddr==RAMFUNC_LOAD
+	# the table covers .data already, compressed once as a table entry
+	assert segment_at(binary, RAM).paddr==DATA_LOAD
+	assert sum(entry.dst==RAM for entry in compressor.srcdata if entry)==1
+
+
+def test_ram_region_flash_image(tmp_path):
+	'''The flash image loses the .ramfunc load image, .idata grows by less'''
+	with_regions = tmp_path/'regions.bin'
+	without = tmp_path/'plain.bin'
+	compressor, out = run(ram_regions=True, bin_output=str(with_regions))
+	plain, plain_out = run(bin_output=str(without))
+	assert len(with_regions.read_bytes())<len(without.read_bytes())
+	assert compressor.manifest()['idata']['used']>plain.manifest()['idata']['used']
+
+
+def test_without_ram_regions():
+	compressor, out = run()
+	assert compressor.ranges==[(RAM, 0x100), (RAM+0x100, 0x80)]
+	binary = elf.ELF(out)
+	assert binary.find_section_by_name('.ramfunc').typ==SHT.PROGBITS
+	assert segment_at(binary, RAMFUNC).filesz==0x200
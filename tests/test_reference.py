@@ -0,0 +1,102 @@
+import pytest
+
+import comp
+import compression
+import elf
+from elf import ELFBuilder
+from elf.section import SHF
+from elf.segment import PF
+from elf.symbol_table import STB, STT
+
+BOOT = 0x1FFF0000 # system memory bootloader, far from the app's flash
+# byte copy loop: memcpy(r0 dst, r1 src, r2 size)
+MEMCPY = bytes.fromhex('002a' '05d0' '0b78' '0370' '0130' '0131' '013a' 'f7e7' '7047')
+LZ77RLE_OFFSET = 0x40
+
+DATA = elf.synthesize(data_size=0x1800, n_sections=6, pattern='mixed', seed=4)
+
+
+def reference(undefined=False):
+	'''Bootloader ELF providing memcpy and the LZ77RLE decompressor, with undefined (shndx 0) symbols of both names
+		instead if undefined is set, as an ELF importing them has
+	'''
+	builder = ELFBuilder(entry=BOOT+1)
+	lz77rle = compression.LZ77RLEAlgo('cortex-m3').get_decompressor()
+	code = MEMCPY+bytes(LZ77RLE_OFFSET-len(MEMCPY))+lz77rle
+	builder.add_section('.text', BOOT, code, flags=SHF.ALLOC | SHF.EXECINSTR)
+	builder.add_segment(['.text'], flags=PF.R | PF.X)
+	section = 0 if undefined else '.text'
+	builder.add_symbol('memcpy', (BOOT+0x400) | 1 if undefined else BOOT | 1, len(MEMCPY), STT.FUNC, STB.GLOBAL, section)
+	builder.add_symbol('__scatterload_lz77rle', (BOOT+LZ77RLE_OFFSET) | 1, len(lz77rle), STT.FUNC, STB.GLOBAL, section)
+	return builder.build()
+
+
+def compressed(*references, **options):
+	compressor = comp.ELFCompressor('cortex-m3', comp.CompressOptions(reference_elfs=references, **options))
+	out = comp.run_compressor(compressor, DATA)
+	return compressor, out
+
+
+def test_builtin_costs_nothing():
+	compressor, out = compressed(reference())
+	dm = compressor.dm
+	for algo in (compression.CopyAlgo, compression.LZ77RLEAlgo):
+		comper = algo('cortex-m3')
+		assert dm.GetDecompressorCost(comper)==0
+		assert dm.find_builtin(comper)[2]=='reference #0'
+	manifest = compressor.manifest()
+	for name in ('copy', 'lz77rle'):
+		decomp = manifest['decompressors'][name]
+		assert decomp['size']==0 and decomp['reference']=='reference #0'
+		for entry in manifest['entries']:
+			if name in entry['candidates'] and entry['candidates'][name]:
+				assert entry['candidates'][name]['decompressor_cost']==0
+	# nothing of the two decompressors is placed into .idata
+	plain = compressed()[0]
+	assert len(plain.dm.decompressors['lz77rle'].image)
+	assert manifest['idata']['used']<plain.manifest()['idata']['used']
+
+
+def test_table_calls_reference():
+	compressor, out = compressed(reference())
+	addresses = {'copy': BOOT | 1, 'lz77rle': (BOOT+LZ77RLE_OFFSET) | 1}
+	used = set()
+	for entry in compressor.srcdata:
+		if entry and entry.algo.name in addresses:
+			assert entry.call[0]==addresses[entry.algo.name]
+			used.add(entry.algo.name)
+	assert used==set(addresses)
+	# the written table, as the startup code reads it
+	binary = elf.ELF(out)
+	table_p = binary.find_symbol('__data_init_table').value
+	idata = binary.read_from_va(table_p, binary.sections[binary.find_symbol('__data_init_table').shndx].size)
+	pfns = {pfn for pfn, params in comp.parse_init_table(idata, table_p)}
+	assert set(addresses.values())<=pfns
+
+
+def test_undefined_symbols_ignored():
+	compressor, out = compressed(reference(undefined=True))
+	for algo in (compression.CopyAlgo, compression.LZ77RLEAlgo):
+		comper = algo('cortex-m3')
+		assert compressor.dm.find_builtin(comper) is None
+	decomp = compressor.dm.decompressors['lz77rle']
+	assert decomp.symbol is None and decomp.image # placed into .idata
+	assert out==compressed()[1]
+	# a later reference defining them is used instead
+	compressor, out = compressed(reference(undefined=True), reference())
+	assert compressor.dm.find_builtin(compression.CopyAlgo('cortex-m3'))[2]=='reference #1'
+
+
+@pytest.mark.parametrize('table_format', ['fixed', 'compact'])
+def test_verified(table_format):
+	# the emulator runs the reference's code at its own addresses as well
+	compressor, out = compressed(reference(), verify=True, cycles=True, table_format=table_format)
+	assert all(entry.cycles is not None for entry in compressor.srcdata if entry and entry.algo.name in ('copy', 'lz77rle'))
+
+
+def test_reference_path(tmp_path):
+	path = tmp_path/'boot.elf'
+	path.write_bytes(reference())
+	compressor, out = compressed(str(path))
+	assert out==compressed(reference())[1]
+	assert compressor.manifest()['decompressors']['copy']['reference']==str(path)
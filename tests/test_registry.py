@@ -0,0 +1,59 @@
+import pytest
+
+import compression
+from compression import registry
+from compression.registry import DecompressorRegistry
+
+
+@pytest.fixture
+def scanned():
+	return DecompressorRegistry.scan()
+
+
+@pytest.fixture
+def fresh_registry(monkeypatch, tmp_path):
+	'''get_registry() rebuilt on the next call, with the pack at a temporary path'''
+	monkeypatch.setattr(registry, '_registry', None)
+	monkeypatch.setattr(registry, 'PACK_FILE', str(tmp_path/'decompressors.pack'))
+	return registry.PACK_FILE
+
+
+def test_scan(scanned):
+	for cls in compression.algos:
+		for arch in ('cortex-m0', 'cortex-m0plus', 'cortex-m3', 'cortex-m4', 'cortex-m7'):
+			variants = scanned.variants(cls.name, arch)
+			assert set(variants)==set(cls.decompressor_variants)
+			for blob in variants.values():
+				assert blob.size and blob.align==cls(arch).get_decompressor_align()
+
+
+def test_pack_roundtrip(scanned, tmp_path):
+	path = str(tmp_path/'d.pack')
+	scanned.save(path)
+	assert DecompressorRegistry.load(path).describe()==scanned.describe()
+
+
+def test_corrupted_pack(scanned, tmp_path):
+	path = tmp_path/'d.pack'
+	scanned.save(str(path))
+	data = bytearray(path.read_bytes())
+	data[-1] ^= 1
+	path.write_bytes(data)
+	with pytest.raises(ValueError):
+		DecompressorRegistry.load(str(path))
+	path.write_bytes(b'XXXX'+bytes(data[4:]))
+	with pytest.raises(ValueError):
+		DecompressorRegistry.load(str(path))
+
+
+def test_without_pack(fresh_registry, scanned):
+	assert registry.get_registry().describe()==scanned.describe()
+
+
+def test_pack_is_used(fresh_registry, scanned, monkeypatch):
+	scanned.save(fresh_registry)
+	# the .bin files are not looked at when there is a pack
+	monkeypatch.setattr(DecompressorRegistry, 'scan', classmethod(lambda cls, root=None: pytest.fail('scanned')))
+	blob = registry.get_registry().get('lz77rle', 'cortex-m3')
+	assert blob.image==scanned.get('lz77rle', 'cortex-m3').image
+	assert registry.get_registry() is registry.get_registry()
@@ -0,0 +1,79 @@
+import re
+
+import pytest
+
+import comp
+import elf
+from compression import registry
+
+PARAMS = dict(data_size=0x3000, n_sections=5, n_symbols=20, pattern='mixed', seed=5)
+
+
+def sized(tmp_path, optimize='size', cache=None):
+	'''Sizing pass on a prelink image with a token .idata
+		returns: (.idata bytes required, fragment contents)
+	'''
+	fragment = tmp_path/'idata_size.ld'
+	options = comp.CompressOptions(size_output=str(fragment), optimize=optimize, cache=cache)
+	required = comp.size_elf(elf.synthesize(idata_size=0x100, **PARAMS), 'cortex-m4', options)
+	return required, fragment.read_text()
+
+
+@pytest.mark.parametrize('optimize', comp.OPTIMIZE_TARGETS)
+def test_exact_size(tmp_path, optimize):
+	required, fragment = sized(tmp_path, optimize)
+	assert int(re.search(r'__idata_size = 0x([0-9A-F]+);', fragment).group(1), 16)==required
+	options = comp.CompressOptions(optimize=optimize, verify=True)
+	comp.compress_elf(elf.synthesize(idata_size=required, **PARAMS), 'cortex-m4', options)
+	if optimize=='size':
+		with pytest.raises(comp.CompressionError):
+			comp.compress_elf(elf.synthesize(idata_size=required-1, **PARAMS), 'cortex-m4', options)
+
+
+def test_size_elf_without_fragment():
+	assert comp.size_elf(elf.synthesize(idata_size=0x100, **PARAMS), 'cortex-m4')>0
+
+
+def test_cache(tmp_path, monkeypatch):
+	cache = str(tmp_path/'results.cache')
+	required, fragment = sized(tmp_path, cache=cache)
+	final = elf.synthesize(idata_size=required, **PARAMS)
+	compressed = []
+	compress_range = comp.ELFCompressor.compress_range
+	def counting(self, comper, dst, size):
+		compressed.append(dst)
+		return compress_range(self, comper, dst, size)
+	monkeypatch.setattr(comp.ELFCompressor, 'compress_range', counting)
+	out = comp.compress_elf(final, 'cortex-m4', comp.CompressOptions(cache=cache))
+	assert not compressed # every range is found in the cache
+	assert out==comp.compress_elf(final, 'cortex-m4')
+	assert compressed
+
+
+def test_changed_range(tmp_path):
+	cache = str(tmp_path/'results.cache')
+	comp.compress_elf(elf.synthesize(**PARAMS), 'cortex-m4', comp.CompressOptions(cache=cache))
+	changed = elf.synthesize(**dict(PARAMS, seed=6))
+	assert comp.compress_elf(changed, 'cortex-m4', comp.CompressOptions(cache=cache))==comp.compress_elf(changed, 'cortex-m4')
+
+
+def test_fingerprint(monkeypatch):
+	fingerprint = comp.ResultsCache.fingerprint()
+	assert fingerprint==comp.ResultsCache.fingerprint()
+	# a rebuilt decompressor invalidates the cache, file times don't matter
+	scanned = registry.DecompressorRegistry.scan()
+	blob = scanned.get('lz77rle', 'cortex-m0')
+	scanned.blobs[('lz77rle', 'cortex-m0', 'size')] = registry.DecompressorBlob(blob.algo, blob.arch, blob.variant, blob.image+b'\0\0', blob.align)
+	monkeypatch.setattr(registry, '_registry', scanned)
+	assert comp.ResultsCache.fingerprint()!=fingerprint
+
+
+def test_stale_cache(tmp_path, monkeypatch):
+	path = str(tmp_path/'results.cache')
+	comp.ResultsCache({'key': {'copy': b'data', 'zero': 0, 'fill': None}}).save(path)
+	assert comp.ResultsCache.load(path).entries=={'key': {'copy': b'data', 'zero': 0, 'fill': None}}
+	monkeypatch.setattr(comp.ResultsCache, 'fingerprint', staticmethod(lambda: 'other'))
+	assert comp.ResultsCache.load(path).entries=={}
+	(tmp_path/'bad.cache').write_bytes(b'junk')
+	assert comp.ResultsCache.load(str(tmp_path/'bad.cache')).entries=={}
+	assert comp.ResultsCache.load(str(tmp_path/'missing.cache')).entries=={}
@@ -0,0 +1,107 @@
+import random
+
+import pytest
+
+import compression
+import elf
+from compression import lz77rle, packbits
+
+SIZE = 0x1400 # several 4 KiB chunks and a partial one
+
+
+def periodic(size, rnd):
+	'''Repeating pattern with a period that is no multiple of 4 and a partial period at the end'''
+	return (rnd.randbytes(12)*(size//12+1))[:size]
+
+
+def samples(rnd):
+	'''Data each algo produces a payload for, with tails cutting elements, words and runs at odd places'''
+	for pattern in ('zero', 'fill', 'text', 'counter', 'sparse', 'random'):
+		yield pattern, elf.make_pattern(pattern, SIZE, rnd)
+	yield 'periodic', periodic(SIZE, rnd)
+	yield 'periodic-tail', periodic(SIZE+7, rnd)
+	yield 'counter-tail', elf.make_pattern('counter', SIZE+3, rnd)
+	# runs of MAX_RLE+1 and more next to literals, the PackBits lookahead must not cut them
+	yield 'runs', b''.join(bytes([rnd.randrange(4)])*rnd.choice((1, 2, 127, 128, 129, 300))+rnd.randbytes(rnd.randrange(3)) for _ in range(60))
+	# zero runs and repeats longer than the LZ77RLE limits
+	yield 'long-runs', b''.join(bytes(rnd.choice((254, 255, 256, 600)))+rnd.randbytes(8)*rnd.randrange(1, 80) for _ in range(20))
+	yield 'short', rnd.randbytes(5)
+	yield 'empty', b''
+
+
+def chunks(data, spec, rnd):
+	if spec=='random':
+		pos = 0
+		while pos<len(data):
+			size = rnd.randrange(1, 700)
+			yield data[pos:pos+size]
+			pos += size
+		return
+	for pos in range(0, len(data), spec):
+		yield data[pos:pos+spec]
+
+
+def streamed(algo, data, spec, seed=0):
+	stream = algo.compressor()
+	out = bytearray()
+	for chunk in chunks(data, spec, random.Random(seed)):
+		out += stream.feed(chunk)
+	tail = stream.flush()
+	if tail is None or isinstance(tail, int):
+		return tail
+	return bytes(out+tail)
+
+
+SAMPLES = list(samples(random.Random(9)))
+
+
+@pytest.mark.parametrize('spec', [1, 3, 4096, 'random'])
+@pytest.mark.parametrize('algo_cls', compression.algos, ids=lambda algo: algo.name)
+@pytest.mark.parametrize('name, data', SAMPLES, ids=[name for name, data in SAMPLES])
+def test_stream_equals_compress(algo_cls, name, data, spec):
+	algo = algo_cls('cortex-m3')
+	assert streamed(algo, data, spec)==algo.compress(data)
+
+
+@pytest.mark.parametrize('spec', [1, 3, 4096, 'random'])
+@pytest.mark.parametrize('level', compression.LEVELS)
+@pytest.mark.parametrize('algo_cls', [compression.LZ77RLEAlgo, compression.DeltaAlgo, compression.LZHuffAlgo], ids=lambda algo: algo.name)
+def test_stream_levels(algo_cls, level, spec):
+	rnd = random.Random(4)
+	data = elf.make_pattern('text', SIZE, rnd)+elf.make_pattern('counter', SIZE, rnd)
+	algo = algo_cls('cortex-m3', level)
+	assert streamed(algo, data, spec)==algo.compress(data)
+
+
+@pytest.mark.parametrize('spec', [1, 3, 'random'])
+@pytest.mark.parametrize('algo_cls', [compression.LZ77RLEAlgo, compression.DeltaAlgo], ids=lambda algo: algo.name)
+def test_stream_trimming(monkeypatch, algo_cls, spec):
+	'''The LZ77RLE stream drops consumed input once TRIM_THRESHOLD bytes are behind the window,
+		a small threshold trims many times on every chunk boundary
+	'''
+	monkeypatch.setattr(lz77rle, 'TRIM_THRESHOLD', 300)
+	rnd = random.Random(11)
+	kinds = ('zero', 'counter') if algo_cls is compression.DeltaAlgo else ('zero', 'text', 'counter', 'random')
+	data = b''.join(elf.make_pattern(rnd.choice(kinds), rnd.randrange(1, 900)*4, rnd) for _ in range(12))
+	algo = algo_cls('cortex-m3')
+	out = streamed(algo, data, spec, seed=3)
+	monkeypatch.setattr(lz77rle, 'TRIM_THRESHOLD', 1<<30)
+	assert out==algo.compress(data)
+	assert algo.decompress(out, len(data))[:len(data)]==data
+
+
+def test_stream_trimming_full_size():
+	rnd = random.Random(12)
+	data = elf.make_pattern('text', lz77rle.TRIM_THRESHOLD*2+1000, rnd)
+	algo = compression.LZ77RLEAlgo('cortex-m3')
+	out = streamed(algo, data, 'random')
+	assert out==algo.compress(data)
+
+
+def test_packbits_lookahead():
+	# a run crossing the chunk border exactly at the lookahead limit
+	data = b'\x01\x02'+b'\x07'*(packbits.MAX_RLE+5)+b'\x03'
+	algo = compression.PackBitsAlgo('cortex-m3')
+	for split in range(len(data)+1):
+		stream = algo.compressor()
+		assert stream.feed(data[:split])+stream.feed(data[split:])+stream.flush()==algo.compress(data)
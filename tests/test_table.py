@@ -0,0 +1,109 @@
+import json
+import random
+from struct import pack
+
+import pytest
+
+import comp
+import elf
+from comp import CompressedData, DecompressorInstance, DecompressorManager, parse_init_table, unzigzag, varint, zigzag
+from compression import CopyAlgo, FillAlgo, LZ77RLEAlgo, ZeroAlgo
+
+TABLE = 0x08000400
+
+
+@pytest.mark.parametrize('value, encoded', [
+	(0, b'\x00'),
+	(0x7F, b'\x7F'),
+	(0x80, b'\x80\x01'),
+	(0x3FFF, b'\xFF\x7F'),
+	(0xFFFFFFFF, b'\xFF\xFF\xFF\xFF\x0F'),
+])
+def test_varint(value, encoded):
+	assert varint(value)==encoded
+
+
+@pytest.mark.parametrize('delta', [0, 1, -1, 2, -2, 0x7FFFFFFF, -0x80000000, 0x12345, -0x12345])
+def test_zigzag(delta):
+	assert unzigzag(zigzag(delta))==delta
+	assert zigzag(delta)<0x100000000
+
+
+def test_zigzag_order():
+	assert [zigzag(delta) for delta in (0, -1, 1, -2, 2)]==[0, 1, 2, 3, 4]
+	# deltas wrap around like the 32-bit additions of the startup code
+	assert zigzag(0xFFFFFFFF)==zigzag(-1)
+
+
+def manager():
+	'''Decompressors with every param order the compact format can express'''
+	dm = DecompressorManager(None)
+	dm.decompressors = {
+		'lz77rle': DecompressorInstance(address=0x08000101),
+		'copy': DecompressorInstance(address=0x08000201, pack_params=CopyAlgo.decompressor_aliases['memcpy'], symbol='memcpy'),
+		'zero': DecompressorInstance(address=0x08000301, pack_params=ZeroAlgo.decompressor_aliases['__aeabi_memclr'], symbol='__aeabi_memclr'),
+		'fill': DecompressorInstance(address=0x08000401, pack_params=FillAlgo.decompressor_aliases['memset'], symbol='memset'),
+	}
+	return dm
+
+
+def random_entries(rnd, n):
+	algos = {'lz77rle': LZ77RLEAlgo('cortex-m3'), 'copy': CopyAlgo('cortex-m3'), 'zero': ZeroAlgo('cortex-m3'), 'fill': FillAlgo('cortex-m3')}
+	entries = []
+	address = TABLE+0x100
+	for _ in range(n):
+		name = rnd.choice(list(algos))
+		size = rnd.choice([1, 4, 0x7F, 0x80, 0x4000, rnd.randrange(1, 0x100000)])
+		dst = rnd.choice([0x20000000, 0x2000FFFC, 0x10000000])+rnd.randrange(0x1000)*4
+		if name=='zero':
+			src = 0
+		elif name=='fill':
+			src = rnd.randrange(256)
+		elif rnd.random()<0.2:
+			src = 0x08010000+rnd.randrange(0x1000) # found in flash
+		else:
+			src = b'payload'
+		entry = CompressedData(algos[name], src, dst, size)
+		if not isinstance(src, int):
+			entry.address = address
+			address += rnd.randrange(1, 0x400)
+		entries.append(entry)
+	return entries
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_compact_roundtrip(seed):
+	'''The startup code gets the same calls from either format'''
+	dm = manager()
+	entries = random_entries(random.Random(seed), random.Random(seed).randrange(1, 40))
+	compact = dm.make_compact_table(entries, TABLE)
+	assert len(compact) % 4==0
+	assert parse_init_table(compact, TABLE)==parse_init_table(dm.make_table(entries), TABLE)
+
+
+def test_compact_is_smaller():
+	dm = manager()
+	entries = random_entries(random.Random(1), 30)
+	assert len(dm.make_compact_table(entries, TABLE))<len(dm.make_table(entries))
+
+
+def test_param_order():
+	dm = manager()
+	assert dm.param_order('lz77rle')==[0, 1, 2]
+	assert dm.param_order('copy')==[1, 0, 2]
+	assert dm.param_order('zero')==[1, 2, 3]
+	# params a table slot can't hold as is
+	dm.decompressors['lz77rle'].pack_params = lambda src, dst, size: pack('<III', src, dst, size>>2)
+	assert dm.param_order('lz77rle') is None
+	with pytest.raises(comp.CompressionError):
+		dm.make_compact_table(random_entries(random.Random(1), 30), TABLE)
+
+
+@pytest.mark.parametrize('table_format', comp.TABLE_FORMATS)
+def test_pipeline(table_format, tmp_path):
+	data = elf.synthesize(data_size=0x800, n_sections=30, pattern='mixed', seed=4)
+	manifest = str(tmp_path/'m.json')
+	comp.compress_elf(data, 'cortex-m0plus', comp.CompressOptions(table_format=table_format, verify=True, cycles=True, manifest=manifest))
+	with open(manifest) as f:
+		# one format per table, there is no deferred one here
+		assert json.load(f)['table_format']==[('compact' if table_format=='auto' else table_format)]
@@ -0,0 +1,108 @@
+import json
+import random
+
+import pytest
+
+import comp
+import elf
+from test_flash_match import build as flash_match_elf
+
+ARCHS = ['cortex-m0', 'cortex-m3', 'cortex-m7']
+
+
+def test_same_as_single_target(synthetic_elf):
+	outputs = comp.compress_elf_targets(synthetic_elf, ARCHS, comp.CompressOptions(verify=True))
+	assert list(outputs)==ARCHS
+	for arch in ARCHS:
+		assert outputs[arch]==comp.compress_elf(synthetic_elf, arch)
+
+
+def test_output_names(synthetic_elf, tmp_path):
+	manifest = str(tmp_path/'m_{arch}.json')
+	comp.compress_elf_targets(synthetic_elf, ARCHS[:2], comp.CompressOptions(manifest=manifest))
+	for arch in ARCHS[:2]:
+		with open(manifest.replace('{arch}', arch)) as f:
+			assert json.load(f)
+
+
+@pytest.mark.parametrize('archs, options', [
+	([], {}),
+	(['cortex-m3', 'cortex-m3'], {}),
+	(ARCHS, {'manifest': 'm.json'}),
+], ids=['none', 'duplicate', 'shared-output'])
+def test_errors(synthetic_elf, archs, options):
+	with pytest.raises(comp.CompressionError):
+		comp.compress_elf_targets(synthetic_elf, archs, comp.CompressOptions(**options))
+
+
+class Recording(comp.ELFCompressor):
+	'''Keeps the compressors of a compress_elf_targets() run and the ranges each one compressed'''
+	runs = []
+
+	def __init__(self, arch, options=None):
+		super().__init__(arch, options)
+		self.compressed = []
+		Recording.runs.append(self)
+
+	def compress_range(self, comper, dst, size):
+		self.compressed.append((comper.name, dst, size))
+		return super().compress_range(comper, dst, size)
+
+
+@pytest.fixture
+def recording(monkeypatch):
+	Recording.runs = []
+	monkeypatch.setattr(comp, 'ELFCompressor', Recording)
+	return Recording.runs
+
+
+def test_decompressor_changes(synthetic_elf, recording):
+	# same decompressor builds on M0 and M0+, some differ on M7
+	comp.compress_elf_targets(synthetic_elf, ['cortex-m0', 'cortex-m0plus', 'cortex-m3', 'cortex-m7'])
+	m0, m0plus, m3, m7 = recording
+	assert m0.kept==0
+	assert m0plus.kept==m0plus.out_n_entries
+	assert m7.kept<m7.out_n_entries
+	for run in recording[1:]:
+		assert not run.compressed
+
+
+@pytest.mark.parametrize('options', [
+	{'coalesce': 64},
+	{'flash_match': 16},
+	{'coalesce': 64, 'flash_match': 16, 'optimize': 'speed'},
+	{'table_format': 'compact'},
+], ids=['coalesce', 'flash-match', 'all', 'compact'])
+def test_planning_shared(recording, options, monkeypatch):
+	if 'flash_match' in options:
+		data = flash_match_elf(random.Random(7))[0]
+	else:
+		data = elf.synthesize(data_size=0x1800, n_sections=12, pattern='mixed', seed=11)
+	indexed = []
+	flash_index = comp.FlashIndex.__init__
+	def counting(self, regions, min_match):
+		indexed.append(min_match)
+		flash_index(self, regions, min_match)
+	monkeypatch.setattr(comp.FlashIndex, '__init__', counting)
+	# M3 and M4 share the decompressor builds, as do M0 and M0+
+	archs = ['cortex-m3', 'cortex-m4', 'cortex-m0', 'cortex-m0plus', 'cortex-m7']
+	outputs = comp.compress_elf_targets(data, archs, comp.CompressOptions(verify=True, **options))
+	# the estimates and flash matches of the first target are reused, nothing is compressed again
+	for run in recording[1:]:
+		assert not run.compressed
+	assert recording[1].kept==recording[1].out_n_entries and recording[3].kept==recording[3].out_n_entries
+	if 'coalesce' in options:
+		assert all(len(run.ranges)==len(recording[0].ranges)<13 for run in recording) # 12 data sections and .bss merged
+	if 'flash_match' in options:
+		assert len(indexed)==1
+		assert all(run.flash_src for run in recording)
+	else:
+		assert not indexed
+	recording.clear()
+	for arch in archs:
+		assert outputs[arch]==comp.compress_elf(data, arch, comp.CompressOptions(**options))
+
+
+def test_time_budget_reselects(synthetic_elf, recording):
+	comp.compress_elf_targets(synthetic_elf, ARCHS, comp.CompressOptions(time_budget=10))
+	assert all(run.kept==0 for run in recording)
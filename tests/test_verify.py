@@ -0,0 +1,169 @@
+import random
+from struct import error as StructError, pack
+from time import perf_counter
+
+import pytest
+
+import comp
+import compression
+import elf
+
+
+class Corrupting(comp.ELFCompressor):
+	'''Damages the written .idata before the verification: corrupt(compressor) returns (address, bytes) to write or None'''
+	corrupt = None
+
+	def build_image(self):
+		super().build_image()
+		if self.sizing:
+			return
+		patch = self.corrupt()
+		if patch:
+			self.binary.write_to_va(*patch)
+
+
+def compress(data, corrupt=None, **options):
+	compressor = Corrupting('cortex-m3', comp.CompressOptions(verify=True, **options))
+	compressor.corrupt = corrupt.__get__(compressor) if corrupt else lambda: None
+	return comp.run_compressor(compressor, data)
+
+
+def flip_payload(self):
+	entries = [entry for entry in self.srcdata if entry and entry.address is not None and len(entry.src)>2]
+	entry = random.Random(entry_count(self)).choice(entries)
+	pos = len(entry.src)//2
+	return entry.address+pos, bytes([entry.src[pos] ^ 0x41])
+
+
+def entry_count(self):
+	return sum(bool(entry) for entry in self.srcdata)
+
+
+def table_word(offset):
+	'''Flip a bit of a word of the first fixed table entry: 0-8 the params (src, dst, size here), 12 pfn'''
+	def corrupt(self):
+		word = self.binary.read_from_va(self.table_p+4+offset, 4)
+		return self.table_p+4+offset, bytes([word[0] ^ 4])+word[1:]
+	return corrupt
+
+
+@pytest.mark.parametrize('table_format', ['fixed', 'compact'])
+@pytest.mark.parametrize('pattern', ['text', 'counter', 'sparse', 'mixed'])
+def test_verified(pattern, table_format):
+	data = elf.synthesize(data_size=0xC00, n_sections=5, pattern=pattern, seed=2)
+	assert compress(data, table_format=table_format)==comp.compress_elf(data, 'cortex-m3', comp.CompressOptions(table_format=table_format))
+
+
+@pytest.mark.parametrize('table_format', ['fixed', 'compact'])
+@pytest.mark.parametrize('seed', range(4))
+def test_corrupted_payload(seed, table_format):
+	data = elf.synthesize(data_size=0xC00, n_sections=5, pattern='mixed', seed=seed)
+	with pytest.raises(comp.CompressionError):
+		compress(data, flip_payload, table_format=table_format)
+
+
+@pytest.mark.parametrize('offset, message', [(4, 'wrongly|outside'), (8, 'wrongly|outside'), (12, 'calls')], ids=['dst', 'size', 'pfn'])
+def test_corrupted_table(offset, message):
+	data = elf.synthesize(data_size=0xC00, n_sections=5, pattern='mixed', seed=1)
+	with pytest.raises(comp.CompressionError, match=message):
+		compress(data, table_word(offset))
+
+
+@pytest.mark.parametrize('pattern', elf.PATTERNS)
+def test_empty_ranges(pattern):
+	data = elf.synthesize(data_size=3, n_sections=5, pattern=pattern)
+	compress(data, cycles=True, table_format='auto')
+
+
+def samples():
+	rnd = random.Random(5)
+	yield b''
+	yield b'\x00'
+	yield bytes(100)
+	yield b'\x77'*99
+	yield b'\x12\x34\x56\x78'*33+b'\x12'
+	yield rnd.randbytes(777)
+	yield b''.join(rnd.choice([b'alpha ', b'beta ', bytes(9)]) for _ in range(300))
+	yield b''.join((i*i).to_bytes(4, 'little') for i in range(300))
+	yield b''.join(rnd.choice([bytes(4), rnd.randbytes(4)]) for _ in range(300))
+
+
+@pytest.mark.parametrize('level', compression.LEVELS)
+@pytest.mark.parametrize('cls', compression.algos, ids=lambda cls: cls.name)
+def test_reference_decoder(cls, level):
+	algo = cls('cortex-m3', level)
+	for data in samples():
+		payload = algo.compress(data)
+		if payload is None:
+			continue
+		# the decoders may read past the payload end (zeroes after it here) and write past size
+		out = algo.decompress(payload if isinstance(payload, int) else payload+bytes(8), len(data))
+		assert out[:len(data)]==data
+
+
+def test_fill_empty():
+	algo = compression.FillAlgo('cortex-m3')
+	assert algo.compress(b'')==b''
+	assert algo.decompress(b'', 0)==b''
+	assert algo.decompress(0x1FF, 3)==b'\xFF'*3
+	with pytest.raises(ValueError):
+		algo.decompress(b'\x01', 4)
+
+
+@pytest.mark.parametrize('name, payload', [
+	('pattern', b'\0\0\0\0'),
+	('pattern', b'\2\0\0\0abcd'),
+	('lzhuff', b'\xFF'*40),
+	('lzhuff', pack('<16H', 1, *[0]*14, 0x41)+b'\xFF'), # a lone 1 bit code 0, the stream has 1s
+	('lz77rle', b'\x17ab'), # 6 literals, 2 of them left
+])
+def test_malformed_payload(name, payload):
+	algo = [cls for cls in compression.algos if cls.name==name][0]('cortex-m3')
+	with pytest.raises((ValueError, IndexError, StructError)):
+		algo.decompress(payload, 100)
+
+
+class Timed(comp.ELFCompressor):
+	'''Keeps the best time of a few verify_image() calls, one call takes about as long as the scheduling noise'''
+	def verify_image(self):
+		times = []
+		for _ in range(3):
+			self.decoded = {} # or the later calls find every payload verified
+			start = perf_counter()
+			super().verify_image()
+			times.append(perf_counter()-start)
+		self.verify_time = min(times)
+
+
+@pytest.mark.parametrize('level', compression.LEVELS)
+def test_verify_budget(level):
+	'''--verify stays below 5% of the compression time on text, the most tokens per byte for the LZ decoders'''
+	data = elf.synthesize(data_size=0x8000, n_sections=8, pattern='text', seed=1)
+	compressor = Timed('cortex-m3', comp.CompressOptions(level=level, verify=True))
+	comp.run_compressor(compressor, data)
+	assert compressor.verify_time<0.05*compressor.timings['compress']
+
+
+def test_verified_once(monkeypatch):
+	'''The targets after the first one decode only the payloads it didn't have'''
+	decoded = []
+	for cls in compression.algos:
+		def counting(self, src, size, decompress=cls.decompress):
+			decoded.append(self.name)
+			return decompress(self, src, size)
+		monkeypatch.setattr(cls, 'decompress', counting)
+	data = elf.synthesize(data_size=0x2000, n_sections=6, pattern='text', seed=3)
+	runs = []
+	def run_compressor(compressor, data, run=comp.run_compressor):
+		del decoded[:]
+		out = run(compressor, data)
+		payloads = sum(isinstance(entry.src, bytes) for entry in compressor.srcdata if entry)
+		runs.append((len(decoded), payloads, compressor.out_n_entries))
+		return out
+	monkeypatch.setattr(comp, 'run_compressor', run_compressor)
+	# M0 and M0+ share the decompressor builds, the choices and payloads are kept
+	outputs = comp.compress_elf_targets(data, ['cortex-m0', 'cortex-m0plus'], comp.CompressOptions(verify=True))
+	(first, payloads, entries), (second, _, _) = runs
+	assert payloads and first==entries
+	assert second==entries-payloads # only the fill values and such, without a payload
+	assert outputs['cortex-m0plus']==comp.compress_elf(data, 'cortex-m0plus')